@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import atexit
+import fnmatch
+import json
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from _lib_config import ConfigError, load_env_config, repo_root
+from _lib_lock import FileLock, LockTimeout
+from _lib_output import write_json
+
+
+@dataclass(frozen=True)
+class ArtifactKind:
+    """
+    One kind of cached artifact. Files matching `patterns` (fnmatch against the path
+    relative to <base>/<env>; `*` also crosses directories) form a single artifact that
+    is evicted as a unit, or one artifact per file when `per_file` is set. `lock` is the
+    FileLock key its writer holds (see cache_refresh.py).
+    """
+
+    name: str
+    base: str  # "cache" | "work"
+    patterns: Tuple[str, ...]
+    evictable: bool
+    per_file: bool = False
+    lock: str = ""
+
+
+# First match wins. Work files are source data (reference snapshots are pruned with
+# reference_snapshots.py, not here), so only cache/<env> artifacts are ever evicted.
+REGISTRY: Tuple[ArtifactKind, ...] = (
+    ArtifactKind("mcp_session", "cache", ("mcp/initialize.json",), True, lock="mcp_tools"),
+    ArtifactKind("mcp_tools", "cache", ("mcp/tools_list.json", "mcp/tools_index.bin", "mcp/meta.json"), True, lock="mcp_tools"),
+    ArtifactKind("mcp_prompts", "cache", ("mcp/prompts_list.json", "mcp/prompts_meta.json"), True, lock="mcp_prompts"),
+    ArtifactKind("mcp_metrics", "cache", ("mcp/metrics.json",), False),
+    ArtifactKind("cursor", "cache", ("cursor/index.json", "cursor/bundle.md"), True, lock="cursor"),
+    ArtifactKind("search_index", "cache", ("search/*",), True, lock="search"),
+    ArtifactKind("hash_index", "cache", ("items/param_hash_index.sqlite*",), True, lock="hash_index"),
+    ArtifactKind("query_results", "cache", ("queries/*",), True, per_file=True, lock="query_results"),
+    ArtifactKind("other_cache", "cache", ("*",), False, per_file=True),
+    ArtifactKind("reference_data", "work", ("reference/*",), False, per_file=True),
+    ArtifactKind("reference_snapshots", "work", ("snapshots/*",), False),
+    ArtifactKind("other_work", "work", ("*",), False),
+)
+
+
+def cache_root_for(env: str) -> Path:
+    return repo_root() / "cache" / env
+
+
+def usage_path(cache_root: Path) -> Path:
+    return cache_root / ".usage.json"
+
+
+def _load_usage(cache_root: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        obj = json.loads(usage_path(cache_root).read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return obj if isinstance(obj, dict) else {}
+
+
+def artifact_id(kind: str, rel: str = "") -> str:
+    return f"{kind}:{rel}" if rel else kind
+
+
+# Usage is buffered per process and merged into .usage.json at most this often (and at exit):
+# LRU only needs coarse recency, and hot read paths must not take a lock + fsync per read.
+USAGE_FLUSH_INTERVAL_S = 60.0
+
+_usage_lock = threading.Lock()
+_usage_pending: Dict[Path, Dict[str, Dict[str, int]]] = {}
+_usage_flushed_at: Dict[Path, float] = {}
+
+
+def record_use(cache_root: Path, kind: str, path: Optional[Path] = None) -> None:
+    """
+    Note a read of an artifact (hit count + last use) for cache/<env>/.usage.json; this is
+    what LRU eviction orders by. Buffered (see USAGE_FLUSH_INTERVAL_S). Best effort: a busy
+    lock or I/O error never fails the reader.
+    """
+    try:
+        rel = Path(path).resolve().relative_to(cache_root.resolve()).as_posix() if path is not None else ""
+        aid = artifact_id(kind, rel)
+        now = time.time()
+        with _usage_lock:
+            u = _usage_pending.setdefault(cache_root, {}).setdefault(aid, {"hits": 0, "last_used": 0})
+            u["hits"] += 1
+            u["last_used"] = int(now)
+            due = now - _usage_flushed_at.get(cache_root, 0.0) >= USAGE_FLUSH_INTERVAL_S
+        if due:
+            flush_usage(cache_root)
+    except Exception:
+        pass
+
+
+def flush_usage(cache_root: Optional[Path] = None) -> None:
+    """Merge buffered record_use counts into .usage.json (all cache roots when None)."""
+    with _usage_lock:
+        roots = [cache_root] if cache_root is not None else list(_usage_pending)
+        batches = {r: _usage_pending.pop(r, None) for r in roots}
+        for r in roots:
+            _usage_flushed_at[r] = time.time()
+    for root, pending in batches.items():
+        if not pending:
+            continue
+        try:
+            with FileLock.for_key(root, "usage", timeout=2):
+                usage = _load_usage(root)
+                for aid, p in pending.items():
+                    u = usage.get(aid) if isinstance(usage.get(aid), dict) else {}
+                    usage[aid] = {"hits": int(u.get("hits") or 0) + p["hits"], "last_used": max(int(u.get("last_used") or 0), p["last_used"])}
+                write_json(usage_path(root), usage, indent=None)
+        except Exception:
+            # Keep the counts for the next attempt rather than losing them.
+            with _usage_lock:
+                cur = _usage_pending.setdefault(root, {})
+                for aid, p in pending.items():
+                    u = cur.setdefault(aid, {"hits": 0, "last_used": 0})
+                    u["hits"] += p["hits"]
+                    u["last_used"] = max(u["last_used"], p["last_used"])
+
+
+atexit.register(flush_usage)
+
+
+def budget_bytes(env: str) -> Optional[int]:
+    """`cache_budget_mb` from config/environments/<env>.yaml (None when unset or 0)."""
+    raw = load_env_config(env).cache_budget_mb
+    if not raw:
+        return None
+    try:
+        mb = float(raw)
+    except ValueError:
+        raise ConfigError(f"cache_budget_mb 必须是数字（MB）：{raw!r}")
+    return int(mb * 1024 * 1024) if mb > 0 else None
+
+
+def _visible_files(root: Path) -> List[Path]:
+    if not root.exists():
+        return []
+    out = []
+    for p in root.rglob("*"):
+        rel = p.relative_to(root).as_posix()
+        # Locks, usage data and in-flight temp files are bookkeeping, not artifacts.
+        if p.is_file() and not any(part.startswith(".") for part in rel.split("/")) and rel != "README.md":
+            out.append(p)
+    return out
+
+
+class CacheManager:
+    """Registry view over cache/<env> and work/<env>: sizes, ages, usage, LRU eviction."""
+
+    def __init__(self, env: str, cache_root: Optional[Path] = None, work_root: Optional[Path] = None):
+        self.env = env
+        self.cache_root = cache_root or cache_root_for(env)
+        self.work_root = work_root or repo_root() / "work" / env
+
+    def _root(self, base: str) -> Path:
+        return self.cache_root if base == "cache" else self.work_root
+
+    def scan(self) -> List[Dict[str, Any]]:
+        """One entry per artifact: {id, kind, base, files, bytes, mtime, age_seconds, hits, last_used, evictable}."""
+        flush_usage(self.cache_root)
+        usage = _load_usage(self.cache_root)
+        now = time.time()
+        groups: Dict[str, Dict[str, Any]] = {}
+        for base in ("cache", "work"):
+            root = self._root(base)
+            for p in _visible_files(root):
+                rel = p.relative_to(root).as_posix()
+                kind = next((k for k in REGISTRY if k.base == base and any(fnmatch.fnmatchcase(rel, pat) for pat in k.patterns)), None)
+                if kind is None:
+                    continue
+                aid = artifact_id(kind.name, rel if kind.per_file else "")
+                if base == "work":
+                    aid = f"work/{aid}"
+                st = p.stat()
+                g = groups.setdefault(
+                    aid,
+                    {"id": aid, "kind": kind.name, "base": base, "paths": [], "files": 0, "bytes": 0, "mtime": 0, "evictable": kind.evictable, "lock": kind.lock},
+                )
+                g["paths"].append(p)
+                g["files"] += 1
+                g["bytes"] += st.st_size
+                g["mtime"] = max(g["mtime"], int(st.st_mtime))
+        out = []
+        for g in groups.values():
+            u = usage.get(g["id"]) if isinstance(usage.get(g["id"]), dict) else {}
+            g["hits"] = int(u.get("hits") or 0)
+            # A freshly (re)written artifact counts as used: refreshes must not be evicted first.
+            g["last_used"] = max(int(u.get("last_used") or 0), g["mtime"])
+            g["age_seconds"] = int(now - g["mtime"])
+            out.append(g)
+        out.sort(key=lambda g: -g["bytes"])
+        return out
+
+    def summary(self, artifacts: List[Dict[str, Any]], budget: Optional[int], top: int = 10) -> Dict[str, Any]:
+        by_kind: Dict[str, Dict[str, int]] = {}
+        for a in artifacts:
+            k = by_kind.setdefault(a["kind"], {"artifacts": 0, "files": 0, "bytes": 0, "hits": 0})
+            k["artifacts"] += 1
+            k["files"] += a["files"]
+            k["bytes"] += a["bytes"]
+            k["hits"] += a["hits"]
+        cache_bytes = sum(a["bytes"] for a in artifacts if a["base"] == "cache")
+        totals = {
+            "artifacts": len(artifacts),
+            "files": sum(a["files"] for a in artifacts),
+            "bytes": sum(a["bytes"] for a in artifacts),
+            "cache_bytes": cache_bytes,
+            "work_bytes": sum(a["bytes"] for a in artifacts if a["base"] == "work"),
+            "evictable_bytes": sum(a["bytes"] for a in artifacts if a["evictable"]),
+            "budget_bytes": budget,
+            "over_budget": bool(budget is not None and cache_bytes > budget),
+        }
+        keys = ("id", "kind", "files", "bytes", "age_seconds", "hits", "last_used", "evictable")
+        return {
+            "totals": totals,
+            "by_kind": dict(sorted(by_kind.items(), key=lambda kv: -kv[1]["bytes"])),
+            "top": [{k: a[k] for k in keys} for a in artifacts[: max(0, top)]],
+        }
+
+    def evict(self, budget: int, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Bring cache/<env> under `budget` bytes by deleting evictable artifacts, least
+        recently used first. An artifact whose writer currently holds its lock is skipped.
+        """
+        artifacts = self.scan()
+        used = sum(a["bytes"] for a in artifacts if a["base"] == "cache")
+        evicted: List[Dict[str, Any]] = []
+        skipped: List[str] = []
+        usage_drop: List[str] = []
+        for a in sorted((a for a in artifacts if a["evictable"]), key=lambda a: (a["last_used"], a["id"])):
+            if used <= budget:
+                break
+            if not dry_run:
+                try:
+                    with FileLock.for_key(self.cache_root, a["lock"] or a["kind"], timeout=0):
+                        for p in a["paths"]:
+                            p.unlink(missing_ok=True)
+                except LockTimeout:
+                    skipped.append(a["id"])
+                    continue
+                usage_drop.append(a["id"])
+            used -= a["bytes"]
+            evicted.append({"id": a["id"], "bytes": a["bytes"], "last_used": a["last_used"]})
+        if usage_drop:
+            try:
+                with FileLock.for_key(self.cache_root, "usage", timeout=2):
+                    usage = _load_usage(self.cache_root)
+                    for aid in usage_drop:
+                        usage.pop(aid, None)
+                    write_json(usage_path(self.cache_root), usage, indent=None)
+            except LockTimeout:
+                pass
+        return {
+            "budget_bytes": budget,
+            "dry_run": dry_run,
+            "evicted": evicted,
+            "freed_bytes": sum(e["bytes"] for e in evicted),
+            "skipped_locked": skipped,
+            "cache_bytes_after": used,
+            "over_budget_after": used > budget,
+        }
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+# Placeholder for "this row had no such field" (a column added by a later row); such
+# cells are skipped when dicts are rebuilt, so rows round-trip exactly.
+_MISSING: Any = object()
+
+# Per-column string interning switches itself off once a column is mostly unique
+# (e.g. `name`, hashes): past INTERN_SAMPLE distinct values, more than INTERN_MAX_RATIO
+# distinct per row means the pool would cost more than it saves.
+INTERN_SAMPLE = 1024
+INTERN_MAX_RATIO = 0.5
+INTERN_MAX_LEN = 128
+
+
+class ColumnTable:
+    """
+    Column-oriented rows: field names stored once, one list per column, repeated
+    strings (item_group, stock_uom, ...) shared through per-column intern pools.
+
+    Rows go in as dicts and come out as dicts built on demand (iteration yields one
+    fresh dict at a time), so writers and `json.dumps` work unchanged while only the
+    columns stay resident.
+    """
+
+    __slots__ = ("fields", "columns", "_pos", "_pools", "_n")
+
+    def __init__(self, fields: Sequence[str] = ()):
+        self.fields: List[str] = []
+        self.columns: List[List[Any]] = []
+        self._pos: Dict[str, int] = {}
+        self._pools: List[Optional[Dict[str, str]]] = []
+        self._n = 0
+        for f in fields:
+            self._add_field(f)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict[str, Any]], fields: Sequence[str] = ()) -> "ColumnTable":
+        t = cls(fields)
+        t.extend(rows)
+        return t
+
+    # -- building ---------------------------------------------------------
+    def _add_field(self, name: str) -> int:
+        j = len(self.fields)
+        self._pos[name] = j
+        self.fields.append(name)
+        self.columns.append([_MISSING] * self._n)
+        self._pools.append({})
+        return j
+
+    def _intern(self, j: int, v: Any) -> Any:
+        if type(v) is not str or len(v) > INTERN_MAX_LEN:
+            return v
+        pool = self._pools[j]
+        if pool is None:
+            return v
+        v = pool.setdefault(v, v)
+        if len(pool) > INTERN_SAMPLE and len(pool) > self._n * INTERN_MAX_RATIO:
+            self._pools[j] = None
+        return v
+
+    def append(self, row: Dict[str, Any]) -> None:
+        if not isinstance(row, dict):
+            raise TypeError(f"ColumnTable 只接受 dict 行，收到 {type(row).__name__}")
+        for k in row:
+            if k not in self._pos:
+                self._add_field(k)
+        for k, j in self._pos.items():
+            self.columns[j].append(self._intern(j, row[k]) if k in row else _MISSING)
+        self._n += 1
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        for r in rows:
+            self.append(r)
+
+    def set_row(self, i: int, row: Dict[str, Any]) -> None:
+        """Replace row `i` in place (fields the new row lacks become absent)."""
+        for k in row:
+            if k not in self._pos:
+                self._add_field(k)
+        for k, j in self._pos.items():
+            self.columns[j][i] = self._intern(j, row[k]) if k in row else _MISSING
+
+    def take(self, indices: Iterable[int]) -> "ColumnTable":
+        """New table with the given rows, in the given order (intern pools are shared)."""
+        idx = list(indices)
+        t = ColumnTable()
+        t.fields = list(self.fields)
+        t._pos = dict(self._pos)
+        t._pools = list(self._pools)
+        t.columns = [[col[i] for i in idx] for col in self.columns]
+        t._n = len(idx)
+        return t
+
+    # -- reading ----------------------------------------------------------
+    def __len__(self) -> int:
+        return self._n
+
+    def row(self, i: int) -> Dict[str, Any]:
+        out = {}
+        for f, col in zip(self.fields, self.columns):
+            v = col[i]
+            if v is not _MISSING:
+                out[f] = v
+        return out
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        fields, columns = self.fields, self.columns
+        for i in range(self._n):
+            out = {}
+            for f, col in zip(fields, columns):
+                v = col[i]
+                if v is not _MISSING:
+                    out[f] = v
+            yield out
+
+    def __getitem__(self, key: Union[int, str]) -> Any:
+        """table[i] -> row dict; table["field"] -> that column (absent cells read as None)."""
+        if isinstance(key, str):
+            return self.column(key)
+        return self.row(key)
+
+    def column(self, name: str) -> List[Any]:
+        j = self._pos.get(name)
+        if j is None:
+            return [None] * self._n
+        col = self.columns[j]
+        return [None if v is _MISSING else v for v in col] if _MISSING in col else list(col)
+
+    def index(self, field: str) -> Dict[Any, int]:
+        """value -> row position for a unique column (last one wins on duplicates)."""
+        return {v: i for i, v in enumerate(self.column(field)) if v is not None}
+
+    def interned_fields(self) -> List[str]:
+        """Columns whose values are still being interned (low-cardinality strings)."""
+        return [f for f, pool in zip(self.fields, self._pools) if pool]
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        return list(self)
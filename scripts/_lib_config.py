@@ -69,6 +69,7 @@ class EnvConfig:
     expected_host_contains: str = ""
     server_host: str = ""
     description: str = ""
+    cache_budget_mb: str = ""
 
 
 @dataclass(frozen=True)
@@ -97,6 +98,7 @@ def load_env_config(env: str) -> EnvConfig:
         mcp_base_url=req("mcp_base_url"),
         expected_host_contains=str(d.get("expected_host_contains", "")).strip(),
         server_host=str(d.get("server_host", "")).strip(),
+        cache_budget_mb=str(d.get("cache_budget_mb", "")).strip(),
     )
     if cfg.env != env:
         raise ConfigError(f"环境文件 env 不匹配：期望 {env}，实际 {cfg.env}（{p}）")
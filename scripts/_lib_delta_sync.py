@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from _lib_columnar import ColumnTable
+from _lib_config import ConfigError
+from _lib_lock import FileLock
+from _lib_mcp import McpSession
+from _lib_output import iter_rows, read_json, write_json, write_rows
+
+# A peer may be doing a full fetch of a large doctype; wait for it rather than fail fast.
+SYNC_LOCK_TIMEOUT_S = 15 * 60
+# A reconcile that would drop more than this share of the snapshot is refused (likely a bad listing).
+RECONCILE_MAX_DELETE_RATIO = 0.5
+
+
+def state_path_for(ref_dir: Path) -> Path:
+    return ref_dir / "_sync_state.json"
+
+
+def _load_json(p: Path) -> Any:
+    if not p.exists():
+        return None
+    try:
+        return read_json(p)
+    except Exception:
+        return None
+
+
+def load_snapshot(p: Path) -> Optional[ColumnTable]:
+    """
+    Rows of a saved snapshot (list_documents response, JSON array or NDJSON) as a
+    ColumnTable; None when missing or unreadable, which forces a full fetch.
+    """
+    if not p.exists():
+        return None
+    try:
+        return ColumnTable.from_rows(iter_rows(p))
+    except Exception:
+        return None
+
+
+def _max_modified(table: ColumnTable) -> str:
+    return max((str(m) for m in table.column("modified") if m), default="")
+
+
+def sync_reference(
+    session: McpSession,
+    doctype: str,
+    fields: List[str],
+    out_path: Path,
+    state_path: Path,
+    limit: int,
+    reconcile_every_s: int = 24 * 3600,
+    force_reconcile: bool = False,
+    full: bool = False,
+) -> Dict[str, Any]:
+    """
+    Delta-sync one doctype into a local list_documents snapshot.
+
+    - watermark: max(`modified`) seen, stored per doctype in `state_path`
+    - delta: fetch rows with modified >= watermark and upsert them by `name`
+    - deletions: every `reconcile_every_s` (or on demand) compare against the live name set
+    - falls back to a full fetch on first run, when `fields` change, or when a capped delta is full
+    - all fetches are paginated (`limit` caps the row count; 0 = no cap)
+
+    The snapshot is locked for the whole sync (a second process syncing the same doctype
+    waits, then only fetches what changed after the first one's watermark); the shared
+    state file is locked for its read-modify-write, across threads and processes.
+    """
+    with FileLock.for_file(out_path, SYNC_LOCK_TIMEOUT_S):
+        return _sync_locked(session, doctype, fields, out_path, state_path, limit, reconcile_every_s, force_reconcile, full)
+
+
+def _sync_locked(
+    session: McpSession,
+    doctype: str,
+    fields: List[str],
+    out_path: Path,
+    state_path: Path,
+    limit: int,
+    reconcile_every_s: int,
+    force_reconcile: bool,
+    full: bool,
+) -> Dict[str, Any]:
+    q_fields = list(fields)
+    for k in ("name", "modified"):
+        if k not in q_fields:
+            q_fields.append(k)
+    fields_key = ",".join(q_fields)
+
+    state = _load_json(state_path)
+    if not isinstance(state, dict):
+        state = {}
+    st = state.get(doctype) if isinstance(state.get(doctype), dict) else {}
+    rows = load_snapshot(out_path)
+    now = int(time.time())
+
+    stats: Dict[str, Any] = {"doctype": doctype, "mode": "delta", "fetched": 0, "upserted": 0, "deleted": 0}
+    need_full = full or not st or rows is None or st.get("fields") != fields_key or not st.get("watermark")
+
+    changed: List[Any] = []
+    if not need_full:
+        changed = list(session.iter_documents(doctype, q_fields, filters={"modified": [">=", st["watermark"]]}, max_rows=limit))
+        if limit and len(changed) >= limit:
+            # Page is full: we cannot tell whether older changes were cut off.
+            need_full = True
+
+    if need_full:
+        rows = session.fetch_table(doctype, q_fields, max_rows=limit)
+        stats.update({"mode": "full", "fetched": len(rows), "upserted": len(rows)})
+        st = {"reconciled_at": now}
+    else:
+        assert rows is not None
+        pos = rows.index("name")
+        for r in changed:
+            if not isinstance(r, dict) or not r.get("name"):
+                continue
+            i = pos.get(r["name"])
+            if i is None:
+                pos[r["name"]] = len(rows)
+                rows.append(r)
+            elif rows.row(i) != r:
+                rows.set_row(i, r)
+            else:
+                continue
+            stats["upserted"] += 1
+        stats["fetched"] = len(changed)
+
+        if force_reconcile or now - int(st.get("reconciled_at") or 0) >= reconcile_every_s:
+            live = {r.get("name") if isinstance(r, dict) else r for r in session.iter_documents(doctype, ["name"], page_size=1000)}
+            kept = [i for i, n in enumerate(rows.column("name")) if n in live]
+            dropped = len(rows) - len(kept)
+            if dropped and (not live or dropped > len(rows) * RECONCILE_MAX_DELETE_RATIO):
+                raise ConfigError(
+                    f"{doctype} 核对将删除 {dropped}/{len(rows)} 行（服务器返回 {len(live)} 个 name），超过安全比例，已中止；"
+                    "确认服务器端确实删除后，用 --full-resync 重新全量拉取。"
+                )
+            stats["deleted"] = dropped
+            if stats["deleted"]:
+                rows = rows.take(kept)
+            st["reconciled_at"] = now
+            stats["reconcile"] = "done"
+
+    st.update({"watermark": _max_modified(rows) or st.get("watermark", ""), "fields": fields_key, "synced_at": now, "rows": len(rows)})
+    if stats["mode"] == "full" or stats["upserted"] or stats["deleted"]:
+        write_rows(out_path, rows)
+    with FileLock.for_file(state_path):
+        state = _load_json(state_path)
+        if not isinstance(state, dict):
+            state = {}
+        state[doctype] = st
+        write_json(state_path, state)
+    stats["rows"] = len(rows)
+    stats["watermark"] = st["watermark"]
+    return stats
+
+
+def add_delta_args(ap) -> None:
+    ap.add_argument("--delta", action="store_true", help="增量同步：只拉取 modified 水位之后变化的行，合并进已有快照")
+    ap.add_argument("--reconcile", action="store_true", help="增量同步时强制核对 name 集合（识别服务器端已删除的行）")
+    ap.add_argument("--full-resync", action="store_true", help="增量同步时忽略水位，重新全量拉取")
+
+
+def run_delta(session: McpSession, args, doctype: str, fields: List[str], out_path: Path) -> int:
+    stats = sync_reference(
+        session,
+        doctype,
+        fields,
+        out_path,
+        state_path_for(out_path.parent),
+        limit=args.limit,
+        force_reconcile=args.reconcile,
+        full=args.full_resync,
+    )
+    print("")
+    print(f"DELTA_SYNC={json.dumps(stats, ensure_ascii=False)}")
+    print(f"SAVED_TO={out_path}")
+    return 0
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import urllib.error
+import urllib.request
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from _lib_config import ConfigError, repo_root
+
+
+@dataclass(frozen=True)
+class Executor:
+    name: str
+    source: str
+    sha256: str
+
+    @property
+    def version(self) -> str:
+        return self.sha256[:12]
+
+
+def load_executor(name: str) -> Executor:
+    p = repo_root() / "scripts" / "server" / f"{name}_executor.py"
+    if not p.exists():
+        raise ConfigError(f"服务端 executor 源码不存在：{p}")
+    # Normalize newlines so the hash is identical on Windows/Linux checkouts.
+    source = p.read_text(encoding="utf-8").replace("\r\n", "\n")
+    return Executor(name=name, source=source, sha256=hashlib.sha256(source.encode("utf-8")).hexdigest())
+
+
+def _post_json(url: str, auth_header_value: str, body: dict, timeout: int) -> Tuple[int, Any]:
+    data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(
+        url,
+        data=data,
+        headers={"Authorization": auth_header_value, "Accept": "application/json", "Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            text = resp.read().decode("utf-8", errors="replace")
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        text = e.read(1024 * 64).decode("utf-8", errors="replace")
+        status = int(e.code)
+    try:
+        return status, json.loads(text)
+    except Exception:
+        return status, text
+
+
+class ServerExecutor:
+    """
+    Client for a whitelisted server method that already holds an executor's source.
+
+    Contract (implemented on the cos side, configured per profile as `server_executor`):
+      - POST <rest_base_url>/api/method/<version_method>  {"executor": name}
+          -> {"message": {"sha256": "<hex>"}}
+      - POST <rest_base_url>/api/method/<method>  {"executor": name, "executor_sha256": hex, "spec": {...}}
+          -> {"message": {"success": true, "output": "<captured stdout>"}}
+    `spec` carries `items_columnar` (see _lib_spec_codec.spec_body); the executor decodes it.
+    The server must refuse to run when `executor_sha256` differs from its copy.
+    """
+
+    def __init__(self, rest_base_url: str, auth_header_value: str, cfg: Dict[str, Any], timeout: int = 300):
+        self.base = rest_base_url.rstrip("/")
+        self.auth = auth_header_value
+        self.method = str(cfg.get("method") or "").strip()
+        self.version_method = str(cfg.get("version_method") or "").strip()
+        self.timeout = timeout
+        if not self.method or not self.version_method:
+            raise ConfigError("server_executor 配置需要 method 与 version_method。")
+
+    def remote_sha256(self, executor: Executor) -> Optional[str]:
+        try:
+            status, obj = _post_json(f"{self.base}/api/method/{self.version_method}", self.auth, {"executor": executor.name}, timeout=20)
+        except (urllib.error.URLError, OSError):
+            return None
+        if not (200 <= status < 300) or not isinstance(obj, dict):
+            return None
+        msg = obj.get("message")
+        sha = msg.get("sha256") if isinstance(msg, dict) else None
+        return sha if isinstance(sha, str) else None
+
+    def run(self, executor: Executor, spec_body: Dict[str, Any]) -> Any:
+        status, obj = _post_json(
+            f"{self.base}/api/method/{self.method}",
+            self.auth,
+            {"executor": executor.name, "executor_sha256": executor.sha256, "spec": spec_body},
+            timeout=self.timeout,
+        )
+        if not (200 <= status < 300):
+            raise ConfigError(f"server executor HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2, default=str)[:4000]}")
+        return obj.get("message") if isinstance(obj, dict) else obj
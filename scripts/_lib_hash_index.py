@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import sqlite3
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence
+
+from _lib_config import repo_root
+
+
+def default_index_path(env: str) -> Path:
+    return repo_root() / "cache" / env / "items" / "param_hash_index.sqlite"
+
+
+class BloomFilter:
+    """Small pure-Python Bloom filter (double hashing over one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.m = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.k = max(1, int(round(self.m / capacity * math.log(2))))
+        self.bits = bytearray((self.m + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        d = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        for i in range(self.k):
+            yield (h1 + i * h2) % self.m
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+class HashIndex:
+    """
+    Local Item index: custom_param_hash / custom_unique_item_name -> Item.name.
+
+    Stored in SQLite (indexed columns) under cache/<env>/items/, with a Bloom filter
+    built on open so that misses (the common case for new items) never touch disk.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path))
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                name TEXT PRIMARY KEY,
+                param_hash TEXT,
+                unique_name TEXT,
+                modified TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_items_hash ON items(param_hash);
+            CREATE INDEX IF NOT EXISTS idx_items_unique ON items(unique_name);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+        self._bloom: Optional[BloomFilter] = None
+
+    def close(self) -> None:
+        self.db.close()
+
+    # -- sync state -------------------------------------------------------
+    def get_meta(self, key: str, default: str = "") -> str:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return str(row[0]) if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, value))
+
+    def watermark(self) -> tuple[str, str]:
+        """(modified, name) of the last synced row; keyset cursor for incremental sync."""
+        return self.get_meta("watermark_modified"), self.get_meta("watermark_name")
+
+    def upsert(self, rows: Sequence[dict]) -> None:
+        self.db.executemany(
+            "INSERT OR REPLACE INTO items(name, param_hash, unique_name, modified) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    str(r.get("name")),
+                    (str(r.get("custom_param_hash") or "").lower() or None),
+                    (str(r.get("custom_unique_item_name") or "") or None),
+                    str(r.get("modified") or ""),
+                )
+                for r in rows
+                if r.get("name")
+            ],
+        )
+        self._bloom = None
+
+    def delete_missing(self, live_names: Iterable[str]) -> int:
+        live = set(live_names)
+        stale = [n for (n,) in self.db.execute("SELECT name FROM items") if n not in live]
+        self.db.executemany("DELETE FROM items WHERE name = ?", [(n,) for n in stale])
+        self._bloom = None
+        return len(stale)
+
+    def clear(self) -> None:
+        self.db.execute("DELETE FROM items")
+        self.db.execute("DELETE FROM meta")
+        self._bloom = None
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def count(self) -> int:
+        return int(self.db.execute("SELECT COUNT(*) FROM items").fetchone()[0])
+
+    # -- lookups ----------------------------------------------------------
+    def bloom(self) -> BloomFilter:
+        if self._bloom is None:
+            bf = BloomFilter(capacity=max(1024, self.count() * 2))
+            for h, u in self.db.execute("SELECT param_hash, unique_name FROM items"):
+                if h:
+                    bf.add("h:" + h)
+                if u:
+                    bf.add("u:" + u)
+            self._bloom = bf
+        return self._bloom
+
+    def by_hash(self, param_hash: str) -> List[str]:
+        h = param_hash.strip().lower()
+        if ("h:" + h) not in self.bloom():
+            return []
+        return [n for (n,) in self.db.execute("SELECT name FROM items WHERE param_hash = ? ORDER BY name", (h,))]
+
+    def by_unique_name(self, unique_name: str) -> List[str]:
+        u = unique_name.strip()
+        if ("u:" + u) not in self.bloom():
+            return []
+        return [n for (n,) in self.db.execute("SELECT name FROM items WHERE unique_name = ? ORDER BY name", (u,))]
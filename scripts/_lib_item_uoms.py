@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import textwrap
+
+# Server-side body that merges (uom, conversion_factor) pairs into one Item's uoms and saves it.
+# Expects `doc` (the Item) and `pairs` in scope. run_python_code forbids imports, so callers
+# paste it into their own code (see apply_uoms_code).
+_APPLY_UOMS = """
+existing = {row.uom: row for row in doc.uoms}
+for uom, cf in pairs:
+    cf = float(cf)
+    if uom in existing:
+        existing[uom].conversion_factor = cf
+    else:
+        doc.append("uoms", {"uom": uom, "conversion_factor": cf})
+doc.save()
+"""
+
+
+def apply_uoms_code(indent: str = "") -> str:
+    """The shared uoms update snippet, indented for embedding (e.g. inside a try block)."""
+    return textwrap.indent(_APPLY_UOMS.strip("\n"), indent) + "\n"
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from _lib_config import ConfigError
+
+if os.name == "nt":  # pragma: no cover - platform specific
+    import msvcrt
+
+    fcntl: Any = None
+else:
+    import fcntl
+
+    msvcrt = None
+
+DEFAULT_LOCK_TIMEOUT_S = 60.0
+_POLL_S = 0.05
+
+
+class LockTimeout(ConfigError):
+    pass
+
+
+def lock_path_for(target: Path) -> Path:
+    """Sidecar lock for a file: <dir>/.locks/<name>.lock (hidden, so snapshots skip it)."""
+    return target.parent / ".locks" / f"{target.name}.lock"
+
+
+class FileLock:
+    """
+    Advisory exclusive lock on a lock file (flock on POSIX, msvcrt.locking on Windows).
+
+    Works across processes and across threads of one process (each acquire opens its
+    own descriptor). `contended` tells the holder it had to wait for a peer, which is
+    the cue to re-check whether that peer already produced a fresh result.
+    """
+
+    def __init__(self, path: Path, timeout: float = DEFAULT_LOCK_TIMEOUT_S):
+        self.path = Path(path)
+        self.timeout = timeout
+        self.contended = False
+        self.waited_s = 0.0
+        self._fd: Optional[int] = None
+
+    @classmethod
+    def for_key(cls, root: Path, key: str, timeout: float = DEFAULT_LOCK_TIMEOUT_S) -> "FileLock":
+        """Named lock under <root>/.locks/, e.g. FileLock.for_key(cache_root, "mcp_tools")."""
+        return cls(root / ".locks" / f"{key}.lock", timeout)
+
+    @classmethod
+    def for_file(cls, target: Path, timeout: float = DEFAULT_LOCK_TIMEOUT_S) -> "FileLock":
+        return cls(lock_path_for(Path(target)), timeout)
+
+    def _try(self, fd: int) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self) -> "FileLock":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        t0 = time.monotonic()
+        while not self._try(fd):
+            self.contended = True
+            if time.monotonic() - t0 >= self.timeout:
+                os.close(fd)
+                raise LockTimeout(f"等待锁超时（{self.timeout:g}s）：{self.path}（可能有另一个刷新/同步进程仍在运行）")
+            time.sleep(_POLL_S)
+        self.waited_s = round(time.monotonic() - t0, 3)
+        self._fd = fd
+        return self
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        return self.acquire()
+
+    def __exit__(self, *exc) -> None:
+        self.release()
@@ -0,0 +1,470 @@
+from __future__ import annotations
+
+import http.client
+import itertools
+import json
+import socket
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from _lib_columnar import ColumnTable
+from _lib_config import ConfigError, EnvConfig, load_env_config, load_secrets, mask_secret
+
+PROTOCOL_VERSION = "2025-03-26"
+
+# Adaptive page sizing for iter_documents / iter_query: grow while pages come back fast, shrink when slow.
+PAGE_SIZE_MIN = 50
+PAGE_SIZE_MAX = 2000
+PAGE_TARGET_S = 1.5
+
+# Tools that are safe to re-send after a dropped connection (no server-side writes). Other
+# calls never go out on a keep-alive connection idle longer than IDLE_RECONNECT_S (the server
+# may have closed it), since a failure after sending is not retried for them.
+IDLE_RECONNECT_S = 2.0
+READ_ONLY_TOOLS = frozenset({"list_documents", "get_document", "search_documents", "get_doctype_info", "run_database_query"})
+
+
+def auth_from_secrets(secrets) -> Tuple[str, str, str]:
+    """Return (Authorization header value, label, raw secret) – same priority as the per-script helpers."""
+    raw = secrets.mcp_token.strip()
+    if raw:
+        if ":" in raw and " " not in raw:
+            return f"token {raw}", "token", raw
+        return f"Bearer {raw}", "Bearer", raw
+    if secrets.rest_api_key and secrets.rest_api_secret:
+        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
+        return f"token {raw}", "token", raw
+    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+
+
+def extract_text_content(mcp_result: dict) -> List[str]:
+    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
+    if not isinstance(result, dict):
+        return []
+    content = result.get("content")
+    if not isinstance(content, list):
+        return []
+    out: List[str] = []
+    for item in content:
+        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
+            out.append(item["text"])
+    return out
+
+
+def best_effort_parse_json_text(text: str) -> Any:
+    t = text.strip()
+    if not t:
+        return None
+    try:
+        return json.loads(t)
+    except Exception:
+        return t
+
+
+def extract_data_list(obj: Any) -> List[Any]:
+    """
+    Normalize list_documents / run_database_query output shapes (best effort).
+    Common FAC shape: {"success":true,"result":{"data":[...]}}
+    """
+    if isinstance(obj, list):
+        return obj
+    if not isinstance(obj, dict):
+        return []
+    for container in (obj.get("result"), obj):
+        if isinstance(container, dict):
+            for k in ("data", "rows", "results"):
+                v = container.get(k)
+                if isinstance(v, list):
+                    return v
+    return []
+
+
+def has_data_list(obj: Any) -> bool:
+    """True when `obj` has a shape extract_data_list understands (so [] really means "no rows")."""
+    if isinstance(obj, list):
+        return True
+    if not isinstance(obj, dict):
+        return False
+    return any(isinstance(c, dict) and any(isinstance(c.get(k), list) for k in ("data", "rows", "results")) for c in (obj.get("result"), obj))
+
+
+def extract_stdout(parsed: Any) -> str:
+    """
+    Best-effort: the captured stdout of run_python_code.
+    FAC wraps it as {"success": ..., "result": {"success": ..., "output": "..."}} (key names vary).
+    """
+    if isinstance(parsed, str):
+        return parsed
+    if not isinstance(parsed, dict):
+        return ""
+    for k in ("output", "stdout"):
+        v = parsed.get(k)
+        if isinstance(v, str):
+            return v
+    r = parsed.get("result")
+    if isinstance(r, (dict, str)):
+        return extract_stdout(r)
+    return ""
+
+
+def parse_tagged_lines(stdout: str) -> List[Tuple[str, Any]]:
+    """`X|{json}` lines printed by server-side code -> [(tag, payload)]; other lines are ignored."""
+    out: List[Tuple[str, Any]] = []
+    for line in stdout.splitlines():
+        line = line.strip()
+        if len(line) > 2 and line[1] == "|":
+            try:
+                out.append((line[0], json.loads(line[2:])))
+            except Exception:
+                continue
+    return out
+
+
+class McpSession:
+    """
+    One FAC MCP session shared by everything in the process.
+
+    - `initialize` is sent once (lazily) and cached
+    - HTTP connections are kept alive per thread (no TLS handshake per call)
+    - JSON-RPC ids come from a process-wide counter, so threads can share a session
+    """
+
+    def __init__(self, cfg: EnvConfig, auth_header_value: str, timeout: int = 60):
+        self.cfg = cfg
+        self.url = cfg.mcp_base_url
+        self.auth_header_value = auth_header_value
+        self.auth_label = ""
+        self.auth_raw = ""
+        self.timeout = timeout
+        self._parsed = urllib.parse.urlsplit(self.url)
+        if self._parsed.scheme not in ("http", "https") or not self._parsed.netloc:
+            raise ConfigError(f"mcp_base_url 不是合法的 http(s) 地址：{self.url}")
+        self._path = self._parsed.path + (f"?{self._parsed.query}" if self._parsed.query else "")
+        self._local = threading.local()
+        # Every thread's keep-alive connection, so close() can release pool workers' too.
+        self._conns: List[http.client.HTTPConnection] = []
+        self._conns_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._init_lock = threading.Lock()
+        self._init_result: Optional[dict] = None
+
+    @classmethod
+    def from_env(cls, env: str, timeout: int = 60) -> "McpSession":
+        cfg = load_env_config(env)
+        secrets = load_secrets(required=True)
+        header, label, raw = auth_from_secrets(secrets)
+        s = cls(cfg, header, timeout=timeout)
+        s.auth_label = label
+        s.auth_raw = raw
+        return s
+
+    def print_banner(self, file=None) -> None:
+        print(f"ENV={self.cfg.env}  SITE={self.cfg.site_url}", file=file)
+        print(f"FAC_MCP_ENDPOINT={self.url}", file=file)
+        print(f"MCP_AUTH={self.auth_label}  VALUE={mask_secret(self.auth_raw)}", file=file)
+
+    # -- transport --------------------------------------------------------
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            klass = http.client.HTTPSConnection if self._parsed.scheme == "https" else http.client.HTTPConnection
+            conn = klass(self._parsed.netloc, timeout=self.timeout)
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _drop_conn(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            with self._conns_lock:
+                if conn in self._conns:
+                    self._conns.remove(conn)
+            try:
+                conn.close()
+            finally:
+                self._local.conn = None
+
+    def _post(self, body: dict, idempotent: bool = False) -> Tuple[int, Any]:
+        """
+        POST one JSON-RPC body. A stale keep-alive connection is reconnected once, but a
+        request that may already have reached the server is re-sent only when `idempotent`
+        (a replayed run_python_code / update_document could apply a write twice).
+        """
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Authorization": self.auth_header_value,
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+        idle = time.monotonic() - getattr(self._local, "last_used", 0.0)
+        if not idempotent and idle > IDLE_RECONNECT_S:
+            self._drop_conn()
+        for attempt in (1, 2):
+            conn = self._conn()
+            sent = False
+            try:
+                conn.request("POST", self._path, body=data, headers=headers)
+                sent = True
+                resp = conn.getresponse()
+                raw = resp.read()
+                status = resp.status
+                self._local.last_bytes = len(raw)
+                self._local.last_used = time.monotonic()
+                if resp.getheader("connection", "").lower() == "close":
+                    self._drop_conn()
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self._drop_conn()
+                if attempt == 1 and (not sent or idempotent) and not isinstance(e, socket.timeout):
+                    continue
+                state = "请求可能已被服务端执行，未自动重试；" if sent and not idempotent else ""
+                raise ConfigError(f"MCP 连接失败：{self.url}\n{state}{type(e).__name__}: {e}")
+        text = raw.decode("utf-8", errors="replace")
+        try:
+            return status, json.loads(text)
+        except Exception:
+            if 200 <= status < 300:
+                raise ConfigError(f"非 JSON 响应：HTTP {status}\n{text[:2000]}")
+            raise ConfigError(f"HTTP {status}\n{text[:2000]}")
+
+    def call(self, method: str, params: Optional[dict] = None) -> dict:
+        body = {"jsonrpc": "2.0", "method": method, "params": params or {}, "id": next(self._ids)}
+        idempotent = method != "tools/call" or (params or {}).get("name") in READ_ONLY_TOOLS
+        status, obj = self._post(body, idempotent=idempotent)
+        if not (200 <= status < 300):
+            raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
+        return obj
+
+    @property
+    def last_response_bytes(self) -> int:
+        """Body size of the last HTTP response received by the calling thread."""
+        return int(getattr(self._local, "last_bytes", 0))
+
+    # -- MCP helpers ------------------------------------------------------
+    def initialize(self) -> dict:
+        with self._init_lock:
+            if self._init_result is None:
+                self._init_result = self.call("initialize", {"protocolVersion": PROTOCOL_VERSION, "capabilities": {}})
+            return self._init_result
+
+    def server_info(self) -> Optional[dict]:
+        init = self.initialize()
+        srv = (init.get("result") or {}).get("serverInfo") if isinstance(init, dict) else None
+        return srv if isinstance(srv, dict) else None
+
+    def call_tool(self, name: str, arguments: dict) -> Any:
+        """tools/call; returns the parsed first text block (or the raw response when there is none)."""
+        self.initialize()
+        resp = self.call("tools/call", {"name": name, "arguments": arguments})
+        texts = extract_text_content(resp)
+        return best_effort_parse_json_text(texts[0]) if texts else resp
+
+    def run_code(self, code: str) -> Tuple[Any, List[Tuple[str, Any]]]:
+        """run_python_code; returns (parsed response, parse_tagged_lines of its stdout)."""
+        parsed = self.call_tool("run_python_code", {"code": code})
+        return parsed, parse_tagged_lines(extract_stdout(parsed))
+
+    def list_documents(
+        self,
+        doctype: str,
+        fields: List[str],
+        filters: Optional[Any] = None,
+        limit: int = 200,
+        **extra: Any,
+    ) -> Tuple[Any, List[Any]]:
+        args: Dict[str, Any] = {"doctype": doctype, "fields": fields, "limit": limit}
+        if filters:
+            args["filters"] = filters
+        args.update({k: v for k, v in extra.items() if v is not None})
+        parsed = self.call_tool("list_documents", args)
+        return parsed, extract_data_list(parsed)
+
+    def iter_documents(
+        self,
+        doctype: str,
+        fields: List[str],
+        filters: Optional[Any] = None,
+        max_rows: int = 0,
+        page_size: int = 200,
+        adaptive: bool = True,
+        prefetch: bool = True,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Any]:
+        """
+        Yield every matching row of `doctype` (up to `max_rows`, 0 = all).
+
+        Pages are walked by keyset on `name` (`order_by name asc` + `name > last`),
+        which stays correct when rows are inserted between pages. The next page is
+        requested in a background thread while the caller consumes the current one,
+        and the page size adapts so that one page takes about PAGE_TARGET_S.
+        `name` is added to the query when missing and stripped from yielded rows.
+        """
+        q_fields = list(fields) if "name" in fields else [*fields, "name"]
+        strip_name = "name" not in fields
+
+        def keyset(last: Optional[str]) -> Any:
+            if last is None:
+                return filters
+            cond = [">", last]
+            if isinstance(filters, list):
+                return [*filters, [doctype, "name", *cond]]
+            merged = dict(filters or {})
+            if "name" in merged:
+                # Caller already filters on name: keep both via list form.
+                return [[doctype, k, *(v if isinstance(v, list) else ["=", v])] for k, v in merged.items()] + [[doctype, "name", *cond]]
+            merged["name"] = cond
+            return merged
+
+        def fetch(last: Optional[Any], n: int) -> List[Any]:
+            parsed, rows = self.list_documents(doctype, q_fields, filters=keyset(last), limit=n, order_by="name asc")
+            # A failed page must not read as "no more rows" (callers replace snapshots / delete by it).
+            if isinstance(parsed, dict) and (parsed.get("success") is False or parsed.get("error")):
+                raise ConfigError(f"list_documents 失败（{doctype}）：{parsed.get('error') or parsed}")
+            if not has_data_list(parsed):
+                raise ConfigError(f"无法解析 {doctype} 列表返回：\n{json.dumps(parsed, ensure_ascii=False, default=str)[:2000]}")
+            return rows
+
+        for r in _iter_keyset(fetch, "name", max_rows, page_size, adaptive, prefetch, stats, PAGE_SIZE_MAX):
+            if strip_name and isinstance(r, dict):
+                r = {k: v for k, v in r.items() if k != "name"}
+            yield r
+
+    def iter_query(
+        self,
+        sql: str,
+        key: str = "name",
+        max_rows: int = 0,
+        page_size: int = PAGE_SIZE_MAX,
+        adaptive: bool = True,
+        prefetch: bool = True,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[Any]:
+        """
+        Stream the rows of a read-only SELECT through run_database_query in keyset slices:
+
+          SELECT * FROM (<sql>) AS _q WHERE _q.`key` > <last> ORDER BY _q.`key` LIMIT n
+
+        `key` must be a unique column of the result (e.g. `name`); paging, prefetch and
+        adaptive sizing work as in iter_documents.
+        """
+        base = sql.strip().rstrip(";").rstrip()
+        col = "`" + key.replace("`", "``") + "`"
+
+        def fetch(last: Optional[Any], n: int) -> List[Any]:
+            where = "" if last is None else f" WHERE _q.{col} > {sql_literal(last)}"
+            q = f"SELECT * FROM ({base}) AS _q{where} ORDER BY _q.{col} LIMIT {int(n)}"
+            parsed = self.call_tool("run_database_query", {"query": q, "limit": n})
+            if isinstance(parsed, dict) and (parsed.get("success") is False or parsed.get("error")):
+                raise ConfigError(f"run_database_query 失败：{parsed.get('error') or parsed}\nSQL: {q}")
+            if not has_data_list(parsed):
+                raise ConfigError(f"无法解析 run_database_query 返回：\n{json.dumps(parsed, ensure_ascii=False, default=str)[:2000]}\nSQL: {q}")
+            rows = extract_data_list(parsed)
+            if rows and (not isinstance(rows[0], dict) or key not in rows[0]):
+                raise ConfigError(f"查询结果中没有键列 `{key}`：SELECT 列表需要包含该列（可用 --key 指定其他唯一列）")
+            return rows
+
+        yield from _iter_keyset(fetch, key, max_rows, page_size, adaptive, prefetch, stats, PAGE_SIZE_MAX)
+
+    def fetch_table(self, doctype: str, fields: List[str], filters: Optional[Any] = None, **kw: Any) -> ColumnTable:
+        """iter_documents collected into a ColumnTable (for results that must stay in memory)."""
+        return ColumnTable.from_rows(self.iter_documents(doctype, fields, filters=filters, **kw), fields)
+
+    def query_table(self, sql: str, key: str = "name", **kw: Any) -> ColumnTable:
+        """iter_query collected into a ColumnTable."""
+        return ColumnTable.from_rows(self.iter_query(sql, key=key, **kw))
+
+    def close(self) -> None:
+        """Close the connections of all threads (call once worker pools are done)."""
+        self._drop_conn()
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+def sql_literal(v: Any) -> str:
+    """SQL literal for a keyset bound (numbers verbatim, everything else as a quoted string)."""
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, (int, float)):
+        return repr(v)
+    return "'" + str(v).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _iter_keyset(
+    fetch: Callable[[Optional[Any], int], List[Any]],
+    key: str,
+    max_rows: int,
+    page_size: int,
+    adaptive: bool,
+    prefetch: bool,
+    stats: Optional[Dict[str, Any]],
+    size_max: int,
+) -> Iterator[Any]:
+    """
+    Shared page loop of iter_documents / iter_query. `fetch(last, n)` returns up to n rows
+    ordered by `key` and starting after `last` (None = first page).
+
+    Only an empty page ends the walk: the server may cap rows per call, so a short page is
+    just a signal not to grow the page size.
+    """
+    # Never ask for more than size_max rows per call: the server caps larger pages anyway.
+    size = min(size_max, max(1, int(page_size)))
+    if stats is None:
+        stats = {}
+    stats.update({"pages": 0, "rows": 0, "seconds": 0.0, "page_sizes": []})
+
+    def timed(last: Optional[Any], n: int) -> Tuple[List[Any], float]:
+        t0 = time.monotonic()
+        rows = fetch(last, n)
+        return rows, time.monotonic() - t0
+
+    pool = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        want = size if not max_rows else min(size, max_rows)
+        pending = pool.submit(timed, None, want) if pool else None
+        last: Optional[Any] = None
+        emitted = 0
+        while True:
+            rows, took = pending.result() if pending else timed(last, want)
+            stats["pages"] += 1
+            stats["seconds"] += took
+            stats["page_sizes"].append(want)
+            full = len(rows) >= want
+            if rows:
+                bound = last
+                last = rows[-1].get(key) if isinstance(rows[-1], dict) else None
+                if last is None:
+                    raise ConfigError(f"分页结果缺少键列 `{key}`，无法继续翻页")
+                if last == bound:
+                    raise ConfigError(f"分页未前进（`{key}` 停在 {bound!r}），已中止以免漏数据")
+            if adaptive and full:
+                if took < PAGE_TARGET_S / 2:
+                    size = min(size_max, size * 2)
+                elif took > PAGE_TARGET_S:
+                    size = max(PAGE_SIZE_MIN, size // 2)
+
+            remaining = max_rows - emitted - len(rows) if max_rows else None
+            done = not rows or (remaining is not None and remaining <= 0)
+            if not done:
+                want = size if remaining is None else min(size, remaining)
+                pending = pool.submit(timed, last, want) if pool else None
+
+            for r in rows:
+                if max_rows and emitted >= max_rows:
+                    break
+                emitted += 1
+                stats["rows"] = emitted
+                yield r
+            if done:
+                return
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+from _lib_cache_manager import record_use
+from _lib_lock import FileLock
+from _lib_output import write_json
+from _lib_tool_index import DEFAULT_TOOLS_TTL_SECONDS, ToolIndex, open_tool_index, tools_list_path, tools_meta_path
+
+DEFAULT_TTL_SECONDS = DEFAULT_TOOLS_TTL_SECONDS
+# A background revalidation holding the lock longer than this is assumed dead.
+REVALIDATE_LOCK_MAX_AGE_S = 300
+
+METRIC_KEYS = ("hit", "stale_hit", "miss", "revalidate_started", "revalidate_unchanged", "revalidate_updated")
+
+
+def meta_path(cache_root: Path) -> Path:
+    return tools_meta_path(cache_root)
+
+
+def metrics_path(cache_root: Path) -> Path:
+    return cache_root / "mcp" / "metrics.json"
+
+
+def _lock_path(cache_root: Path) -> Path:
+    return cache_root / "mcp" / ".revalidate.lock"
+
+
+def _load(p: Path) -> Dict[str, Any]:
+    try:
+        obj = json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return obj if isinstance(obj, dict) else {}
+
+
+def load_meta(cache_root: Path) -> Dict[str, Any]:
+    return _load(meta_path(cache_root))
+
+
+def cache_state(cache_root: Path) -> Dict[str, Any]:
+    """
+    Freshness of mcp/tools_list.json. Age counts from the last successful validation
+    (`validated_at` in meta.json, written even when the content was unchanged) and
+    falls back to the file mtime for caches written before that field existed.
+    """
+    src = tools_list_path(cache_root)
+    if not src.exists():
+        return {"exists": False, "stale": True}
+    meta = load_meta(cache_root)
+    ttl = int(meta.get("ttl_seconds") or DEFAULT_TTL_SECONDS)
+    validated = meta.get("validated_at") or meta.get("generated_at") or int(src.stat().st_mtime)
+    age = int(time.time() - float(validated))
+    return {"exists": True, "validated_at": int(validated), "age_seconds": age, "ttl_seconds": ttl, "stale": age > ttl}
+
+
+def record(cache_root: Path, event: str, n: int = 1) -> None:
+    """Bump a counter in mcp/metrics.json (best effort; never fails the caller)."""
+    try:
+        p = metrics_path(cache_root)
+        # Concurrent readers bump the same counters: read-modify-write under a short lock.
+        with FileLock.for_key(cache_root, "metrics", timeout=2):
+            m = _load(p)
+            m[event] = int(m.get(event) or 0) + n
+            m[f"last_{event}_at"] = int(time.time())
+            write_json(p, m)
+    except Exception:
+        pass
+
+
+def revalidate_in_background(cache_root: Path, env: str) -> bool:
+    """
+    Start `cache_refresh.py --what mcp_tools --force --swr-child` detached from this
+    process. Returns False when another revalidation is already running.
+    """
+    lock = _lock_path(cache_root)
+    lock.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        if lock.exists() and time.time() - lock.stat().st_mtime < REVALIDATE_LOCK_MAX_AGE_S:
+            return False
+        lock.unlink(missing_ok=True)
+        fd = os.open(str(lock), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except OSError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+
+    script = Path(__file__).resolve().parent / "cache_refresh.py"
+    cmd = [sys.executable, str(script), "--env", env, "--what", "mcp_tools", "--force", "--swr-child"]
+    kwargs: Dict[str, Any] = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == "nt":
+        kwargs["creationflags"] = getattr(subprocess, "DETACHED_PROCESS", 0) | getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        subprocess.Popen(cmd, **kwargs)
+    except OSError:
+        lock.unlink(missing_ok=True)
+        return False
+    record(cache_root, "revalidate_started")
+    return True
+
+
+def release_revalidate_lock(cache_root: Path) -> None:
+    _lock_path(cache_root).unlink(missing_ok=True)
+
+
+def lookup_tools(cache_root: Path, env: str, need: Sequence[str] = ()) -> Optional[ToolIndex]:
+    """
+    Stale-while-revalidate read of the cached tools list: a fresh or stale cache is
+    served immediately (stale additionally kicks off a background refresh); None
+    means there is no cache, or none of the `need`ed tool names is in it, and the
+    caller has to go to the network.
+
+    Exactly one of hit / stale_hit / miss is recorded per call; callers must not
+    record another outcome for the same lookup.
+    """
+    state = cache_state(cache_root)
+    idx = open_tool_index(cache_root) if state["exists"] else None
+    if idx is None or (need and not any(n in idx for n in need)):
+        record(cache_root, "miss")
+        return None
+    record_use(cache_root, "mcp_tools")
+    if state["stale"]:
+        record(cache_root, "stale_hit")
+        revalidate_in_background(cache_root, env)
+    else:
+        record(cache_root, "hit")
+    return idx
+
+
+def load_metrics(cache_root: Path) -> Dict[str, Any]:
+    m = _load(metrics_path(cache_root))
+    served = int(m.get("hit") or 0) + int(m.get("stale_hit") or 0)
+    total = served + int(m.get("miss") or 0)
+    out: Dict[str, Any] = {k: int(m.get(k) or 0) for k in METRIC_KEYS}
+    out["hit_ratio"] = round(served / total, 3) if total else None
+    out.update({k: v for k, v in m.items() if k.startswith("last_")})
+    return out
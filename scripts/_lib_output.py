@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from _lib_config import ConfigError
+
+try:  # Optional: only needed for *.zst files.
+    import zstandard as _zstd
+except Exception:  # pragma: no cover - depends on local environment
+    _zstd = None
+
+try:  # Optional: only needed for *.parquet exports.
+    import pyarrow as _pa
+    import pyarrow.parquet as _pq
+except Exception:  # pragma: no cover - depends on local environment
+    _pa = _pq = None
+
+# Output format is chosen from the file name:
+#   *.json / *.json.gz / *.json.zst        one JSON document (list_documents layout for row streams)
+#   *.ndjson / *.jsonl (+ .gz / .zst)      one JSON object per line
+#   *.csv (+ .gz / .zst)                   header + one line per row (row streams only)
+#   *.parquet                              columnar, one row group per batch (row streams only; needs pyarrow)
+NDJSON_SUFFIXES = (".ndjson", ".jsonl")
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+
+
+def _split_suffix(path: Path) -> tuple[str, str]:
+    """(format suffix, compression suffix), e.g. items.ndjson.zst -> (".ndjson", ".zst")."""
+    suffixes = [s.lower() for s in path.suffixes]
+    comp = suffixes[-1] if suffixes and suffixes[-1] in COMPRESSED_SUFFIXES else ""
+    rest = suffixes[:-1] if comp else suffixes
+    return (rest[-1] if rest else ""), comp
+
+
+def is_ndjson(path: Path) -> bool:
+    return _split_suffix(path)[0] in NDJSON_SUFFIXES
+
+
+def _tmp_path(path: Path) -> Path:
+    # Unique per process and thread: concurrent writers never share a temp file.
+    return path.with_name(f".{path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+
+
+def _need_zstd() -> None:
+    if _zstd is None:
+        raise ConfigError("*.zst 需要 zstandard 包：pip install zstandard（或改用 .gz）")
+
+
+@contextlib.contextmanager
+def open_output(path: Path) -> Iterator[TextIO]:
+    """
+    Text writer for `path`, compressed by suffix (.gz / .zst).
+
+    Data goes to a temp file next to the target and is renamed into place only when
+    the block completes, so readers never see a half-written snapshot.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    comp = _split_suffix(path)[1]
+    if comp == ".zst":
+        _need_zstd()
+    tmp = _tmp_path(path)
+    raw = open(tmp, "wb")
+    text: Optional[io.TextIOWrapper] = None
+    try:
+        if comp == ".gz":
+            stream: Any = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+        elif comp == ".zst":
+            stream = _zstd.ZstdCompressor(level=10).stream_writer(raw, closefd=False)
+        else:
+            stream = raw
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="\n", write_through=False)
+        yield text
+        text.flush()
+        text.detach()
+        if stream is not raw:
+            stream.close()
+        raw.flush()
+        os.fsync(raw.fileno())
+        raw.close()
+        os.replace(tmp, path)
+    except BaseException:
+        if text is not None:
+            with contextlib.suppress(Exception):
+                text.detach()
+        raw.close()
+        with contextlib.suppress(FileNotFoundError):
+            tmp.unlink()
+        raise
+
+
+@contextlib.contextmanager
+def open_input(path: Path, newline: Optional[str] = None) -> Iterator[TextIO]:
+    """Text reader for `path`, transparently decompressing .gz / .zst (pass newline="" for csv)."""
+    path = Path(path)
+    if not path.exists():
+        raise ConfigError(f"输入文件不存在：{path}")
+    comp = _split_suffix(path)[1]
+    if comp == ".gz":
+        f: Any = gzip.open(path, "rt", encoding="utf-8-sig", newline=newline)
+    elif comp == ".zst":
+        _need_zstd()
+        f = io.TextIOWrapper(_zstd.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True), encoding="utf-8-sig", newline=newline)
+    else:
+        f = open(path, "r", encoding="utf-8-sig", newline=newline)
+    with f:
+        yield f
+
+
+class JsonListWriter:
+    """Streams rows as `{"success": true, "result": {"data": [...]}}`, laid out like json.dumps(indent=2)."""
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.n = 0
+        f.write('{\n  "success": true,\n  "result": {\n    "data": [')
+
+    def write(self, row: Any) -> None:
+        text = json.dumps(row, ensure_ascii=False, indent=2, default=str).replace("\n", "\n      ")
+        self.f.write(("," if self.n else "") + "\n      " + text)
+        self.n += 1
+
+    def finish(self) -> None:
+        self.f.write(("\n    ]" if self.n else "]") + "\n  }\n}\n")
+
+
+class NdjsonWriter:
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.n = 0
+
+    def write(self, row: Any) -> None:
+        self.f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":"), default=str) + "\n")
+        self.n += 1
+
+    def finish(self) -> None:
+        pass
+
+
+def _cell(v: Any) -> Any:
+    return json.dumps(v, ensure_ascii=False, default=str) if isinstance(v, (dict, list)) else v
+
+
+class CsvWriter:
+    """CSV with the header taken from the first row; nested values are written as JSON."""
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.n = 0
+        self._w: Optional[csv.DictWriter] = None
+
+    def write(self, row: Any) -> None:
+        if not isinstance(row, dict):
+            row = {"value": row}
+        if self._w is None:
+            self._w = csv.DictWriter(self.f, fieldnames=list(row.keys()), extrasaction="ignore", lineterminator="\n")
+            self._w.writeheader()
+        self._w.writerow({k: _cell(v) for k, v in row.items()})
+        self.n += 1
+
+    def finish(self) -> None:
+        pass
+
+
+class ParquetWriter:
+    """
+    Buffers `batch_rows` rows and writes each batch as one Parquet row group, so memory
+    stays bounded by the batch. The schema comes from the first batch (all-null columns
+    become strings); nested values are stored as JSON text.
+    """
+
+    def __init__(self, path: Path, batch_rows: int = 10000):
+        if _pa is None:
+            raise ConfigError("*.parquet 需要 pyarrow 包：pip install pyarrow（或改用 .ndjson / .csv）")
+        self.path = path
+        self.batch_rows = max(1, batch_rows)
+        self.n = 0
+        self._buf: list = []
+        self._schema: Any = None
+        self._writer: Any = None
+
+    def write(self, row: Any) -> None:
+        if not isinstance(row, dict):
+            row = {"value": row}
+        self._buf.append({k: _cell(v) for k, v in row.items()})
+        self.n += 1
+        if len(self._buf) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buf:
+            return
+        try:
+            if self._schema is None:
+                inferred = _pa.Table.from_pylist(self._buf).schema
+                self._schema = _pa.schema([_pa.field(f.name, _pa.string() if _pa.types.is_null(f.type) else f.type) for f in inferred])
+                self._writer = _pq.ParquetWriter(str(self.path), self._schema, compression="zstd")
+            table = _pa.Table.from_pylist(self._buf, schema=self._schema)
+        except (_pa.ArrowInvalid, _pa.ArrowTypeError) as e:
+            raise ConfigError(f"Parquet 列类型与第一批数据推断的不一致：{e}（可改用 .ndjson / .csv）")
+        self._writer.write_table(table)
+        self._buf.clear()
+
+    def finish(self) -> None:
+        self._flush()
+        if self._writer is None:
+            # No rows at all: still produce a valid (empty) file.
+            self._schema = _pa.schema([])
+            self._writer = _pq.ParquetWriter(str(self.path), self._schema)
+        self._writer.close()
+
+
+@contextlib.contextmanager
+def row_sink(path: Path) -> Iterator[Any]:
+    """
+    Row writer (write/finish) for `path`, format by suffix: .ndjson/.jsonl, .csv,
+    .parquet, anything else a list_documents-style JSON document. Atomic like open_output.
+    """
+    path = Path(path)
+    fmt = _split_suffix(path)[0]
+    if fmt == ".parquet":
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_path(path)
+        try:
+            yield ParquetWriter(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                tmp.unlink()
+            raise
+        return
+    with open_output(path) as f:
+        yield CsvWriter(f) if fmt == ".csv" else row_writer(f, path)
+
+
+def row_writer(f: TextIO, path: Optional[Path] = None):
+    """NdjsonWriter for *.ndjson / *.jsonl targets, JsonListWriter otherwise (including stdout)."""
+    return NdjsonWriter(f) if path is not None and is_ndjson(Path(path)) else JsonListWriter(f)
+
+
+def tee_rows(rows: Iterable[Any], *writers) -> int:
+    """Feed each row to every writer as it arrives; returns the row count."""
+    n = 0
+    for r in rows:
+        for w in writers:
+            w.write(r)
+        n += 1
+    for w in writers:
+        w.finish()
+    return n
+
+
+def write_list_response(rows: Iterable[Any], *outs: TextIO) -> int:
+    return tee_rows(rows, *(JsonListWriter(f) for f in outs))
+
+
+def write_rows(path: Path, rows: Iterable[Any], echo: Optional[TextIO] = None) -> int:
+    """Stream rows into `path` (format/compression by suffix, atomic); optionally echo them to `echo`."""
+    with row_sink(path) as w:
+        writers = [w]
+        if echo is not None:
+            writers.append(JsonListWriter(echo))
+        return tee_rows(rows, *writers)
+
+
+def write_bytes(path: Path, data: bytes) -> None:
+    """Replace `path` with `data` atomically (temp file + fsync + rename); no compression."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = _tmp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            tmp.unlink()
+        raise
+
+
+def write_text(path: Path, text: str) -> None:
+    with open_output(path) as f:
+        f.write(text)
+
+
+def write_json(path: Path, obj: Any, indent: Optional[int] = 2) -> None:
+    """json.dump (chunked encoder, no full string in memory) into `path` atomically."""
+    with open_output(path) as f:
+        json.dump(obj, f, ensure_ascii=False, indent=indent, default=str)
+        f.write("\n")
+
+
+def read_json(path: Path) -> Any:
+    with open_input(path) as f:
+        return json.load(f)
+
+
+def iter_rows(path: Path) -> Iterator[Any]:
+    """
+    Rows of an NDJSON file (streamed line by line) or of a JSON document
+    (array, or a list_documents / run_database_query response).
+    """
+    path = Path(path)
+    if is_ndjson(path):
+        with open_input(path) as f:
+            for i, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        raise ConfigError(f"{path}:{i} 不是合法 JSON：{e}")
+        return
+    obj = read_json(path)
+    if isinstance(obj, list):
+        yield from obj
+        return
+    if isinstance(obj, dict):
+        for container in (obj.get("result"), obj):
+            if isinstance(container, dict):
+                for k in ("data", "rows", "results"):
+                    if isinstance(container.get(k), list):
+                        yield from container[k]
+                        return
+    raise ConfigError(f"无法从文件中识别行数组：{path}")
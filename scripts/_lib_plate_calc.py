@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import csv
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from _lib_config import ConfigError
+from _lib_output import iter_rows, open_input
+
+try:  # Optional: vectorized path. Everything works without numpy.
+    import numpy as _np
+except Exception:  # pragma: no cover - depends on local environment
+    _np = None
+
+# Accept both English and template (Chinese) column names in bulk input files.
+_ALIASES = {
+    "name": ("name", "item", "item_code", "物料"),
+    "thickness": ("thickness", "厚度"),
+    "width": ("width", "宽度"),
+    "length": ("length", "长度"),
+    "density": ("density", "密度"),
+}
+
+
+@dataclass(frozen=True)
+class PlateFactors:
+    names: List[str]
+    meter_weight: List[float]  # kg/m
+    sheet_weight: List[float]  # kg/张
+
+
+def has_numpy() -> bool:
+    return _np is not None
+
+
+def compute_plate_factors(
+    names: Sequence[str],
+    thickness: Sequence[float],
+    width: Sequence[float],
+    length: Sequence[float],
+    density: Sequence[float],
+    use_numpy: Optional[bool] = None,
+) -> PlateFactors:
+    """
+    Theoretical weights for many plates in one pass (same formulas as the single-item script):
+      meter_weight = round(thickness * width * density / 1000, 3)   # kg/m
+      sheet_weight = round(meter_weight * length / 1000, 3)         # kg/张
+    """
+    n = len(names)
+    if not (len(thickness) == len(width) == len(length) == len(density) == n):
+        raise ConfigError("钢板尺寸列长度不一致。")
+    if use_numpy is None:
+        use_numpy = _np is not None
+    if use_numpy and _np is not None:
+        t = _np.asarray(thickness, dtype=float)
+        w = _np.asarray(width, dtype=float)
+        ln = _np.asarray(length, dtype=float)
+        d = _np.asarray(density, dtype=float)
+        m = _np.round(t * w * d / 1000.0, 3)
+        s = _np.round(m * ln / 1000.0, 3)
+        return PlateFactors(names=list(names), meter_weight=m.tolist(), sheet_weight=s.tolist())
+    m_list = [round(t * w * d / 1000.0, 3) for t, w, d in zip(thickness, width, density)]
+    s_list = [round(m * ln / 1000.0, 3) for m, ln in zip(m_list, length)]
+    return PlateFactors(names=list(names), meter_weight=m_list, sheet_weight=s_list)
+
+
+def _pick(row: Dict[str, Any], key: str) -> Any:
+    for k in _ALIASES[key]:
+        if k in row and row[k] not in (None, ""):
+            return row[k]
+    return None
+
+
+def load_plate_rows(path: Path, default_density: float) -> Dict[str, List[Any]]:
+    """
+    Read plate items from CSV (header row), JSON array or NDJSON (optionally .gz/.zst) into columns:
+    {"names": [...], "thickness": [...], "width": [...], "length": [...], "density": [...]}.
+    """
+    rows: Iterable[Any]
+    if ".csv" in [s.lower() for s in path.suffixes]:
+        with open_input(path, newline="") as f:
+            rows = [dict(r) for r in csv.DictReader(f)]
+    else:
+        # NDJSON is streamed row by row; JSON may be an array or a list_documents response.
+        rows = iter_rows(path)
+
+    cols: Dict[str, List[Any]] = {"names": [], "thickness": [], "width": [], "length": [], "density": []}
+    for i, r in enumerate(rows, start=1):
+        if not isinstance(r, dict):
+            raise ConfigError(f"第 {i} 行不是对象：{r!r}")
+        name = _pick(r, "name")
+        t, w, ln = _pick(r, "thickness"), _pick(r, "width"), _pick(r, "length")
+        if name in (None, "") or t is None or w is None or ln is None:
+            raise ConfigError(f"第 {i} 行缺少 name/thickness/width/length：{r!r}")
+        d = _pick(r, "density")
+        try:
+            cols["names"].append(str(name).strip())
+            cols["thickness"].append(float(t))
+            cols["width"].append(float(w))
+            cols["length"].append(float(ln))
+            cols["density"].append(float(d) if d is not None else float(default_density))
+        except (TypeError, ValueError):
+            raise ConfigError(f"第 {i} 行尺寸不是数字：{r!r}")
+    return cols
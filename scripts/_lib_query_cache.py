@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from _lib_cache_manager import record_use
+from _lib_digest import sha256_text
+from _lib_output import read_json, write_json
+
+DEFAULT_TTL_SECONDS = 10 * 60
+# With --watch-modified the table watermarks decide freshness; the TTL only bounds how
+# long deletions (invisible to MAX(modified)) can go unnoticed.
+WATCH_TTL_SECONDS = 24 * 3600
+
+_READ_ONLY_RE = re.compile(r"^\s*(select|with|show|describe|desc|explain)\b", re.IGNORECASE)
+# Statements that start like a read but write (`WITH ... DELETE`, `SELECT ... INTO OUTFILE`).
+# Checked with literals blanked out; a false positive only disables caching/export.
+_WRITE_RE = re.compile(
+    r"\b(insert|update|delete|replace\s+into|into\s+(?:outfile|dumpfile)|load\s+data|create|drop|alter|truncate|rename|grant|revoke|call|handler)\b",
+    re.IGNORECASE,
+)
+_FROM_RE = re.compile(r"\b(?:from|join)\b", re.IGNORECASE)
+_IDENT_RE = re.compile(r"\s*(?:`((?:[^`]|``)+)`|([A-Za-z_][\w$]*))")
+# Words that end a table reference (so they are not taken for an alias).
+_NOT_ALIAS = frozenset(
+    "where join inner left right cross natural straight_join on using group order limit having union "
+    "for lock window force use ignore partition full outer into procedure except intersect".split()
+)
+
+
+def normalize_sql(sql: str, blank: str = "") -> str:
+    """
+    Cache-key form of a statement: comments dropped, whitespace runs collapsed and a
+    trailing `;` removed, all outside quoted literals/identifiers (which are kept verbatim;
+    those opened by a quote char in `blank` become `?`, for keyword scans).
+    """
+    out: List[str] = []
+    i, n = 0, len(sql)
+    pending_space = False
+    while i < n:
+        ch = sql[i]
+        if ch in ("'", '"', "`"):
+            j = i + 1
+            while j < n:
+                if sql[j] == "\\" and ch != "`":
+                    j += 2
+                    continue
+                if sql[j] == ch:
+                    if j + 1 < n and sql[j + 1] == ch:  # doubled quote escape
+                        j += 2
+                        continue
+                    break
+                j += 1
+            token = "?" if ch in blank else sql[i : j + 1]
+            i = j + 1
+        elif sql.startswith("--", i) or ch == "#":
+            j = sql.find("\n", i)
+            i = n if j < 0 else j
+            pending_space = True
+            continue
+        elif sql.startswith("/*", i):
+            j = sql.find("*/", i + 2)
+            i = n if j < 0 else j + 2
+            pending_space = True
+            continue
+        elif ch.isspace():
+            pending_space = True
+            i += 1
+            continue
+        else:
+            token = ch
+            i += 1
+        if pending_space and out:
+            out.append(" ")
+        pending_space = False
+        out.append(token)
+    return "".join(out).rstrip(";").rstrip()
+
+
+def is_read_only(sql: str) -> bool:
+    bare = normalize_sql(sql, blank="'\"`")
+    return bool(_READ_ONLY_RE.match(bare)) and not _WRITE_RE.search(bare)
+
+
+def query_key(sql: str, limit: int) -> str:
+    return sha256_text(f"{normalize_sql(sql)}\n{int(limit)}")
+
+
+def tables_in(sql: str) -> Optional[List[str]]:
+    """
+    Frappe tables (`tab...`) referenced after FROM / JOIN (comma lists included), in
+    first-seen order. None when the references cannot be read with confidence (no table,
+    a non-`tab` table, or a FROM not followed by a table name), so callers fall back to
+    TTL-only freshness instead of watching an incomplete set.
+    """
+    text = normalize_sql(sql, blank="'\"")
+    seen: List[str] = []
+    for m in _FROM_RE.finditer(text):
+        pos = m.end()
+        if text[pos:].lstrip().startswith("("):
+            continue  # derived table / subquery: its own FROM is visited separately
+        while True:
+            t = _IDENT_RE.match(text, pos)
+            if not t:
+                return None
+            name = t.group(1).replace("``", "`") if t.group(1) else t.group(2)
+            if not name.startswith("tab"):
+                return None
+            if name not in seen:
+                seen.append(name)
+            pos = t.end()
+            # Optional alias: `AS a`, or a bare word that is not a clause keyword.
+            a = re.match(r"\s+(?:as\s+)?(?:`(?:[^`]|``)+`|([A-Za-z_][\w$]*))", text[pos:], re.IGNORECASE)
+            if a and (a.group(1) is None or a.group(1).lower() not in _NOT_ALIAS):
+                pos += a.end()
+            comma = re.match(r"\s*,", text[pos:])
+            if not comma:
+                break
+            pos += comma.end()
+    return seen or None
+
+
+def watermark_sql(tables: List[str]) -> str:
+    """One round-trip for all watermarks: SELECT (SELECT MAX(modified) FROM `tabA`) AS w0, ..."""
+    cols = ", ".join(f"(SELECT MAX(modified) FROM `{t}`) AS w{i}" for i, t in enumerate(tables))
+    return f"SELECT {cols}"
+
+
+def parse_watermarks(tables: List[str], rows: Any) -> Optional[Dict[str, str]]:
+    if not isinstance(rows, list) or not rows or not isinstance(rows[0], dict):
+        return None
+    return {t: str(rows[0].get(f"w{i}")) for i, t in enumerate(tables)}
+
+
+def is_cacheable(parsed: Any) -> bool:
+    """Only successful results are cached (an error today may be fixed by the next run)."""
+    if isinstance(parsed, dict):
+        return parsed.get("success") is not False and not parsed.get("error")
+    return isinstance(parsed, list)
+
+
+class QueryCache:
+    """
+    cache/<env>/queries/<sha256>.json.gz, one entry per (normalized SQL, limit):
+
+      {"key", "sql", "limit", "created_at", "watermarks": {table: max(modified)} | null, "response"}
+
+    Entries are written atomically; size and eviction are handled by _lib_cache_manager
+    (kind `query_results`).
+    """
+
+    def __init__(self, cache_root: Path, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        self.cache_root = cache_root
+        self.dir = cache_root / "queries"
+        self.ttl_seconds = ttl_seconds
+
+    def path_for(self, key: str) -> Path:
+        return self.dir / f"{key}.json.gz"
+
+    def get(self, key: str, watermarks: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """The entry if it is younger than the TTL and (when given) was stored at the same watermarks."""
+        p = self.path_for(key)
+        if not p.exists():
+            return None
+        try:
+            entry = read_json(p)
+        except Exception:
+            return None
+        if not isinstance(entry, dict) or entry.get("key") != key:
+            return None
+        age = int(time.time() - float(entry.get("created_at") or 0))
+        if age > self.ttl_seconds:
+            return None
+        if watermarks is not None and entry.get("watermarks") != watermarks:
+            return None
+        record_use(self.cache_root, "query_results", p)
+        return {**entry, "age_seconds": age}
+
+    def put(self, key: str, sql: str, limit: int, response: Any, watermarks: Optional[Dict[str, str]] = None) -> Path:
+        p = self.path_for(key)
+        entry = {
+            "key": key,
+            "sql": normalize_sql(sql),
+            "limit": int(limit),
+            "created_at": int(time.time()),
+            "watermarks": watermarks,
+            "response": response,
+        }
+        write_json(p, entry, indent=None)
+        return p
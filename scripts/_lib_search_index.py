@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from _lib_digest import sha256_file
+
+# ASCII words (snake_case also indexed by part) and runs of CJK ideographs / kana / hangul.
+_WORD_RE = re.compile(r"[a-z0-9_]+|[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased ASCII words (plus the parts of snake_case words) and CJK bigrams.
+    A single CJK character on its own is kept as a unigram so one-char queries still match.
+    """
+    out: List[str] = []
+    for m in _WORD_RE.finditer(text.lower()):
+        w = m.group(0)
+        if _CJK_RE.match(w):
+            if len(w) == 1:
+                out.append(w)
+            else:
+                out.extend(w[i : i + 2] for i in range(len(w) - 1))
+        else:
+            w = w.strip("_")
+            if not w:
+                continue
+            out.append(w)
+            if "_" in w:
+                out.extend(p for p in w.split("_") if p)
+    return out
+
+
+def _bundle_docs(cache_root: Path) -> List[Dict[str, Any]]:
+    """One document per bundle.md section, located via the byte offsets in cursor/index.json."""
+    index_path = cache_root / "cursor" / "index.json"
+    bundle_path = cache_root / "cursor" / "bundle.md"
+    if not index_path.exists() or not bundle_path.exists():
+        return []
+    idx = json.loads(index_path.read_text(encoding="utf-8"))
+    raw = bundle_path.read_bytes()
+    docs = []
+    for section in ("commands", "rules", "skills"):
+        for e in idx.get(section) or []:
+            off, ln = e.get("bundle_offset"), e.get("bundle_len")
+            if not isinstance(off, int) or not isinstance(ln, int):
+                continue
+            docs.append(
+                {
+                    "kind": section[:-1],
+                    "title": e.get("path"),
+                    "file": "cursor/bundle.md",
+                    "offset": off,
+                    "length": ln,
+                    "text": raw[off : off + ln].decode("utf-8", errors="replace"),
+                }
+            )
+    return docs
+
+
+def _tool_docs(cache_root: Path) -> List[Dict[str, Any]]:
+    """One document per tool in mcp/tools_list.json; offsets point at the tool's JSON object in that file."""
+    tools_path = cache_root / "mcp" / "tools_list.json"
+    if not tools_path.exists():
+        return []
+    raw = tools_path.read_bytes()
+    obj = json.loads(raw.decode("utf-8"))
+    result = obj.get("result") if isinstance(obj, dict) else None
+    tools = result.get("tools") if isinstance(result, dict) else None
+    if not isinstance(tools, list):
+        return []
+    docs = []
+    cursor = 0
+    for t in tools:
+        if not isinstance(t, dict):
+            continue
+        # The cache file is written with indent=2 and tools sit 3 levels deep: search for the
+        # same serialization to recover the byte range (None if the layout differs).
+        needle = json.dumps(t, ensure_ascii=False, indent=2, default=str).replace("\n", "\n      ").encode("utf-8")
+        pos = raw.find(needle, cursor)
+        off, ln = (pos, len(needle)) if pos >= 0 else (None, None)
+        if pos >= 0:
+            cursor = pos + len(needle)
+        schema = t.get("inputSchema") or {}
+        props = schema.get("properties") if isinstance(schema, dict) else None
+        parts = [str(t.get("name") or ""), str(t.get("description") or "")]
+        if isinstance(props, dict):
+            for k, v in props.items():
+                parts.append(k)
+                if isinstance(v, dict) and v.get("description"):
+                    parts.append(str(v["description"]))
+        docs.append(
+            {
+                "kind": "tool",
+                "title": t.get("name"),
+                "file": "mcp/tools_list.json",
+                "offset": off,
+                "length": ln,
+                "text": "\n".join(parts),
+            }
+        )
+    return docs
+
+
+def source_signature(cache_root: Path) -> Dict[str, Optional[str]]:
+    sig: Dict[str, Optional[str]] = {}
+    for rel in ("cursor/index.json", "cursor/bundle.md", "mcp/tools_list.json"):
+        p = cache_root / rel
+        sig[rel] = sha256_file(p) if p.exists() else None
+    return sig
+
+
+def build_index(cache_root: Path) -> Dict[str, Any]:
+    docs = _bundle_docs(cache_root) + _tool_docs(cache_root)
+    postings: Dict[str, List[List[int]]] = {}
+    meta = []
+    for i, d in enumerate(docs):
+        tf = Counter(tokenize(d.pop("text")))
+        d["tokens"] = sum(tf.values())
+        meta.append(d)
+        for tok, n in tf.items():
+            postings.setdefault(tok, []).append([i, n])
+    return {
+        "version": INDEX_VERSION,
+        "sources": source_signature(cache_root),
+        "docs": meta,
+        "avg_tokens": (sum(d["tokens"] for d in meta) / len(meta)) if meta else 0.0,
+        "postings": postings,
+    }
+
+
+def search(index: Dict[str, Any], query: str, k: int = 5, kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """BM25 over the inverted index; returns doc metadata with `score` and `matched` terms."""
+    docs = index.get("docs") or []
+    n_docs = len(docs)
+    avg = float(index.get("avg_tokens") or 1.0)
+    postings = index.get("postings") or {}
+    scores: Dict[int, float] = {}
+    matched: Dict[int, set] = {}
+    for tok in set(tokenize(query)):
+        plist = postings.get(tok)
+        if not plist:
+            continue
+        idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+        for doc_id, tf in plist:
+            d = docs[doc_id]
+            if kinds and d.get("kind") not in kinds:
+                continue
+            norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * d.get("tokens", 0) / avg))
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+            matched.setdefault(doc_id, set()).add(tok)
+    ranked: List[Tuple[int, float]] = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[: max(1, k)]
+    return [{**docs[i], "score": round(s, 4), "matched": sorted(matched[i])} for i, s in ranked]
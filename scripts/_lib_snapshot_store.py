@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from _lib_config import ConfigError, repo_root
+from _lib_digest import sha256_bytes, sha256_file
+from _lib_output import read_json, write_json
+
+
+# Per-doctype keys of the delta-sync state file (_lib_delta_sync.state_path_for) that change on
+# every run; they are stripped from the stored copy so an unchanged directory stays unchanged.
+# The watermark is kept: a restored snapshot must not claim data newer than it holds.
+VOLATILE_STATE_KEYS = {"_sync_state.json": ("synced_at", "reconciled_at")}
+
+
+def _normalized_state(p: Path, keys: tuple) -> Optional[bytes]:
+    try:
+        state = json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not isinstance(state, dict):
+        return None
+    clean = {k: ({kk: vv for kk, vv in v.items() if kk not in keys} if isinstance(v, dict) else v) for k, v in state.items()}
+    return (json.dumps(clean, ensure_ascii=False, indent=2, sort_keys=True) + "\n").encode("utf-8")
+
+
+def store_root_for(ref_dir: Path) -> Path:
+    """work/<env>/reference -> work/<env>/snapshots/reference."""
+    return ref_dir.parent / "snapshots" / ref_dir.name
+
+
+def default_store_root(env: str) -> Path:
+    return store_root_for(repo_root() / "work" / env / "reference")
+
+
+class SnapshotStore:
+    """
+    Content-addressed history of a reference directory.
+
+      <root>/objects/<sha[:2]>/<sha>        file blobs, keyed by sha256 of their bytes
+      <root>/manifests/<id>.json            {"id", "created_at", "label", "source", "files": {rel: {sha256, bytes}}}
+
+    A snapshot of unchanged files only adds a manifest; diffs compare manifest hashes
+    without reading blobs; restore hardlinks (or copies) blobs back into a directory.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.objects = root / "objects"
+        self.manifests = root / "manifests"
+
+    # -- blobs ------------------------------------------------------------
+    def blob_path(self, sha: str) -> Path:
+        return self.objects / sha[:2] / sha
+
+    def put_bytes(self, data: bytes) -> tuple[str, bool]:
+        sha = sha256_bytes(data)
+        dst = self.blob_path(sha)
+        if dst.exists():
+            return sha, False
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{sha}.tmp-{os.getpid()}")
+        tmp.write_bytes(data)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, dst)
+        return sha, True
+
+    def put_file(self, p: Path) -> tuple[str, bool]:
+        """Store `p` as a blob; returns (sha256, newly_written)."""
+        sha = sha256_file(p)
+        dst = self.blob_path(sha)
+        if dst.exists():
+            return sha, False
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{sha}.tmp-{os.getpid()}")
+        shutil.copyfile(p, tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, dst)
+        return sha, True
+
+    # -- manifests --------------------------------------------------------
+    def list(self) -> List[Dict[str, Any]]:
+        """Manifests, oldest first."""
+        if not self.manifests.exists():
+            return []
+        out = []
+        for p in self.manifests.glob("*.json"):
+            try:
+                m = read_json(p)
+            except Exception:
+                continue
+            if isinstance(m, dict) and m.get("id"):
+                out.append(m)
+        out.sort(key=lambda m: (m.get("created_at") or 0, m["id"]))
+        return out
+
+    def load(self, ref: str) -> Dict[str, Any]:
+        """Resolve an id, a unique id prefix, `latest` or `latest~N`."""
+        items = self.list()
+        if not items:
+            raise ConfigError(f"快照库为空：{self.root}")
+        if ref == "latest" or ref.startswith("latest~"):
+            suffix = ref[len("latest~") :] if "~" in ref else "0"
+            if not (suffix.isascii() and suffix.isdigit()):
+                raise ConfigError(f"无法解析快照引用 {ref!r}：latest~ 后需要非负整数（如 latest~1）")
+            back = int(suffix)
+            if back >= len(items):
+                raise ConfigError(f"只有 {len(items)} 个快照，无法解析 {ref}")
+            return items[-1 - back]
+        hits = [m for m in items if m["id"] == ref] or [m for m in items if m["id"].startswith(ref)]
+        if len(hits) != 1:
+            raise ConfigError(f"快照 {ref!r} {'不存在' if not hits else '不唯一'}（可用 list 查看）")
+        return hits[0]
+
+    def save(self, src_dir: Path, label: str = "", skip_unchanged: bool = True) -> Dict[str, Any]:
+        """
+        Snapshot every regular file under `src_dir` (hidden/temp files excluded; sync state
+        files are stored without their per-run timestamps, see VOLATILE_STATE_KEYS).
+        Returns {"manifest", "new_blobs", "new_bytes", "unchanged"}.
+        """
+        if not src_dir.is_dir():
+            raise ConfigError(f"目录不存在：{src_dir}")
+        files: Dict[str, Dict[str, Any]] = {}
+        new_blobs = new_bytes = 0
+        for p in sorted(src_dir.rglob("*")):
+            rel = p.relative_to(src_dir).as_posix()
+            if not p.is_file() or any(part.startswith(".") for part in rel.split("/")):
+                continue
+            data = _normalized_state(p, VOLATILE_STATE_KEYS[p.name]) if p.name in VOLATILE_STATE_KEYS else None
+            if data is not None:
+                sha, fresh = self.put_bytes(data)
+                size = len(data)
+            else:
+                sha, fresh = self.put_file(p)
+                size = p.stat().st_size
+            files[rel] = {"sha256": sha, "bytes": size}
+            if fresh:
+                new_blobs += 1
+                new_bytes += size
+
+        items = self.list()
+        if skip_unchanged and items and items[-1].get("files") == files:
+            return {"manifest": items[-1], "new_blobs": 0, "new_bytes": 0, "unchanged": True}
+
+        now = time.time()
+        sid = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"-{int(now * 1000) % 1000:03d}"
+        manifest = {"id": sid, "created_at": now, "label": label, "source": str(src_dir), "files": files}
+        write_json(self.manifests / f"{sid}.json", manifest)
+        return {"manifest": manifest, "new_blobs": new_blobs, "new_bytes": new_bytes, "unchanged": False}
+
+    @staticmethod
+    def diff(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, List[str]]:
+        fa, fb = a.get("files") or {}, b.get("files") or {}
+        return {
+            "added": sorted(set(fb) - set(fa)),
+            "removed": sorted(set(fa) - set(fb)),
+            "changed": sorted(k for k in set(fa) & set(fb) if fa[k].get("sha256") != fb[k].get("sha256")),
+            "unchanged": sorted(k for k in set(fa) & set(fb) if fa[k].get("sha256") == fb[k].get("sha256")),
+        }
+
+    def restore(self, manifest: Dict[str, Any], dest: Path, link: bool = False) -> int:
+        """
+        Materialize a snapshot into `dest` (files not in the snapshot are left alone).
+        `link=True` hardlinks blobs (falls back to copying across filesystems); linked
+        files are read-only, so edit them only via write-to-temp + rename.
+        """
+        n = 0
+        for rel, meta in sorted((manifest.get("files") or {}).items()):
+            blob = self.blob_path(str(meta.get("sha256")))
+            if not blob.exists():
+                raise ConfigError(f"快照 {manifest.get('id')} 缺少 blob：{rel} -> {blob}")
+            out = dest / rel
+            out.parent.mkdir(parents=True, exist_ok=True)
+            tmp = out.with_name(f".{out.name}.tmp-{os.getpid()}")
+            if link:
+                try:
+                    os.link(blob, tmp)
+                except OSError:
+                    shutil.copyfile(blob, tmp)
+            else:
+                shutil.copyfile(blob, tmp)
+                os.chmod(tmp, 0o644)
+            os.replace(tmp, out)
+            n += 1
+        return n
+
+    def prune(self, keep: int) -> Dict[str, int]:
+        """Keep the newest `keep` manifests and delete blobs no longer referenced."""
+        items = self.list()
+        drop = items[: max(0, len(items) - max(1, keep))]
+        for m in drop:
+            (self.manifests / f"{m['id']}.json").unlink(missing_ok=True)
+        live = {f.get("sha256") for m in self.list() for f in (m.get("files") or {}).values()}
+        freed = removed = 0
+        if self.objects.exists():
+            for p in self.objects.glob("*/*"):
+                if p.is_file() and p.name not in live:
+                    freed += p.stat().st_size
+                    os.chmod(p, 0o644)  # blobs are read-only; Windows refuses to unlink those
+                    p.unlink()
+                    removed += 1
+        return {"manifests_removed": len(drop), "blobs_removed": removed, "bytes_freed": freed}
+
+    def stats(self) -> Dict[str, Any]:
+        blobs = [p for p in self.objects.glob("*/*") if p.is_file()] if self.objects.exists() else []
+        items = self.list()
+        logical = sum(int(f.get("bytes") or 0) for m in items for f in (m.get("files") or {}).values())
+        return {
+            "snapshots": len(items),
+            "blobs": len(blobs),
+            "stored_bytes": sum(p.stat().st_size for p in blobs),
+            "logical_bytes": logical,
+        }
+
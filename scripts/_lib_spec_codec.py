@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+from typing import Any, Dict, List
+
+from _lib_config import ConfigError
+
+SPEC_ENCODINGS = ("columnar", "columnar-gz", "repr")
+
+
+def encode_items_columnar(items: List[Any]) -> Dict[str, Any]:
+    """
+    Encode `[{"params": {...}}, ...]` as one header of parameter names plus value rows.
+
+    Missing params are encoded as None; the decoder drops them again, so the server
+    sees the same `params` dicts (an explicit None is treated as "missing" by the
+    executor anyway).
+    """
+    columns: List[str] = []
+    col_idx: Dict[str, int] = {}
+    for it in items:
+        params = it.get("params") if isinstance(it, dict) else None
+        if not isinstance(params, dict):
+            continue
+        for k in params.keys():
+            k = str(k)
+            if k not in col_idx:
+                col_idx[k] = len(columns)
+                columns.append(k)
+
+    rows: List[List[Any]] = []
+    for it in items:
+        params = it.get("params") if isinstance(it, dict) else None
+        row: List[Any] = [None] * len(columns)
+        if isinstance(params, dict):
+            for k, v in params.items():
+                row[col_idx[str(k)]] = v
+        rows.append(row)
+    return {"v": 1, "columns": columns, "rows": rows}
+
+
+def decode_items_columnar(obj: Dict[str, Any]) -> List[dict]:
+    columns = obj.get("columns") or []
+    out: List[dict] = []
+    for row in obj.get("rows") or []:
+        out.append({"params": {k: v for k, v in zip(columns, row) if v is not None}})
+    return out
+
+
+def _dumps_compact(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def spec_body(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """`spec` with `items` replaced by `items_columnar` (JSON-ready, e.g. for a REST body)."""
+    body = {k: v for k, v in spec.items() if k != "items"}
+    body["items_columnar"] = encode_items_columnar(list(spec.get("items") or []))
+    return body
+
+
+def pack_spec(spec: Dict[str, Any], encoding: str) -> str:
+    """
+    Return a Python source expression that evaluates (server-side) to `spec`.
+
+    - repr:        legacy `{...!r}` literal, items repeat every param key
+    - columnar:    JSON string literal, items stored as header + rows
+    - columnar-gz: same JSON, gzip + base64 wrapped (smallest on the wire)
+
+    The expression relies on `_decode_spec` from SERVER_DECODE_SNIPPET.
+    """
+    if encoding not in SPEC_ENCODINGS:
+        raise ConfigError(f"不支持的 spec 编码：{encoding}（可选：{', '.join(SPEC_ENCODINGS)}）")
+    if encoding == "repr":
+        return repr(spec)
+
+    text = _dumps_compact(spec_body(spec))
+    if encoding == "columnar":
+        return f"_decode_spec({text!r}, '')"
+    packed = base64.b64encode(gzip.compress(text.encode("utf-8"), mtime=0)).decode("ascii")
+    return f"_decode_spec({packed!r}, 'gz')"
+
+
+def unpack_spec_text(packed: str, wrap: str) -> Dict[str, Any]:
+    """Client-side mirror of `_decode_spec` (used by the benchmark and for local checks)."""
+    text = packed
+    if wrap == "gz":
+        text = gzip.decompress(base64.b64decode(packed)).decode("utf-8")
+    spec = json.loads(text)
+    if "items_columnar" in spec:
+        spec["items"] = decode_items_columnar(spec.pop("items_columnar"))
+    return spec
+
+
+# NOTE: run_python_code forbids import statements; the decoder only uses json/frappe
+# and builtins. base64 is decoded by hand; gzip relies on frappe.utils.gzip_decompress.
+SERVER_DECODE_SNIPPET = '''
+def _b64decode(s):
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    lut = {}
+    for i, ch in enumerate(alphabet):
+        lut[ch] = i
+    out = []
+    buf = 0
+    bits = 0
+    for ch in s.rstrip("="):
+        buf = (buf << 6) | lut[ch]
+        bits = bits + 6
+        if bits >= 8:
+            bits = bits - 8
+            out.append((buf >> bits) & 0xFF)
+            buf = buf & ((1 << bits) - 1)
+    return bytes(out)
+
+def _decode_spec(packed, wrap):
+    text = packed
+    if wrap == "gz":
+        gunzip = getattr(getattr(frappe, "utils", None), "gzip_decompress", None)
+        if gunzip is None:
+            frappe.throw("spec encoding columnar-gz needs frappe.utils.gzip_decompress; use --spec-encoding columnar")
+        text = gunzip(_b64decode(packed))
+        if not isinstance(text, str):
+            text = text.decode("utf-8")
+    spec = json.loads(text)
+    col = spec.pop("items_columnar", None)
+    if col is not None:
+        columns = col.get("columns") or []
+        items = []
+        for row in col.get("rows") or []:
+            params = {}
+            for k, v in zip(columns, row):
+                if v is not None:
+                    params[k] = v
+            items.append({"params": params})
+        spec["items"] = items
+    return spec
+'''
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import json
+import mmap
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from _lib_config import repo_root
+from _lib_digest import sha256_file, sha256_text
+from _lib_lock import FileLock
+from _lib_output import read_json, write_bytes, write_json
+
+INDEX_VERSION = 1
+DEFAULT_TOOLS_TTL_SECONDS = 24 * 3600
+
+
+def cache_root_for(env: str) -> Path:
+    return repo_root() / "cache" / env
+
+
+def tools_list_path(cache_root: Path) -> Path:
+    return cache_root / "mcp" / "tools_list.json"
+
+
+def tool_index_path(cache_root: Path) -> Path:
+    return cache_root / "mcp" / "tools_index.bin"
+
+
+def tools_meta_path(cache_root: Path) -> Path:
+    return cache_root / "mcp" / "meta.json"
+
+
+def tools_from_response(resp: Any) -> List[dict]:
+    result = resp.get("result") if isinstance(resp, dict) else None
+    tools = result.get("tools") if isinstance(result, dict) else None
+    return [t for t in tools if isinstance(t, dict) and t.get("name")] if isinstance(tools, list) else []
+
+
+def tools_fingerprint(obj: Any) -> str:
+    return sha256_text(json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str))
+
+
+def is_tools_response(resp: Any) -> bool:
+    """A successful tools/list response (JSON-RPC errors and empty lists never replace a cache)."""
+    return isinstance(resp, dict) and not resp.get("error") and bool(tools_from_response(resp))
+
+
+def _load_meta(cache_root: Path) -> Dict[str, Any]:
+    try:
+        obj = read_json(tools_meta_path(cache_root))
+    except Exception:
+        return {}
+    return obj if isinstance(obj, dict) else {}
+
+
+def write_tools_cache(
+    cache_root: Path,
+    tools_resp: dict,
+    env: str,
+    endpoint: str,
+    ttl_seconds: Optional[int] = None,
+    init: Optional[dict] = None,
+) -> bool:
+    """
+    Store a validated tools/list response with its meta.json; returns True when the content changed.
+
+    Identical content only bumps `validated_at`, so readers keep their mmap'ed index and
+    nothing downstream is rebuilt. The caller holds the "mcp_tools" lock.
+    """
+    tools_path = tools_list_path(cache_root)
+    old_meta = _load_meta(cache_root)
+    fp = tools_fingerprint(tools_resp)
+    old_fp = old_meta.get("tools_sha256")
+    if not old_fp and tools_path.exists():
+        try:
+            old_fp = tools_fingerprint(read_json(tools_path))
+        except Exception:
+            old_fp = None
+    changed = fp != old_fp or not tools_path.exists()
+    now = int(time.time())
+    if changed:
+        if init is not None:
+            write_json(cache_root / "mcp" / "initialize.json", init)
+        write_json(tools_path, tools_resp)
+        build_tool_index(cache_root)
+    write_json(
+        tools_meta_path(cache_root),
+        {
+            "generated_at": now if changed else old_meta.get("generated_at", now),
+            "validated_at": now,
+            "ttl_seconds": int(ttl_seconds or old_meta.get("ttl_seconds") or DEFAULT_TOOLS_TTL_SECONDS),
+            "tools_sha256": fp,
+            "env": env,
+            "mcp_endpoint": endpoint,
+            "note": "仅缓存工具元数据（不含 token）",
+        },
+    )
+    return changed
+
+
+def build_tool_index(cache_root: Path) -> Optional[Path]:
+    """
+    Write mcp/tools_index.bin from mcp/tools_list.json:
+
+      line 1: header JSON {"version", "source": {sha256, size, mtime_ns}, "entries": {name: [offset, length]}}
+      rest:   one compact JSON object per tool; offsets are relative to the end of line 1
+
+    Lookups mmap the file, parse the header and decode only the requested slice.
+    """
+    src = tools_list_path(cache_root)
+    if not src.exists():
+        return None
+    st = src.stat()
+    tools = tools_from_response(json.loads(src.read_text(encoding="utf-8")))
+    body = bytearray()
+    entries: Dict[str, List[int]] = {}
+    for t in tools:
+        blob = json.dumps(t, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        entries[str(t["name"])] = [len(body), len(blob)]
+        body += blob + b"\n"
+    header = {
+        "version": INDEX_VERSION,
+        "source": {"sha256": sha256_file(src), "size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "entries": entries,
+    }
+    out = tool_index_path(cache_root)
+    write_bytes(out, json.dumps(header, ensure_ascii=True, separators=(",", ":")).encode("ascii") + b"\n" + bytes(body))
+    return out
+
+
+class ToolIndex:
+    def __init__(self, path: Path, header: dict, body_start: int):
+        self.path = path
+        self.header = header
+        self._body_start = body_start
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["ToolIndex"]:
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            nl = mm.find(b"\n")
+            if nl < 0:
+                return None
+            try:
+                header = json.loads(mm[:nl].decode("ascii"))
+            except Exception:
+                return None
+        if not isinstance(header, dict) or header.get("version") != INDEX_VERSION:
+            return None
+        return cls(path, header, nl + 1)
+
+    def names(self) -> List[str]:
+        return sorted((self.header.get("entries") or {}).keys())
+
+    def __contains__(self, name: str) -> bool:
+        return name in (self.header.get("entries") or {})
+
+    def get(self, name: str) -> Optional[dict]:
+        ent = (self.header.get("entries") or {}).get(name)
+        if not ent:
+            return None
+        off, ln = int(ent[0]) + self._body_start, int(ent[1])
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return json.loads(mm[off : off + ln].decode("utf-8"))
+
+
+def open_tool_index(cache_root: Path) -> Optional[ToolIndex]:
+    """
+    Return an up-to-date index for the cached tools list (None when there is no cache).
+    Rebuilds only when tools_list.json changed: size/mtime first, sha256 when those moved.
+    """
+    src = tools_list_path(cache_root)
+    if not src.exists():
+        return None
+    idx = ToolIndex.load(tool_index_path(cache_root))
+    if idx is not None:
+        meta = idx.header.get("source") or {}
+        st = src.stat()
+        if meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+            return idx
+        if meta.get("sha256") == sha256_file(src):
+            return idx
+    path = build_tool_index(cache_root)
+    return ToolIndex.load(path) if path else None
+
+
+def save_tools_list(cache_root: Path, tools_resp: Any, env: str, endpoint: str) -> Optional[ToolIndex]:
+    """
+    Store a live tools/list response (list, index and meta.json, as cache_refresh.py does).
+    Error responses are not saved; returns None so the caller can report the live failure.
+    """
+    if not is_tools_response(tools_resp):
+        return None
+    # Same lock as cache_refresh.py's tools refresh, so the list, its index and meta stay paired.
+    with FileLock.for_key(cache_root, "mcp_tools"):
+        write_tools_cache(cache_root, tools_resp, env, endpoint)
+    return ToolIndex.load(tool_index_path(cache_root))
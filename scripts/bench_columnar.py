@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from _lib_columnar import ColumnTable
+from _lib_config import ConfigError
+from _lib_output import iter_rows
+
+
+def _synthetic_lines(n: int, seed: int) -> List[str]:
+    """Item-like rows as JSON text, so each parsed value is a fresh object (as with real responses)."""
+    rnd = random.Random(seed)
+    groups = [f"钢板-{i:02d}" for i in range(30)]
+    uoms = ["千克", "张", "米", "件", "吨"]
+    lines = []
+    for i in range(n):
+        lines.append(
+            json.dumps(
+                {
+                    "name": f"ITEM-{i:07d}",
+                    "item_code": f"ITEM-{i:07d}",
+                    "item_name": f"Q235B 钢板 {rnd.choice([2, 3, 4, 5, 6, 8, 10])}*{rnd.choice([1250, 1500, 1800])}",
+                    "item_group": rnd.choice(groups),
+                    "stock_uom": rnd.choice(uoms),
+                    "custom_param_hash": f"{rnd.getrandbits(128):032x}",
+                    "disabled": 0,
+                    "modified": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00.000000",
+                },
+                ensure_ascii=False,
+            )
+        )
+    return lines
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, int, float]:
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    obj = build()
+    dt = time.perf_counter() - t0
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current, dt
+
+
+def _scan(rows: Any) -> Tuple[int, float]:
+    t0 = time.perf_counter()
+    n = sum(1 for r in rows if r.get("stock_uom") == "千克")
+    return n, time.perf_counter() - t0
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(description="对比行存（list[dict]）与列存（ColumnTable）的常驻内存与遍历耗时（本地离线基准）。")
+    ap.add_argument("--rows", type=int, default=100000, help="合成 Item 行数（默认 100000）")
+    ap.add_argument("--from-file", default="", help="改用真实导出文件（.ndjson/.json，可加 .gz/.zst）")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    if args.from_file.strip():
+        path = Path(args.from_file.strip())
+        lines = [json.dumps(r, ensure_ascii=False, default=str) for r in iter_rows(path)]
+        source = str(path)
+    else:
+        if args.rows <= 0:
+            raise ConfigError("--rows 必须为正数。")
+        lines = _synthetic_lines(args.rows, args.seed)
+        source = "synthetic"
+
+    dicts, dict_bytes, dict_s = _measure(lambda: [json.loads(l) for l in lines])
+    table, table_bytes, table_s = _measure(lambda: ColumnTable.from_rows(json.loads(l) for l in lines))
+    if len(table) != len(dicts) or table.row(len(dicts) - 1) != dicts[-1]:
+        raise ConfigError("列存往返结果不一致。")
+    hits_d, scan_d = _scan(dicts)
+    hits_t, scan_t = _scan(table)
+    if hits_d != hits_t:
+        raise ConfigError("列存遍历结果不一致。")
+
+    interned = table.interned_fields()
+    results: List[Dict[str, Any]] = [
+        {"repr": "list[dict]", "bytes": dict_bytes, "build_s": dict_s, "scan_s": scan_d},
+        {"repr": "ColumnTable", "bytes": table_bytes, "build_s": table_s, "scan_s": scan_t},
+    ]
+    print(f"SOURCE={source}  ROWS={len(dicts)}  FIELDS={len(table.fields)}  INTERNED={','.join(interned) or '-'}")
+    print(f"{'repr':<12} {'bytes':>14} {'B/row':>8} {'ratio':>7} {'build_s':>9} {'scan_s':>8}")
+    for r in results:
+        print(
+            f"{r['repr']:<12} {r['bytes']:>14} {r['bytes'] / max(1, len(dicts)):>8.0f} {r['bytes'] / max(1, dict_bytes):>7.3f}"
+            f" {r['build_s']:>9.2f} {r['scan_s']:>8.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
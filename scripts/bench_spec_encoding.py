@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from _lib_config import ConfigError
+from _lib_spec_codec import SERVER_DECODE_SNIPPET, SPEC_ENCODINGS, pack_spec
+
+
+def _synthetic_items(n: int, seed: int) -> List[dict]:
+    rnd = random.Random(seed)
+    materials = ["Q235B", "Q345B", "Q355B", "304", "316L"]
+    thickness = [2, 3, 4, 5, 6, 8, 10, 12, 14, 16, 20, 25, 30]
+    widths = [1250, 1500, 1800, 2000, 2200]
+    lengths = [2500, 3000, 6000, 8000, 12000]
+    return [
+        {
+            "params": {
+                "材质": rnd.choice(materials),
+                "厚度": rnd.choice(thickness),
+                "宽度": rnd.choice(widths),
+                "长度": rnd.choice(lengths),
+            }
+        }
+        for _ in range(n)
+    ]
+
+
+def _throw(msg: str) -> None:
+    raise RuntimeError(msg)
+
+
+def _server_globals() -> Dict[str, Any]:
+    # Mimic what run_python_code exposes to the spec decoder: json + frappe.utils.gzip_decompress.
+    frappe = SimpleNamespace(utils=SimpleNamespace(gzip_decompress=gzip.decompress), throw=_throw)
+    return {"json": json, "frappe": frappe}
+
+
+def _parse_on_server(spec_src: str) -> dict:
+    ns = _server_globals()
+    exec(compile(SERVER_DECODE_SNIPPET + "\nspec = " + spec_src + "\n", "<spec>", "exec"), ns)
+    return ns["spec"]
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(description="对比批量 spec 的传输编码：payload 字节数与服务端解析耗时（本地离线基准）。")
+    ap.add_argument("--items", type=int, default=10000, help="合成 items 数量（默认 10000）")
+    ap.add_argument("--repeat", type=int, default=3, help="每种编码解析重复次数，取最小值（默认 3）")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    if args.items <= 0:
+        raise ConfigError("--items 必须为正数。")
+
+    items = _synthetic_items(args.items, args.seed)
+    spec = {"profile": "steel_plate_standard", "mode": "upsert", "dry_run": True, "items": items}
+    expected = [{"params": it["params"]} for it in items]
+
+    rows = []
+    base_bytes = 0
+    for enc in ("repr",) + tuple(e for e in SPEC_ENCODINGS if e != "repr"):
+        t0 = time.perf_counter()
+        src = pack_spec(spec, enc)
+        encode_ms = (time.perf_counter() - t0) * 1000
+        size = len(src.encode("utf-8"))
+        if enc == "repr":
+            base_bytes = size
+
+        best = None
+        decoded: Any = None
+        for _ in range(max(1, args.repeat)):
+            t0 = time.perf_counter()
+            decoded = _parse_on_server(src)
+            dt = (time.perf_counter() - t0) * 1000
+            best = dt if best is None else min(best, dt)
+        if decoded.get("items") != expected:
+            raise ConfigError(f"编码 {enc} 往返结果不一致。")
+        rows.append((enc, size, encode_ms, best or 0.0))
+
+    print(f"ITEMS={args.items}")
+    print(f"{'encoding':<12} {'bytes':>12} {'ratio':>7} {'encode_ms':>10} {'parse_ms':>10}")
+    for enc, size, encode_ms, parse_ms in rows:
+        ratio = (size / base_bytes) if base_bytes else 0.0
+        print(f"{enc:<12} {size:>12} {ratio:>7.3f} {encode_ms:>10.1f} {parse_ms:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
@@ -1,80 +1,37 @@
 from __future__ import annotations
 
 import argparse
-import hashlib
 import json
 import sys
+import threading
 import time
-import urllib.error
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
+from _lib_cache_manager import CacheManager, budget_bytes
 from _lib_config import ConfigError, load_env_config, load_secrets, repo_root
+from _lib_digest import sha256_bytes, sha256_text
+from _lib_lock import DEFAULT_LOCK_TIMEOUT_S, FileLock, LockTimeout
+from _lib_mcp import McpSession
+from _lib_mcp_cache import cache_state, record, release_revalidate_lock
+from _lib_output import write_bytes, write_json, write_text
+from _lib_search_index import INDEX_VERSION, build_index, source_signature
+from _lib_tool_index import is_tools_response, write_tools_cache
 
 
 def _now_ts() -> int:
     return int(time.time())
 
 
-def _sha256_bytes(b: bytes) -> str:
-    return hashlib.sha256(b).hexdigest()
-
-
-def _sha256_text(s: str) -> str:
-    return _sha256_bytes(s.encode("utf-8"))
-
-
 def _read_text(p: Path) -> str:
     return p.read_text(encoding="utf-8", errors="replace")
 
 
 def _write_json(p: Path, obj: Any) -> None:
-    p.parent.mkdir(parents=True, exist_ok=True)
-    p.write_text(json.dumps(obj, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
-
-
-def _write_text(p: Path, s: str) -> None:
-    p.parent.mkdir(parents=True, exist_ok=True)
-    if not s.endswith("\n"):
-        s += "\n"
-    p.write_text(s, encoding="utf-8")
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            raw = resp.read(1024 * 512)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 512)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
+    # Atomic (temp file + rename): readers may be serving these files while we refresh.
+    write_json(p, obj)
 
 
 def _auth_header_from_local_secrets(secrets) -> Optional[str]:
@@ -112,118 +69,211 @@ def _collect_files(root: Path, patterns: List[str]) -> List[Path]:
     return out
 
 
-def _build_cursor_index() -> dict:
-    r = repo_root()
-    cmd_files = _collect_files(r, [".cursor/commands/*.md"])
-    rule_files = _collect_files(r, [".cursor/rules/*.md", ".cursor/rules/*.mdc"])
-    skill_files = _collect_files(r, [".cursor/skills/*/SKILL.md"])
-
-    def entry(p: Path) -> dict:
-        rel = p.relative_to(r).as_posix()
-        txt = _read_text(p)
-        return {
-            "path": rel,
-            "sha256": _sha256_text(txt),
-            "bytes": len(txt.encode("utf-8", errors="replace")),
-        }
+_CURSOR_SECTIONS = {
+    "commands": [".cursor/commands/*.md"],
+    "rules": [".cursor/rules/*.md", ".cursor/rules/*.mdc"],
+    "skills": [".cursor/skills/*/SKILL.md"],
+}
+_BUNDLE_HEADER = "# Cursor Context Bundle (generated)\n> 注意：这是自动生成的缓存文件，用于快速浏览/检索。\n"
 
-    return {
-        "generated_at": _now_ts(),
-        "commands": [entry(p) for p in cmd_files],
-        "rules": [entry(p) for p in rule_files],
-        "skills": [entry(p) for p in skill_files],
-    }
+
+def _bundle_section(rel: str, txt: str) -> str:
+    return f"\n## {rel}\n```text\n" + txt.rstrip("\n") + "\n```\n"
 
 
-def _build_cursor_bundle() -> str:
+def _build_cursor_index(old: Optional[dict], texts: Dict[str, str], force: bool) -> Tuple[dict, int]:
+    """
+    Index entries are (path, size, mtime_ns, sha256, bytes). A file whose size and
+    mtime_ns match the previous index keeps its old entry without being read; others
+    are read once (the text is kept in `texts` for the bundle). Returns (index, hashed).
+    """
     r = repo_root()
-    files = _collect_files(
-        r,
-        [
-            ".cursor/commands/*.md",
-            ".cursor/skills/*/SKILL.md",
-            ".cursor/rules/*.md",
-            ".cursor/rules/*.mdc",
-        ],
-    )
-    parts: List[str] = []
-    parts.append("# Cursor Context Bundle (generated)\n")
-    parts.append("> 注意：这是自动生成的缓存文件，用于快速浏览/检索。\n")
-    for p in files:
-        rel = p.relative_to(r).as_posix()
-        parts.append(f"\n## {rel}\n")
-        parts.append("```text\n")
-        parts.append(_read_text(p).rstrip("\n"))
-        parts.append("\n```\n")
-    return "".join(parts)
+    prev: Dict[str, dict] = {}
+    if isinstance(old, dict) and not force:
+        for section in _CURSOR_SECTIONS:
+            for e in old.get(section) or []:
+                if isinstance(e, dict) and e.get("path"):
+                    prev[e["path"]] = e
+
+    hashed = 0
+    index: dict = {"generated_at": _now_ts()}
+    for section, patterns in _CURSOR_SECTIONS.items():
+        entries: List[dict] = []
+        for p in _collect_files(r, patterns):
+            rel = p.relative_to(r).as_posix()
+            st = p.stat()
+            e = prev.get(rel)
+            if e and e.get("sha256") and e.get("size") == st.st_size and e.get("mtime_ns") == st.st_mtime_ns:
+                entries.append({k: e[k] for k in ("path", "sha256", "bytes", "size", "mtime_ns") if k in e})
+                continue
+            txt = _read_text(p)
+            texts[rel] = txt
+            hashed += 1
+            entries.append(
+                {
+                    "path": rel,
+                    "sha256": sha256_text(txt),
+                    "bytes": len(txt.encode("utf-8", errors="replace")),
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                }
+            )
+        index[section] = entries
+    return index, hashed
+
+
+def _build_cursor_bundle(index: dict, old: Optional[dict], old_bundle: Optional[bytes], texts: Dict[str, str]) -> Tuple[bytes, int]:
+    """
+    Assemble bundle.md in path order. Sections of files whose sha256 is unchanged are
+    copied from the previous bundle by byte offset (recorded in the old index), so only
+    changed files are rendered; every entry gets its new `bundle_offset`/`bundle_len`.
+    Returns (bundle bytes, sections rendered).
+    """
+    r = repo_root()
+    old_slices: Dict[str, Tuple[str, int, int]] = {}
+    if isinstance(old, dict) and old_bundle is not None:
+        for section in _CURSOR_SECTIONS:
+            for e in old.get(section) or []:
+                if isinstance(e, dict) and isinstance(e.get("bundle_offset"), int) and isinstance(e.get("bundle_len"), int):
+                    old_slices[e["path"]] = (e.get("sha256"), e["bundle_offset"], e["bundle_len"])
+
+    entries = [e for section in _CURSOR_SECTIONS for e in index[section]]
+    entries.sort(key=lambda e: str(r / e["path"]).lower())  # same order as _collect_files over all patterns
+    out = bytearray(_BUNDLE_HEADER.encode("utf-8"))
+    rendered = 0
+    for e in entries:
+        rel = e["path"]
+        hit = old_slices.get(rel)
+        if hit and hit[0] == e["sha256"] and old_bundle is not None:
+            chunk = old_bundle[hit[1] : hit[1] + hit[2]]
+        else:
+            if rel not in texts:
+                texts[rel] = _read_text(r / rel)
+            chunk = _bundle_section(rel, texts[rel]).encode("utf-8")
+            rendered += 1
+        e["bundle_offset"] = len(out)
+        e["bundle_len"] = len(chunk)
+        out += chunk
+    return bytes(out), rendered
+
+
+def _content_sig(index: dict) -> dict:
+    return {s: [(e.get("path"), e.get("sha256")) for e in index.get(s, []) if isinstance(e, dict)] for s in _CURSOR_SECTIONS}
+
+
+def _stat_sig(index: dict) -> dict:
+    return {s: [(e.get("path"), e.get("size"), e.get("mtime_ns")) for e in index.get(s, []) if isinstance(e, dict)] for s in _CURSOR_SECTIONS}
 
 
 def refresh_cursor_cache(cache_root: Path, force: bool) -> dict:
     index_path = cache_root / "cursor" / "index.json"
     bundle_path = cache_root / "cursor" / "bundle.md"
 
-    new_index = _build_cursor_index()
-
-    if not force and index_path.exists():
+    old: Optional[dict] = None
+    if index_path.exists():
         try:
-            old = json.loads(_read_text(index_path))
-            if isinstance(old, dict):
-                old_sig = {
-                    "commands": [e.get("sha256") for e in old.get("commands", []) if isinstance(e, dict)],
-                    "rules": [e.get("sha256") for e in old.get("rules", []) if isinstance(e, dict)],
-                    "skills": [e.get("sha256") for e in old.get("skills", []) if isinstance(e, dict)],
-                }
-                new_sig = {
-                    "commands": [e.get("sha256") for e in new_index.get("commands", [])],
-                    "rules": [e.get("sha256") for e in new_index.get("rules", [])],
-                    "skills": [e.get("sha256") for e in new_index.get("skills", [])],
-                }
-                if old_sig == new_sig:
-                    return {"cursor": {"updated": False, "reason": "no changes"}}
+            loaded = json.loads(_read_text(index_path))
+            old = loaded if isinstance(loaded, dict) else None
         except Exception:
-            pass
-
+            old = None
+
+    texts: Dict[str, str] = {}
+    new_index, hashed = _build_cursor_index(old, texts, force)
+    content_same = old is not None and _content_sig(old) == _content_sig(new_index)
+    bundle_ok = bundle_path.exists() and old is not None and bool(old.get("bundle_sha256"))
+
+    if not force and content_same and bundle_ok:
+        if _stat_sig(old) == _stat_sig(new_index):
+            return {"cursor": {"updated": False, "reason": "no changes", "hashed": hashed}}
+        # Only mtimes moved (touch / checkout): refresh the stat cache, bundle stays as is.
+        for section in _CURSOR_SECTIONS:
+            for e_new, e_old in zip(new_index[section], old.get(section) or []):
+                for k in ("bundle_offset", "bundle_len"):
+                    if k in e_old:
+                        e_new[k] = e_old[k]
+        new_index["bundle_sha256"] = old["bundle_sha256"]
+        _write_json(index_path, new_index)
+        return {"cursor": {"updated": False, "reason": "no content changes (stat cache refreshed)", "hashed": hashed}}
+
+    old_bundle: Optional[bytes] = None
+    if not force and bundle_ok:
+        raw = bundle_path.read_bytes()
+        # Offsets are only trustworthy if the bundle is exactly the one the old index describes.
+        if sha256_bytes(raw) == old.get("bundle_sha256"):
+            old_bundle = raw
+    bundle, rendered = _build_cursor_bundle(new_index, old, old_bundle, texts)
+    new_index["bundle_sha256"] = sha256_bytes(bundle)
+
+    write_bytes(bundle_path, bundle)
     _write_json(index_path, new_index)
-    _write_text(bundle_path, _build_cursor_bundle())
-    return {"cursor": {"updated": True, "index": str(index_path), "bundle": str(bundle_path)}}
+    total = sum(len(new_index[s]) for s in _CURSOR_SECTIONS)
+    return {
+        "cursor": {
+            "updated": True,
+            "index": str(index_path),
+            "bundle": str(bundle_path),
+            "hashed": hashed,
+            "sections_rendered": rendered,
+            "sections_reused": total - rendered,
+        }
+    }
 
 
-def refresh_mcp_tools_cache(cache_root: Path, env: str, ttl_seconds: int, force: bool) -> dict:
+def _open_session(env: str, require_secrets: bool = True) -> Optional[McpSession]:
+    """One MCP session for all refresh tasks (None when no auth is configured)."""
     cfg = load_env_config(env)
-    secrets = load_secrets(required=True)
+    secrets = load_secrets(required=require_secrets)
     auth = _auth_header_from_local_secrets(secrets)
-    if not auth:
-        return {"mcp_tools": {"updated": False, "reason": "missing auth (mcp_token or rest_api_key/secret)"}}
+    return McpSession(cfg, auth, timeout=20) if auth else None
+
 
+class _LazySession:
+    """Opens the shared session on first use, so cursor/search refreshes and fresh caches never need secrets."""
+
+    def __init__(self, env: str, require_secrets: bool = True):
+        self.env = env
+        self.require_secrets = require_secrets
+        self._session: Optional[McpSession] = None
+        self._opened = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[McpSession]:
+        with self._lock:
+            if not self._opened:
+                self._session = _open_session(self.env, self.require_secrets)
+                self._opened = True
+            return self._session
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+
+
+def refresh_mcp_tools_cache(cache_root: Path, sessions: _LazySession, ttl_seconds: int, force: bool) -> dict:
     tools_path = cache_root / "mcp" / "tools_list.json"
-    init_path = cache_root / "mcp" / "initialize.json"
     meta_path = cache_root / "mcp" / "meta.json"
 
-    if not force and not _is_stale(tools_path, ttl_seconds):
+    state = cache_state(cache_root)
+    if not force and state["exists"] and state["age_seconds"] <= ttl_seconds:
         return {"mcp_tools": {"updated": False, "reason": "fresh (ttl)", "tools_path": str(tools_path)}}
 
-    init = _mcp_call(
-        cfg.mcp_base_url,
-        auth,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
-    tools = _mcp_call(cfg.mcp_base_url, auth, {"jsonrpc": "2.0", "method": "tools/list", "params": {}, "id": 2})
-
-    _write_json(init_path, init)
-    _write_json(tools_path, tools)
-    _write_json(
-        meta_path,
-        {
-            "generated_at": _now_ts(),
-            "env": env,
-            "mcp_endpoint": cfg.mcp_base_url,
-            "note": "仅缓存工具元数据（不含 token）",
-        },
-    )
+    session = sessions.get()
+    if session is None:
+        return {"mcp_tools": {"updated": False, "reason": "missing auth (mcp_token or rest_api_key/secret)"}}
+    init = session.initialize()
+    tools = session.call("tools/list", {})
+    if not is_tools_response(tools):
+        # Keep serving the previous list; the next stale read retries.
+        return {"mcp_tools": {"updated": False, "reason": "tools/list failed (cache kept)", "tools_path": str(tools_path)}}
+
+    changed = write_tools_cache(cache_root, tools, session.cfg.env, session.url, ttl_seconds=ttl_seconds, init=init)
+    record(cache_root, "revalidate_updated" if changed else "revalidate_unchanged")
+    if not changed:
+        return {"mcp_tools": {"updated": False, "reason": "revalidated (unchanged)", "tools_path": str(tools_path)}}
     return {"mcp_tools": {"updated": True, "tools_path": str(tools_path), "meta_path": str(meta_path)}}
 
 
-def refresh_mcp_prompts_cache(cache_root: Path, env: str, ttl_seconds: int, force: bool) -> dict:
+def refresh_mcp_prompts_cache(cache_root: Path, sessions: _LazySession, ttl_seconds: int, force: bool) -> dict:
     """
     Cache FAC MCP prompts, if the server supports MCP prompt methods.
 
@@ -232,28 +282,27 @@ def refresh_mcp_prompts_cache(cache_root: Path, env: str, ttl_seconds: int, forc
       - prompts/get
     FAC may or may not implement these; if not, write a clear reason.
     """
-    cfg = load_env_config(env)
-    secrets = load_secrets(required=True)
-    auth = _auth_header_from_local_secrets(secrets)
-    if not auth:
-        return {"mcp_prompts": {"updated": False, "reason": "missing auth (mcp_token or rest_api_key/secret)"}}
-
     list_path = cache_root / "mcp" / "prompts_list.json"
     meta_path = cache_root / "mcp" / "prompts_meta.json"
 
     if not force and not _is_stale(list_path, ttl_seconds):
         return {"mcp_prompts": {"updated": False, "reason": "fresh (ttl)", "list_path": str(list_path)}}
 
+    session = sessions.get()
+    if session is None:
+        return {"mcp_prompts": {"updated": False, "reason": "missing auth (mcp_token or rest_api_key/secret)"}}
+
     # Try prompts/list; if not supported, capture error payload as the reason.
     try:
-        prompts = _mcp_call(cfg.mcp_base_url, auth, {"jsonrpc": "2.0", "method": "prompts/list", "params": {}, "id": 30})
+        session.initialize()
+        prompts = session.call("prompts/list", {})
     except Exception as e:
         _write_json(
             meta_path,
             {
                 "generated_at": _now_ts(),
-                "env": env,
-                "mcp_endpoint": cfg.mcp_base_url,
+                "env": session.cfg.env,
+                "mcp_endpoint": session.url,
                 "updated": False,
                 "note": "服务器不支持 prompts/list 或鉴权不允许；无法缓存 prompts。",
                 "error": str(e),
@@ -266,8 +315,8 @@ def refresh_mcp_prompts_cache(cache_root: Path, env: str, ttl_seconds: int, forc
         meta_path,
         {
             "generated_at": _now_ts(),
-            "env": env,
-            "mcp_endpoint": cfg.mcp_base_url,
+            "env": session.cfg.env,
+            "mcp_endpoint": session.url,
             "updated": True,
             "note": "仅缓存 prompts/list 元数据（不含 token）",
         },
@@ -275,6 +324,59 @@ def refresh_mcp_prompts_cache(cache_root: Path, env: str, ttl_seconds: int, forc
     return {"mcp_prompts": {"updated": True, "list_path": str(list_path), "meta_path": str(meta_path)}}
 
 
+def refresh_search_index(cache_root: Path, force: bool) -> dict:
+    """Rebuild search/index.json when the bundle, Cursor index or tools list changed."""
+    index_path = cache_root / "search" / "index.json"
+    if not force and index_path.exists():
+        try:
+            old = json.loads(_read_text(index_path))
+            if old.get("version") == INDEX_VERSION and old.get("sources") == source_signature(cache_root):
+                return {"search": {"updated": False, "reason": "no changes"}}
+        except Exception:
+            pass
+    index = build_index(cache_root)
+    index["generated_at"] = _now_ts()
+    write_text(index_path, json.dumps(index, ensure_ascii=False, separators=(",", ":")) + "\n")
+    return {"search": {"updated": True, "index": str(index_path), "docs": len(index["docs"]), "terms": len(index["postings"])}}
+
+
+# File each subsystem rewrites on every successful refresh; a forced run that waited for
+# a peer treats a marker newer than its own request as "already refreshed".
+_LOCK_MARKERS = {
+    "cursor": "cursor/index.json",
+    "mcp_tools": "mcp/meta.json",
+    "mcp_prompts": "mcp/prompts_meta.json",
+    "search": "search/index.json",
+}
+
+
+def _locked(name: str, cache_root: Path, force: bool, timeout: float, fn) -> dict:
+    """
+    Run one subsystem refresh under cache/<env>/.locks/<name>.lock so concurrent
+    refreshers (another terminal, a background revalidation, parallel batch jobs) never
+    interleave writes. A waiter re-checks TTL / change detection inside the lock and so
+    normally reuses the peer's result; a forced waiter does the same via the marker file.
+    """
+    requested_at = time.time()
+    marker = cache_root / _LOCK_MARKERS[name]
+    try:
+        with FileLock.for_key(cache_root, name, timeout) as lk:
+            if force and lk.contended and marker.exists() and marker.stat().st_mtime >= requested_at:
+                return {name: {"updated": False, "reason": "refreshed by a concurrent run", "lock_wait_s": lk.waited_s}}
+            res = fn()
+            if lk.contended:
+                res.setdefault(name, {})["lock_wait_s"] = lk.waited_s
+            return res
+    except LockTimeout as e:
+        return {name: {"updated": False, "reason": f"lock timeout: {e}"}}
+
+
+def _timed(fn) -> Tuple[dict, float]:
+    t0 = time.monotonic()
+    res = fn()
+    return res, round(time.monotonic() - t0, 3)
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(description="刷新本地缓存（按 dev/prod 隔离）：MCP tools + Cursor prompts/skills/rules。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
@@ -282,10 +384,18 @@ def main(argv: list[str]) -> int:
     ap.add_argument("--ttl-hours", type=int, default=24, help="MCP tools 缓存 TTL（小时，默认 24）")
     ap.add_argument(
         "--what",
-        choices=["all", "mcp_tools", "mcp_prompts", "cursor"],
+        choices=["all", "mcp_tools", "mcp_prompts", "cursor", "search"],
         default="all",
         help="刷新哪些缓存",
     )
+    ap.add_argument(
+        "--lock-timeout",
+        type=float,
+        default=DEFAULT_LOCK_TIMEOUT_S,
+        help=f"等待其他刷新进程释放锁的最长秒数（默认 {DEFAULT_LOCK_TIMEOUT_S:.0f}）",
+    )
+    # Internal: set when started as a background stale-while-revalidate refresh.
+    ap.add_argument("--swr-child", action="store_true", help=argparse.SUPPRESS)
     args = ap.parse_args(argv)
 
     cache_root = repo_root() / "cache" / args.env
@@ -294,12 +404,49 @@ def main(argv: list[str]) -> int:
     out: dict = {"env": args.env, "cache_root": str(cache_root), "generated_at": _now_ts()}
     ttl_seconds = max(1, args.ttl_hours) * 3600
 
+    t_start = time.monotonic()
+    # Opened by the first MCP task that actually needs the server. With --what all a missing
+    # secrets file only skips the MCP caches (reported as missing auth); the rest still refresh.
+    sessions = _LazySession(args.env, require_secrets=args.what != "all")
+
+    # Independent subsystems run concurrently over the shared session; the search index
+    # reads the bundle and tools list, so it runs after them.
+    tasks = []
     if args.what in ("all", "cursor"):
-        out.update(refresh_cursor_cache(cache_root, force=args.force))
+        tasks.append(("cursor", lambda: refresh_cursor_cache(cache_root, force=args.force)))
     if args.what in ("all", "mcp_tools"):
-        out.update(refresh_mcp_tools_cache(cache_root, env=args.env, ttl_seconds=ttl_seconds, force=args.force))
+        tasks.append(("mcp_tools", lambda: refresh_mcp_tools_cache(cache_root, sessions, ttl_seconds=ttl_seconds, force=args.force)))
     if args.what in ("all", "mcp_prompts"):
-        out.update(refresh_mcp_prompts_cache(cache_root, env=args.env, ttl_seconds=ttl_seconds, force=args.force))
+        tasks.append(("mcp_prompts", lambda: refresh_mcp_prompts_cache(cache_root, sessions, ttl_seconds=ttl_seconds, force=args.force)))
+    timeout = max(0.0, args.lock_timeout)
+    try:
+        if tasks:
+            with ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+                futs = [
+                    (name, pool.submit(_timed, lambda name=name, fn=fn: _locked(name, cache_root, args.force, timeout, fn)))
+                    for name, fn in tasks
+                ]
+                for name, fut in futs:
+                    res, seconds = fut.result()
+                    res.setdefault(name, {})["seconds"] = seconds
+                    out.update(res)
+        if args.what in ("all", "cursor", "mcp_tools", "search"):
+            search_force = args.force or args.what == "search"
+            res, seconds = _timed(
+                lambda: _locked("search", cache_root, search_force, timeout, lambda: refresh_search_index(cache_root, force=search_force))
+            )
+            res["search"]["seconds"] = seconds
+            out.update(res)
+    finally:
+        sessions.close()
+        if args.swr_child:
+            release_revalidate_lock(cache_root)
+    # Keep cache/<env> within its configured budget (LRU; the just-refreshed files count as recently used).
+    budget = budget_bytes(args.env)
+    if budget is not None:
+        ev = CacheManager(args.env, cache_root=cache_root).evict(budget)
+        out["eviction"] = {**ev, "evicted": [e["id"] for e in ev["evicted"]]}
+    out["elapsed_seconds"] = round(time.monotonic() - t_start, 3)
 
     print(json.dumps(out, ensure_ascii=False, indent=2, default=str))
     return 0
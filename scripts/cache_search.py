@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from _lib_cache_manager import record_use
+from _lib_config import ConfigError, repo_root
+from _lib_search_index import search
+
+
+def _snippet(cache_root: Path, hit: dict, max_bytes: int) -> str:
+    if hit.get("offset") is None:
+        return ""
+    with open(cache_root / hit["file"], "rb") as f:
+        f.seek(int(hit["offset"]))
+        raw = f.read(min(int(hit["length"]), max_bytes))
+    return raw.decode("utf-8", errors="ignore")
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        description="在本地缓存中全文检索（Cursor bundle 段落 + MCP tool schema），只返回最相关的片段位置。",
+    )
+    ap.add_argument("--env", choices=["dev", "prod"], required=True)
+    ap.add_argument("query", help="检索词（中英文均可；中文按二元组切分）")
+    ap.add_argument("-k", type=int, default=5, help="返回条数（默认 5）")
+    ap.add_argument("--kind", choices=["all", "command", "rule", "skill", "tool"], default="all")
+    ap.add_argument("--show", action="store_true", help="同时输出命中片段（按字节偏移读取）")
+    ap.add_argument("--max-bytes", type=int, default=2000, help="--show 时每个片段最多输出的字节数（默认 2000）")
+    ap.add_argument("--json", action="store_true", help="输出 JSON 数组（便于脚本处理）")
+    args = ap.parse_args(argv)
+
+    cache_root = repo_root() / "cache" / args.env
+    index_path = cache_root / "search" / "index.json"
+    if not index_path.exists():
+        raise ConfigError(f"检索索引不存在：{index_path}\n请先运行：python scripts/cache_refresh.py --env {args.env}")
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    record_use(cache_root, "search_index")
+
+    hits = search(index, args.query, k=args.k, kinds=None if args.kind == "all" else [args.kind])
+    if args.show:
+        for h in hits:
+            h["snippet"] = _snippet(cache_root, h, args.max_bytes)
+        for kind, rel in (("cursor", "cursor/bundle.md"), ("mcp_tools", "mcp/tools_list.json")):
+            if any(h.get("file") == rel for h in hits):
+                record_use(cache_root, kind)
+
+    if args.json:
+        print(json.dumps(hits, ensure_ascii=False, indent=2))
+        return 0
+    if not hits:
+        print("NO_MATCH")
+        return 1
+    for h in hits:
+        loc = f"{h['file']}@{h['offset']}+{h['length']}" if h.get("offset") is not None else h["file"]
+        print(f"{h['score']:>8.3f}  {h['kind']:<7} {h['title']}  {loc}  matched={','.join(h['matched'])}")
+        if args.show and h.get("snippet"):
+            print(h["snippet"].rstrip("\n"))
+            print("")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
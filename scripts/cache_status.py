@@ -5,9 +5,11 @@ import json
 import sys
 import time
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
+from _lib_cache_manager import CacheManager, budget_bytes
 from _lib_config import ConfigError, repo_root
+from _lib_mcp_cache import cache_state, load_metrics
 
 
 def _stat_file(p: Path) -> dict:
@@ -25,6 +27,10 @@ def _stat_file(p: Path) -> dict:
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(description="查看本地缓存状态（按 dev/prod 隔离）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
+    ap.add_argument("--top", type=int, default=10, help="列出占用最大的前 N 个缓存项（默认 10）")
+    ap.add_argument("--budget-mb", type=float, default=None, help="覆盖环境配置中的 cache_budget_mb（<= 0 表示不限制）")
+    ap.add_argument("--evict", action="store_true", help="超出容量上限时按 LRU 淘汰可再生的缓存项")
+    ap.add_argument("--dry-run", action="store_true", help="与 --evict 一起使用：只列出将被淘汰的项，不删除")
     args = ap.parse_args(argv)
 
     root = repo_root() / "cache" / args.env
@@ -40,8 +46,25 @@ def main(argv: list[str]) -> int:
         "meta": _stat_file(root / "mcp" / "meta.json"),
         "prompts_list": _stat_file(root / "mcp" / "prompts_list.json"),
         "prompts_meta": _stat_file(root / "mcp" / "prompts_meta.json"),
+        "tools_index": _stat_file(root / "mcp" / "tools_index.bin"),
+        # Stale-while-revalidate view of tools_list.json: freshness + reader hit/miss counters.
+        "tools_cache": {**cache_state(root), "metrics": load_metrics(root)},
     }
 
+    # Like cache_budget_mb in the env config, a budget <= 0 means "no limit".
+    if args.budget_mb is None:
+        budget: Optional[int] = budget_bytes(args.env)
+    else:
+        budget = max(0, int(args.budget_mb * 1024 * 1024)) or None
+    mgr = CacheManager(args.env, cache_root=root)
+    if args.evict and args.budget_mb is not None and args.budget_mb <= 0:
+        out["eviction"] = {"skipped": "--budget-mb <= 0：不限制容量，不淘汰"}
+    elif args.evict:
+        if budget is None:
+            raise ConfigError("未配置容量上限：请在 config/environments/<env>.yaml 设置 cache_budget_mb，或传 --budget-mb")
+        out["eviction"] = mgr.evict(budget, dry_run=args.dry_run)
+    out.update(mgr.summary(mgr.scan(), budget, top=args.top))
+
     print(json.dumps(out, ensure_ascii=False, indent=2, default=str))
     return 0
 
@@ -11,6 +11,9 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret, repo_root
+from _lib_executor import Executor, ServerExecutor, load_executor
+from _lib_output import write_json
+from _lib_spec_codec import SERVER_DECODE_SNIPPET, SPEC_ENCODINGS, pack_spec, spec_body
 
 
 def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
@@ -105,6 +108,66 @@ def _default_out_path(env: str, profile: str) -> Path:
     return repo_root() / "work" / env / "operations" / "batches" / f"{_timestamp_slug()}_create_items_from_template_{profile}.json"
 
 
+def _results_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.stem + ".results.ndjson")
+
+
+def _extract_stdout(parsed: Any) -> str:
+    """
+    Best-effort: find the captured stdout of run_python_code.
+    FAC wraps it as {"success": ..., "result": {"success": ..., "output": "..."}} (key names vary).
+    """
+    if isinstance(parsed, str):
+        return parsed
+    if not isinstance(parsed, dict):
+        return ""
+    for k in ("output", "stdout"):
+        v = parsed.get(k)
+        if isinstance(v, str):
+            return v
+    r = parsed.get("result")
+    if isinstance(r, (dict, str)):
+        return _extract_stdout(r)
+    return ""
+
+
+def _parse_result_lines(stdout: str) -> Tuple[List[dict], Optional[dict]]:
+    records: List[dict] = []
+    summary: Optional[dict] = None
+    for line in stdout.splitlines():
+        line = line.strip()
+        if line.startswith("R|"):
+            try:
+                idx, status, unique_id, param_hash, name, detail = json.loads(line[2:])
+            except Exception:
+                continue
+            rec = {"idx": idx, "status": status, "id": unique_id, "hash": param_hash}
+            if name:
+                rec["name"] = name
+            if detail is not None:
+                rec["errors" if status == "error" else "detail"] = detail
+            records.append(rec)
+        elif line.startswith("S|"):
+            try:
+                summary = json.loads(line[2:])
+            except Exception:
+                summary = None
+    return records, summary
+
+
+def _chunk_ok(parsed: Any, via_server: bool) -> bool:
+    try:
+        if isinstance(parsed, dict) and parsed.get("success") is True:
+            if via_server:
+                return True
+            r = parsed.get("result")
+            if isinstance(r, dict) and r.get("success") is True:
+                return True
+    except Exception:
+        return False
+    return False
+
+
 def _run_preflight(env: str, confirm_prod: bool) -> None:
     py = sys.executable
     cmd = [py, str(repo_root() / "scripts" / "preflight.py"), "--env", env, "--operation", "write"]
@@ -113,9 +176,14 @@ def _run_preflight(env: str, confirm_prod: bool) -> None:
     subprocess.run(cmd, check=True)
 
 
+def _inline_code(executor: Executor, spec_src: str) -> str:
+    # NOTE: run_python_code forbids import statements; use frappe + json already available.
+    return SERVER_DECODE_SNIPPET + f"\nspec = {spec_src}\n" + executor.source
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(
-        description="按 Item Parameter Template 批量创建/更新 Item（低上下文：run_python_code 一次完成）。"
+        description="按 Item Parameter Template 批量创建/更新 Item（低上下文：run_python_code 服务端分块执行，逐条结果写入 NDJSON）。"
     )
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
     ap.add_argument("--profile", required=True, help="使用哪个 profile（见 config/template_item_profiles.json）")
@@ -126,6 +194,19 @@ def main(argv: list[str]) -> int:
     ap.add_argument("--spec", default="", help="批量 spec JSON 文件路径（items 数组）")
     ap.add_argument("--items-json", default="", help="直接传 items JSON 数组（少量时使用）")
     ap.add_argument("--out", default="", help="保存执行结果到文件（默认 work/<env>/operations/batches/...json）")
+    ap.add_argument(
+        "--executor",
+        choices=["auto", "inline", "server"],
+        default="auto",
+        help="auto（默认）：服务器已部署同版本 executor 时只发送数据，否则内联代码；inline：总是内联；server：必须走服务器端",
+    )
+    ap.add_argument("--chunk-size", type=int, default=200, help="每次 run_python_code 处理的 items 数（默认 200）")
+    ap.add_argument(
+        "--spec-encoding",
+        choices=list(SPEC_ENCODINGS),
+        default="columnar",
+        help="spec 传输编码：columnar（默认，参数名只写一次）/ columnar-gz（再 gzip+base64）/ repr（旧格式）",
+    )
     args = ap.parse_args(argv)
 
     if args.env == "prod" and not args.confirm_prod:
@@ -191,277 +272,114 @@ def main(argv: list[str]) -> int:
         "items": items,
     }
 
-    # NOTE: run_python_code forbids import statements; use frappe + json already available.
-    code = f"""
-spec = {exec_spec!r}
-profile = spec.get("profile")
-mode = spec.get("mode", "upsert")
-dry_run = bool(spec.get("dry_run"))
-template_doctype = spec.get("template_doctype") or "Item Parameter Template"
-template_name = spec.get("template_name")
-target_doctype = spec.get("target_doctype") or "Item"
-id_field = spec.get("id_field") or "custom_unique_item_name"
-hash_field = spec.get("hash_field") or ""
-id_format = spec.get("id_format") or ""
-uom_rules = spec.get("uom_rules") or []
-items = spec.get("items") or []
-
-def md5_hex(s: str) -> str:
-    # Avoid python imports (restricted by run_python_code security).
-    # Use database MD5() for deterministic hash.
-    s = "" if s is None else str(s)
-    return frappe.db.sql("select md5(%s)", (s,), pluck=True)[0]
-
-def render(s, ctx):
-    if s is None:
-        return ""
-    s = str(s)
-    if not s:
-        return ""
-    return frappe.render_template(s, ctx)
-
-def to_float(v):
-    if v in (None, ""):
-        return None
-    try:
-        return float(v)
-    except Exception:
-        return None
-
-def to_int(v):
-    if v in (None, ""):
-        return None
-    try:
-        return int(float(v))
-    except Exception:
-        return None
-
-def canonical_float(v):
-    v = to_float(v)
-    if v is None:
-        return ""
-    if float(v).is_integer():
-        return str(int(v))
-    s = ("%.6f" % float(v)).rstrip("0").rstrip(".")
-    return s
-
-tpl = frappe.get_doc(template_doctype, template_name)
-param_defs = list(tpl.get("parameters") or [])
-
-def build_context(user_params):
-    ctx = {{}}
-    # 1) seed with user input
-    for k, v in (user_params or {{}}).items():
-        ctx[str(k)] = v
-    # 2) fill / compute in idx order
-    for row in sorted(param_defs, key=lambda r: r.get("idx") or 0):
-        pname = row.get("parameter_name")
-        if not pname:
-            continue
-        pname = str(pname)
-        ctype = row.get("constraint_type") or ""
-        default_raw = row.get("parameter_default_value")
-        if pname not in ctx or ctx.get(pname) in (None, ""):
-            # default may be format using other params
-            if default_raw not in (None, ""):
-                ctx[pname] = render(default_raw, ctx)
-        # coerce types
-        if ctype == "Float":
-            # Store as canonical string to avoid "5.0" vs "5" drift in IDs / names.
-            ctx[pname] = canonical_float(ctx.get(pname))
-        elif ctype == "Integer":
-            i = to_int(ctx.get(pname))
-            ctx[pname] = i if i is not None else ctx.get(pname)
-        elif ctype == "Format":
-            # For format fields, render template using current ctx
-            ctx[pname] = render(default_raw, ctx)
-        elif ctype == "Doctype":
-            # keep as string
-            if ctx.get(pname) is not None:
-                ctx[pname] = str(ctx.get(pname))
-    return ctx
-
-def validate_ctx(ctx):
-    errs = []
-    for row in param_defs:
-        pname = row.get("parameter_name")
-        if not pname:
-            continue
-        pname = str(pname)
-        optional = int(row.get("optional") or 0)
-        if optional == 0:
-            if ctx.get(pname) in (None, ""):
-                errs.append("missing required param: " + pname)
-        ctype = row.get("constraint_type") or ""
-        if ctype == "Doctype":
-            dt = row.get("doctype_selector")
-            v = ctx.get(pname)
-            if dt and v not in (None, ""):
-                if not frappe.db.exists(str(dt), str(v)):
-                    errs.append("invalid doctype value: " + pname + "=" + str(v) + " (doctype=" + str(dt) + ")")
-    return errs
-
-def compute_id(ctx):
-    if id_format:
-        return render(id_format, ctx)
-    # fallback: join_to_hash params
-    parts = []
-    for row in param_defs:
-        if int(row.get("join_to_hash") or 0) == 1:
-            pname = row.get("parameter_name")
-            if pname:
-                parts.append(str(pname) + "=" + str(ctx.get(str(pname))))
-    return "ITEM-" + frappe.generate_hash(length=12) if not parts else "ITEM-" + md5_hex("|".join(parts))
-
-def compute_hash(ctx):
-    parts = []
-    for row in sorted(param_defs, key=lambda r: r.get("idx") or 0):
-        if int(row.get("join_to_hash") or 0) == 1:
-            pname = row.get("parameter_name")
-            if pname:
-                parts.append(str(pname) + "=" + str(ctx.get(str(pname))))
-    return md5_hex("|".join(parts)) if parts else ""
-
-def build_item_data(ctx, unique_id):
-    data = {{}}
-    data["item_group"] = tpl.get("item_group") or ""
-    # bind fields to Item
-    for row in param_defs:
-        if int(row.get("binding_field") or 0) != 1:
-            continue
-        target = row.get("target_field")
-        pname = row.get("parameter_name")
-        if target and pname:
-            data[str(target)] = ctx.get(str(pname))
-    # stable id (naming may override item_code)
-    data[id_field] = unique_id
-    if hash_field:
-        data[hash_field] = compute_hash(ctx)
-    return data
-
-def build_uoms(ctx):
-    out = []
-    # Apply uom_rules (allows dynamic conversion factors)
-    for r in uom_rules:
-        if not isinstance(r, dict):
-            continue
-        u = r.get("uom")
-        if not u:
-            continue
-        if "conversion_factor_expr" in r and r.get("conversion_factor_expr"):
-            cf = render(r.get("conversion_factor_expr"), ctx)
-            try:
-                cf = float(cf)
-            except Exception:
-                cf = 0.0
-        else:
-            cf = r.get("conversion_factor", 0)
-            try:
-                cf = float(cf)
-            except Exception:
-                cf = 0.0
-        out.append({{"uom": str(u), "conversion_factor": cf}})
-    return out
-
-results = []
-for idx, it in enumerate(items, start=1):
-    user_params = it.get("params") if isinstance(it, dict) else None
-    ctx = build_context(user_params)
-    errs = validate_ctx(ctx)
-    unique_id = compute_id(ctx)
-    param_hash = compute_hash(ctx) if hash_field else ""
-    if errs:
-        results.append({{"idx": idx, "status": "error", "id": unique_id, "hash": param_hash, "errors": errs}})
-        continue
-
-    existing_name = None
-    if hash_field and param_hash:
-        existing_name = frappe.db.get_value(target_doctype, {{hash_field: param_hash}}, "name")
-    if not existing_name and unique_id:
-        existing_name = frappe.db.get_value(target_doctype, {{id_field: unique_id}}, "name")
-    if existing_name and mode in ("create_only", "skip_existing"):
-        results.append({{"idx": idx, "status": "exists", "id": unique_id, "hash": param_hash, "name": existing_name}})
-        continue
-
-    data = build_item_data(ctx, unique_id)
-    uoms = build_uoms(ctx)
-    if uoms:
-        data["uoms"] = uoms
-
-    if dry_run:
-        # keep only small preview
-        results.append({{"idx": idx, "status": "dry_run", "id": unique_id, "hash": param_hash, "data_keys": sorted(list(data.keys()))}})
-        continue
-
-    if existing_name and mode == "upsert":
-        doc = frappe.get_doc(target_doctype, existing_name)
-        for k, v in data.items():
-            if k == "uoms":
-                continue
-            doc.set(k, v)
-        doc.save()
-        # child table: use direct document API (stable)
-        if uoms:
-            by_uom = {{row.uom: row for row in doc.uoms}}
-            for r in uoms:
-                uom = r.get("uom")
-                cf = float(r.get("conversion_factor") or 0)
-                if uom in by_uom:
-                    by_uom[uom].conversion_factor = cf
-                else:
-                    doc.append("uoms", {{"uom": uom, "conversion_factor": cf}})
-            doc.save()
-        results.append({{"idx": idx, "status": "updated", "id": unique_id, "hash": param_hash, "name": doc.name}})
-        continue
-
-    doc = frappe.new_doc(target_doctype)
-    for k, v in data.items():
-        if k == "uoms":
-            continue
-        doc.set(k, v)
-    # insert first so we have parent, then append children
-    doc.insert()
-    if uoms:
-        for r in uoms:
-            doc.append("uoms", {{"uom": r.get("uom"), "conversion_factor": float(r.get("conversion_factor") or 0)}})
-        doc.save()
-    results.append({{"idx": idx, "status": "created", "id": unique_id, "hash": param_hash, "name": doc.name}})
-
-summary = {{
-  "profile": profile,
-  "mode": mode,
-  "dry_run": dry_run,
-  "count": len(results),
-  "ok": len([r for r in results if r.get("status") in ("created","updated","exists","dry_run")]),
-  "errors": len([r for r in results if r.get("status") == "error"]),
-}}
-print(summary)
-"""
-
-    resp = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "tools/call", "params": {"name": "run_python_code", "arguments": {"code": code}}, "id": 2},
-    )
-    texts = _extract_text_content(resp)
-    text0 = texts[0] if texts else ""
-    parsed = _best_effort_parse_json_text(text0) if text0 else resp
-
     out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env, args.profile)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps({"request": exec_spec, "response": parsed}, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
-
-    ok = False
+    results_path = _results_path(out_path)
+    chunk_size = max(1, int(args.chunk_size))
+    n_chunks = (len(items) + chunk_size - 1) // chunk_size
+    executor = load_executor("item_batch")
+    server: Optional[ServerExecutor] = None
+    server_cfg = profile.get("server_executor")
+    if args.executor != "inline":
+        if isinstance(server_cfg, dict):
+            candidate = ServerExecutor(cfg.rest_base_url, auth_header_value, server_cfg)
+            remote_sha = candidate.remote_sha256(executor)
+            if remote_sha == executor.sha256:
+                server = candidate
+            else:
+                print(f"SERVER_EXECUTOR: version mismatch or unavailable (remote={(remote_sha or '-')[:12]})")
+        if server is None and args.executor == "server":
+            raise ConfigError("--executor server：服务器端未部署相同版本的 executor（或 profile 未配置 server_executor）。")
+    executor_mode = "server" if server is not None else "inline"
+    print(f"EXECUTOR={executor.name}@{executor.version}  MODE={executor_mode}")
+    print(f"SPEC_ENCODING={args.spec_encoding if server is None else 'columnar-json'}  CHUNK_SIZE={chunk_size}  CHUNKS={n_chunks}")
+    print(f"RESULTS_NDJSON={results_path}")
+
+    ok = True
+    totals: Dict[str, int] = {}
+    chunk_log: List[dict] = []
+    done = 0
+    started = time.monotonic()
+    # Policy: stop at the first failed chunk (its items are in an unknown state, and later
+    # chunks may depend on what it created). The summary is written in all cases.
     try:
-        if isinstance(parsed, dict) and parsed.get("success") is True:
-            r = parsed.get("result")
-            if isinstance(r, dict) and r.get("success") is True:
-                ok = True
-    except Exception:
-        ok = False
+        with results_path.open("w", encoding="utf-8") as rf:
+            for ci in range(n_chunks):
+                offset = ci * chunk_size
+                chunk_items = items[offset : offset + chunk_size]
+                chunk_spec = {**exec_spec, "items": chunk_items, "idx_offset": offset}
+                t0 = time.monotonic()
+                try:
+                    if server is not None:
+                        # Only the data travels; the server already holds this executor version.
+                        parsed = server.run(executor, spec_body(chunk_spec))
+                    else:
+                        spec_src = pack_spec(chunk_spec, args.spec_encoding)
+                        resp = _mcp_call(
+                            mcp_url,
+                            auth_header_value,
+                            {
+                                "jsonrpc": "2.0",
+                                "method": "tools/call",
+                                "params": {"name": "run_python_code", "arguments": {"code": _inline_code(executor, spec_src)}},
+                                "id": 2 + ci,
+                            },
+                        )
+                        texts = _extract_text_content(resp)
+                        text0 = texts[0] if texts else ""
+                        parsed = _best_effort_parse_json_text(text0) if text0 else resp
+                except Exception as e:
+                    parsed = {"success": False, "error": f"{type(e).__name__}: {e}"}
+
+                records, summary = _parse_result_lines(_extract_stdout(parsed))
+                for rec in records:
+                    rf.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                    totals[rec["status"]] = totals.get(rec["status"], 0) + 1
+                rf.flush()
+
+                chunk_ok = _chunk_ok(parsed, via_server=server is not None) and len(records) == len(chunk_items)
+                ok = ok and chunk_ok
+                entry: dict = {
+                    "chunk": ci + 1,
+                    "offset": offset,
+                    "items": len(chunk_items),
+                    "records": len(records),
+                    "ok": chunk_ok,
+                    "elapsed_s": round(time.monotonic() - t0, 3),
+                    "summary": summary,
+                }
+                if not chunk_ok:
+                    # Keep the raw response only when something went wrong (it may be large).
+                    entry["response"] = parsed
+                chunk_log.append(entry)
+
+                done += len(chunk_items)
+                elapsed = max(1e-6, time.monotonic() - started)
+                rate = done / elapsed
+                eta = (len(items) - done) / rate if rate > 0 else 0.0
+                print(f"PROGRESS chunk={ci + 1}/{n_chunks}  items={done}/{len(items)}  rate={rate:.1f}/s  eta={eta:.0f}s  ok={chunk_ok}")
+                if not chunk_ok:
+                    print(f"STOPPED: chunk {ci + 1} failed; {n_chunks - ci - 1} remaining chunk(s) not sent.")
+                    break
+    finally:
+        write_json(
+            out_path,
+            {
+                "request": exec_spec,
+                "executor": {"name": executor.name, "sha256": executor.sha256, "mode": executor_mode},
+                "results_ndjson": str(results_path),
+                "totals": totals,
+                "elapsed_s": round(time.monotonic() - started, 3),
+                "chunks_total": n_chunks,
+                "chunks_sent": len(chunk_log),
+                "completed": ok and len(chunk_log) == n_chunks,
+                "chunks": chunk_log,
+            },
+        )
 
     print("")
     print("DONE.")
+    print(f"TOTALS={json.dumps(totals, ensure_ascii=False)}")
     print(f"RESULT_SAVED_TO={out_path}")
     if not ok:
         return 2
@@ -0,0 +1,323 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from _lib_columnar import ColumnTable
+from _lib_config import ConfigError, repo_root
+from _lib_digest import sha256_text
+from _lib_mcp import McpSession
+from _lib_output import write_json
+
+ENVS = ("dev", "prod")
+
+
+def _default_profiles_path() -> Path:
+    return repo_root() / "config" / "env_diff_profiles.json"
+
+
+def _default_out_path(source: str, target: str) -> Path:
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    return repo_root() / "work" / source / "operations" / "migration" / f"{ts}_env_diff_{source}_to_{target}.json"
+
+
+def _load_profiles(path: Path) -> dict:
+    if not path.exists():
+        raise ConfigError(f"env diff 配置文件不存在：{path}")
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        raise ConfigError(f"env diff 配置文件不是合法 JSON：{path}\n{e}")
+
+
+def _select_profile(cfg: dict, profile: str) -> Tuple[str, List[dict]]:
+    profiles = cfg.get("profiles")
+    if not isinstance(profiles, dict):
+        raise ConfigError("env diff 配置缺少 profiles（应为对象）。")
+    p = profiles.get(profile)
+    if not isinstance(p, dict):
+        names = ", ".join(sorted([k for k in profiles.keys() if isinstance(k, str)]))
+        raise ConfigError(f"未找到 profile={profile}。可用 profiles：{names}")
+    specs = p.get("doctypes")
+    if not isinstance(specs, list) or not specs:
+        raise ConfigError(f"profile={profile} 缺少 doctypes（应为非空数组）。")
+    for i, s in enumerate(specs):
+        if not isinstance(s, dict) or not isinstance(s.get("doctype"), str) or not s["doctype"].strip():
+            raise ConfigError(f"profile doctypes[{i}] 缺少 doctype。")
+        mode = s.get("mode", "list")
+        if mode not in ("list", "document"):
+            raise ConfigError(f"profile doctypes[{i}].mode 必须是 list 或 document：{mode!r}")
+        if mode == "list" and (not isinstance(s.get("fields"), list) or not s["fields"]):
+            raise ConfigError(f"profile doctypes[{i}]（{s['doctype']}）mode=list 时必须提供 fields。")
+    return str(p.get("description") or "").strip(), specs
+
+
+def _unwrap_doc(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        r = obj.get("result")
+        if isinstance(r, dict):
+            for k in ("doc", "data", "message"):
+                v = r.get(k)
+                if v is not None:
+                    return v
+        for k in ("message", "data"):
+            v = obj.get(k)
+            if v is not None:
+                return v
+    return obj
+
+
+def _is_error(parsed: Any) -> bool:
+    return isinstance(parsed, dict) and (parsed.get("success") is False or bool(parsed.get("error")))
+
+
+# -- normalization ------------------------------------------------------------
+def _norm_value(v: Any, child_ignore: frozenset) -> Any:
+    # Frappe returns "" or None for the same empty field depending on path and version,
+    # and 1.0 / 1 / True for the same Check / Int value.
+    if v is None or v == "":
+        return None
+    if isinstance(v, bool):
+        return int(v)
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, list):
+        return [_norm_record(r, child_ignore, child_ignore) if isinstance(r, dict) else _norm_value(r, child_ignore) for r in v]
+    return v
+
+
+def _norm_record(row: Dict[str, Any], ignore: frozenset, child_ignore: frozenset) -> Dict[str, Any]:
+    """Drop volatile fields (timestamps, owners, child row names/idx), unify empty/numeric values."""
+    out = {}
+    for k, v in row.items():
+        if k in ignore:
+            continue
+        nv = _norm_value(v, child_ignore)
+        if nv is not None:
+            out[k] = nv
+    return out
+
+
+def _canonical(v: Any) -> str:
+    return json.dumps(v, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def record_hash(rec: Dict[str, Any]) -> str:
+    return sha256_text(_canonical(rec))
+
+
+# -- pulling ------------------------------------------------------------------
+class Pulled:
+    """One (env, doctype) pull: normalized records in a ColumnTable plus name -> record hash."""
+
+    def __init__(self, env: str, doctype: str):
+        self.env = env
+        self.doctype = doctype
+        self.table = ColumnTable()
+        self.pos: Dict[str, int] = {}
+        self.hashes: Dict[str, str] = {}
+        self.fetch_s = 0.0
+        self.hash_s = 0.0
+        self.calls = 0
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        name = rec.pop("name", None)
+        if not isinstance(name, str):
+            return
+        self.pos[name] = len(self.table)
+        self.hashes[name] = record_hash(rec)
+        self.table.append(rec)
+
+    def record(self, name: str) -> Dict[str, Any]:
+        return self.table.row(self.pos[name])
+
+
+def _pull(
+    session: McpSession,
+    spec: dict,
+    ignore: frozenset,
+    child_ignore: frozenset,
+    page_size: int,
+    doc_pool: ThreadPoolExecutor,
+) -> Pulled:
+    doctype = spec["doctype"]
+    out = Pulled(session.cfg.env, doctype)
+    stats: dict = {}
+    t0 = time.monotonic()
+    if spec.get("mode", "list") == "list":
+        rows = list(session.iter_documents(doctype, ["name", *[f for f in spec["fields"] if f != "name"]], page_size=page_size, stats=stats))
+        out.calls = stats.get("pages", 0)
+    else:
+        names = [r.get("name") for r in session.iter_documents(doctype, ["name"], page_size=page_size, stats=stats) if isinstance(r, dict)]
+
+        def get(name: str) -> Any:
+            parsed = session.call_tool("get_document", {"doctype": doctype, "name": name})
+            if _is_error(parsed):
+                raise ConfigError(f"[{session.cfg.env}] get_document 失败：{doctype} {name}\n{json.dumps(parsed, ensure_ascii=False, default=str)[:500]}")
+            return _unwrap_doc(parsed)
+
+        rows = list(doc_pool.map(get, names))
+        out.calls = stats.get("pages", 0) + len(names)
+    # iter_documents raises on a failed, unparsable or stalled page and only stops on an
+    # empty one, so the pull is complete even when the server caps rows per call.
+    out.fetch_s = time.monotonic() - t0
+
+    t1 = time.monotonic()
+    for r in rows:
+        if isinstance(r, dict):
+            out.add(_norm_record(r, ignore, child_ignore))
+    out.hash_s = time.monotonic() - t1
+    return out
+
+
+# -- diff ---------------------------------------------------------------------
+def _field_changes(src: Dict[str, Any], dst: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-field {from: target value, to: source value}; child tables as changed rows only."""
+    out: Dict[str, Any] = {}
+    for f in sorted(set(src) | set(dst)):
+        a, b = src.get(f), dst.get(f)
+        if _canonical(a) == _canonical(b):
+            continue
+        if isinstance(a, list) or isinstance(b, list):
+            la, lb = a or [], b or []
+            rows = []
+            for i in range(max(len(la), len(lb))):
+                ra = la[i] if i < len(la) else None
+                rb = lb[i] if i < len(lb) else None
+                if _canonical(ra) != _canonical(rb):
+                    rows.append({"row": i + 1, "from": rb, "to": ra})
+            out[f] = {"rows": {"from": len(lb), "to": len(la)}, "changed_rows": rows}
+        else:
+            out[f] = {"from": b, "to": a}
+    return out
+
+
+def diff_pulled(src: Pulled, dst: Pulled) -> Dict[str, Any]:
+    """Keyed diff by record hash; full records are only touched for keys that differ."""
+    create = sorted(k for k in src.hashes if k not in dst.hashes)
+    only_target = sorted(k for k in dst.hashes if k not in src.hashes)
+    update = sorted(k for k, h in src.hashes.items() if k in dst.hashes and dst.hashes[k] != h)
+    return {
+        "counts": {
+            "source": len(src.hashes),
+            "target": len(dst.hashes),
+            "create": len(create),
+            "update": len(update),
+            "only_in_target": len(only_target),
+            "same": len(src.hashes) - len(create) - len(update),
+        },
+        "create": [{"name": k, "hash": src.hashes[k], "values": src.record(k)} for k in create],
+        "update": [{"name": k, "hash": src.hashes[k], "fields": _field_changes(src.record(k), dst.record(k))} for k in update],
+        "only_in_target": only_target,
+    }
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        description="dev/prod 配置对比（MCP 只读，两个环境并发拉取）：按记录 hash 计算差异，输出迁移变更清单。",
+    )
+    ap.add_argument("--source", choices=list(ENVS), default="dev", help="变更来源环境（默认 dev）；目标为另一个环境")
+    ap.add_argument("--profile", default="default", help="对比的 doctype 集合（见 config/env_diff_profiles.json）")
+    ap.add_argument("--profiles", default="", help="配置文件路径（默认 config/env_diff_profiles.json）")
+    ap.add_argument("--doctypes", default="", help="只对比 profile 中的这些 doctype（逗号分隔）")
+    ap.add_argument("--jobs", type=int, default=8, help="并发拉取线程数（默认 8；document 模式的 get_document 另用同样大小的线程池）")
+    ap.add_argument("--page-size", type=int, default=500, help="list_documents 首页大小（默认 500；之后自适应）")
+    ap.add_argument("--show", type=int, default=10, help="终端每个 doctype 最多显示的变更条数（默认 10）")
+    ap.add_argument("--out", default="", help="变更清单 JSON 路径（默认 work/<source>/operations/migration/<ts>_env_diff_<source>_to_<target>.json）")
+    args = ap.parse_args(argv)
+
+    source = args.source
+    target = "prod" if source == "dev" else "dev"
+    cfg = _load_profiles(Path(args.profiles) if args.profiles.strip() else _default_profiles_path())
+    desc, specs = _select_profile(cfg, args.profile)
+    only = [d.strip() for d in args.doctypes.split(",") if d.strip()]
+    if only:
+        unknown = [d for d in only if d not in {s["doctype"] for s in specs}]
+        if unknown:
+            raise ConfigError(f"--doctypes 不在 profile={args.profile} 中：{', '.join(unknown)}")
+        specs = [s for s in specs if s["doctype"] in only]
+    ignore = frozenset(cfg.get("ignore_fields") or [])
+    child_ignore = frozenset(cfg.get("child_ignore_fields") or [])
+    jobs = max(1, int(args.jobs))
+
+    sessions = {env: McpSession.from_env(env) for env in (source, target)}
+    for s in sessions.values():
+        s.print_banner()
+    print(f"PROFILE={args.profile}  {desc}".rstrip())
+    print(f"DIRECTION={source}->{target}  DOCTYPES={len(specs)}  JOBS={jobs}  READ_ONLY=1")
+
+    t0 = time.monotonic()
+    pulled: Dict[Tuple[str, str], Pulled] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool, ThreadPoolExecutor(max_workers=jobs) as doc_pool:
+        list(pool.map(lambda s: s.initialize(), sessions.values()))
+        futs = {
+            (env, spec["doctype"]): pool.submit(_pull, sessions[env], spec, ignore, child_ignore, args.page_size, doc_pool)
+            for spec in specs
+            for env in (source, target)
+        }
+        for key, fut in futs.items():
+            pulled[key] = fut.result()
+    pull_s = time.monotonic() - t0
+    for s in sessions.values():
+        s.close()
+
+    print("")
+    print("PULL:")
+    print(f"{'env':<5} {'doctype':<26} {'records':>8} {'calls':>6} {'fetch_s':>8} {'hash_s':>7}")
+    for (env, dt), p in pulled.items():
+        print(f"{env:<5} {dt:<26} {len(p.hashes):>8} {p.calls:>6} {p.fetch_s:>8.2f} {p.hash_s:>7.3f}")
+
+    t1 = time.monotonic()
+    changes: Dict[str, Dict[str, Any]] = {spec["doctype"]: diff_pulled(pulled[(source, spec["doctype"])], pulled[(target, spec["doctype"])]) for spec in specs}
+    diff_s = time.monotonic() - t1
+
+    print("")
+    print(f"DIFF ({source} -> {target}):")
+    print(f"{'doctype':<26} {'create':>7} {'update':>7} {'only_in_' + target:>13} {'same':>7}")
+    for dt, d in changes.items():
+        c = d["counts"]
+        print(f"{dt:<26} {c['create']:>7} {c['update']:>7} {c['only_in_target']:>13} {c['same']:>7}")
+    for dt, d in changes.items():
+        lines = [f"+ {dt}  {e['name']}" for e in d["create"]]
+        lines += [f"~ {dt}  {e['name']}  fields={','.join(e['fields'])}" for e in d["update"]]
+        lines += [f"- {dt}  {n}  (only in {target})" for n in d["only_in_target"]]
+        for ln in lines[: args.show]:
+            print(ln)
+        if len(lines) > args.show:
+            print(f"  ... ({len(lines) - args.show} more {dt}, see file)")
+
+    totals = {k: sum(d["counts"][k] for d in changes.values()) for k in ("create", "update", "only_in_target", "same")}
+    out_path = Path(args.out) if args.out.strip() else _default_out_path(source, target)
+    write_json(
+        out_path,
+        {
+            "version": 1,
+            "source": source,
+            "target": target,
+            "profile": args.profile,
+            "generated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "ignore_fields": sorted(ignore),
+            "child_ignore_fields": sorted(child_ignore),
+            "totals": totals,
+            "doctypes": changes,
+        },
+    )
+
+    print("")
+    print(f"TOTALS={json.dumps(totals, ensure_ascii=False)}")
+    print(f"PULL_SECONDS={pull_s:.2f}  DIFF_SECONDS={diff_s:.3f}")
+    print(f"CHANGESET_SAVED_TO={out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
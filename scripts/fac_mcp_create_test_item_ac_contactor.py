@@ -9,6 +9,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret, repo_root
+from _lib_output import write_json
 
 
 def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
@@ -183,7 +184,7 @@ def main(argv: list[str]) -> int:
 
     out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env, args.item_code)
     out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(create_parsed, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
+    write_json(out_path, create_parsed)
     print(f"SAVED_TO={out_path}")
     return 0
 
@@ -3,11 +3,16 @@ from __future__ import annotations
 import argparse
 import json
 import sys
+import time
 import urllib.error
 import urllib.request
+from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
+from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret, repo_root
+from _lib_item_uoms import apply_uoms_code
+from _lib_output import open_output
+from _lib_plate_calc import compute_plate_factors, has_numpy, load_plate_rows
 
 
 def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
@@ -96,13 +101,198 @@ def _unwrap_doc(obj: Any) -> Any:
     return obj
 
 
+def _extract_stdout(parsed: Any) -> str:
+    # Best-effort: captured stdout of run_python_code ({"result": {"output": "..."}}; key names vary).
+    if isinstance(parsed, str):
+        return parsed
+    if not isinstance(parsed, dict):
+        return ""
+    for k in ("output", "stdout"):
+        v = parsed.get(k)
+        if isinstance(v, str):
+            return v
+    r = parsed.get("result")
+    if isinstance(r, (dict, str)):
+        return _extract_stdout(r)
+    return ""
+
+
+def _run_code(mcp_url: str, auth_header_value: str, code: str, rpc_id: int) -> Tuple[Any, List[Tuple[str, Any]]]:
+    """Run code via run_python_code; return (parsed response, [(tag, json payload)] for `X|{json}` lines)."""
+    resp = _mcp_call(
+        mcp_url,
+        auth_header_value,
+        {"jsonrpc": "2.0", "method": "tools/call", "params": {"name": "run_python_code", "arguments": {"code": code}}, "id": rpc_id},
+    )
+    texts = _extract_text_content(resp)
+    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
+    lines: List[Tuple[str, Any]] = []
+    for line in _extract_stdout(parsed).splitlines():
+        line = line.strip()
+        if len(line) > 2 and line[1] == "|":
+            try:
+                lines.append((line[0], json.loads(line[2:])))
+            except Exception:
+                continue
+    return parsed, lines
+
+
+def _default_bulk_out_path(env: str) -> Path:
+    return repo_root() / "work" / env / "operations" / "uoms" / f"{time.strftime('%Y%m%d_%H%M%S')}_steel_plate_uoms.ndjson"
+
+
+def _bulk(args: argparse.Namespace) -> int:
+    cols = load_plate_rows(Path(args.items_file), default_density=args.density)
+    names: List[str] = cols["names"]
+    if not names:
+        raise ConfigError("输入文件没有任何钢板物料。")
+    if len(set(names)) != len(names):
+        raise ConfigError("输入文件中存在重复的物料 name。")
+
+    use_numpy = has_numpy() and not args.no_numpy
+    t0 = time.perf_counter()
+    factors = compute_plate_factors(names, cols["thickness"], cols["width"], cols["length"], cols["density"], use_numpy=use_numpy)
+    calc_ms = (time.perf_counter() - t0) * 1000
+    print(f"ITEMS={len(names)}  CALC={'numpy' if use_numpy else 'python'}  CALC_MS={calc_ms:.1f}")
+
+    cfg = load_env_config(args.env)
+    secrets = load_secrets(required=True)
+    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
+    mcp_url = cfg.mcp_base_url
+    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
+    print(f"FAC_MCP_ENDPOINT={mcp_url}")
+    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+
+    _ = _mcp_call(
+        mcp_url,
+        auth_header_value,
+        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
+    )
+
+    # 1) Current factors for all items in one server call.
+    names_json = json.dumps(names, ensure_ascii=False)
+    read_code = f'''
+names = json.loads({names_json!r})
+found = set(frappe.get_all("Item", filters={{"name": ["in", names]}}, pluck="name", limit_page_length=0))
+rows = frappe.get_all(
+    "UOM Conversion Detail",
+    filters={{"parenttype": "Item", "parent": ["in", names]}},
+    fields=["parent", "uom", "conversion_factor"],
+    limit_page_length=0,
+)
+cur = {{}}
+for r in rows:
+    cur.setdefault(r.parent, {{}})[r.uom] = float(r.conversion_factor or 0)
+print("C|" + json.dumps(cur, ensure_ascii=False))
+print("M|" + json.dumps([n for n in names if n not in found], ensure_ascii=False))
+'''
+    _, lines = _run_code(mcp_url, auth_header_value, read_code, rpc_id=2)
+    current: Dict[str, Dict[str, float]] = {}
+    missing: List[str] = []
+    for tag, payload in lines:
+        if tag == "C" and isinstance(payload, dict):
+            current = payload
+        elif tag == "M" and isinstance(payload, list):
+            missing = [str(x) for x in payload]
+    if not lines:
+        raise ConfigError("无法解析服务器返回的现有 uoms（run_python_code 输出为空）。")
+    missing_set = set(missing)
+
+    # 2) Diff desired vs current factors.
+    diff_rows: List[dict] = []
+    updates: Dict[str, List[List[Any]]] = {}
+    for i, name in enumerate(names):
+        if name in missing_set:
+            continue
+        desired = [
+            (args.stock_uom, 1.0),
+            (args.purchase_uom, 1000.0),
+            (args.uom_meter, float(factors.meter_weight[i])),
+            (args.uom_sheet, float(factors.sheet_weight[i])),
+        ]
+        have = current.get(name) or {}
+        changed: List[List[Any]] = []
+        for uom, cf in desired:
+            old = have.get(uom)
+            if old is None or abs(float(old) - cf) > args.tolerance:
+                changed.append([uom, cf])
+                diff_rows.append({"name": name, "uom": uom, "old": old, "new": cf})
+        if changed:
+            updates[name] = changed
+
+    out_path = Path(args.out) if args.out.strip() else _default_bulk_out_path(args.env)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open_output(out_path) as f:
+        for r in diff_rows:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
+    print("")
+    print(f"MISSING_ITEMS={len(missing)}  CHANGED_ITEMS={len(updates)}  CHANGED_FACTORS={len(diff_rows)}")
+    for name in missing[: args.show]:
+        print(f"- missing: {name}")
+    print("DIFF (name  uom  old -> new):")
+    for r in diff_rows[: args.show]:
+        old = "-" if r["old"] is None else r["old"]
+        print(f"  {r['name']}  {r['uom']}  {old} -> {r['new']}")
+    if len(diff_rows) > args.show:
+        print(f"  ... ({len(diff_rows) - args.show} more, see file)")
+    print(f"DIFF_SAVED_TO={out_path}")
+
+    if args.dry_run or not updates:
+        print("")
+        print("DRY_RUN: no writes." if args.dry_run else "NOTHING_TO_UPDATE.")
+        return 0
+
+    # 3) Apply all changed factors server-side (one run_python_code per chunk).
+    todo = list(updates.items())
+    chunk_size = max(1, int(args.chunk_size))
+    stats: Dict[str, int] = {}
+    errors: List[Any] = []
+    for ci in range(0, len(todo), chunk_size):
+        chunk = dict(todo[ci : ci + chunk_size])
+        chunk_json = json.dumps(chunk, ensure_ascii=False)
+        apply_code = f'''
+updates = json.loads({chunk_json!r})
+for item_name, pairs in updates.items():
+    try:
+        doc = frappe.get_doc("Item", item_name)
+{apply_uoms_code("        ")}        print("R|" + json.dumps([item_name, "updated", ""], ensure_ascii=False))
+    except Exception as e:
+        print("R|" + json.dumps([item_name, "error", str(e)], ensure_ascii=False))
+'''
+        _, lines = _run_code(mcp_url, auth_header_value, apply_code, rpc_id=3 + ci // chunk_size)
+        for tag, payload in lines:
+            if tag == "R" and isinstance(payload, list) and len(payload) == 3:
+                stats[payload[1]] = stats.get(payload[1], 0) + 1
+                if payload[1] == "error":
+                    errors.append(payload)
+        print(f"PROGRESS items={min(ci + chunk_size, len(todo))}/{len(todo)}  {json.dumps(stats, ensure_ascii=False)}")
+
+    print("")
+    print(f"APPLIED={json.dumps(stats, ensure_ascii=False)}")
+    for e in errors[: args.show]:
+        print(f"- error: {e[0]}: {e[2]}")
+    return 0 if stats.get("updated", 0) == len(todo) else 2
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(description="为钢板物料补齐 uoms 转换（米/张），基于模板公式计算（DEV 推荐）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
-    ap.add_argument("--item", required=True, help="Item.name（例如 10110004）")
-    ap.add_argument("--thickness", type=float, required=True, help="厚度 mm")
-    ap.add_argument("--width", type=int, required=True, help="宽度 mm")
-    ap.add_argument("--length", type=int, required=True, help="长度 mm")
+    ap.add_argument("--item", default="", help="Item.name（例如 10110004）；单条模式必填")
+    ap.add_argument("--thickness", type=float, default=None, help="厚度 mm（单条模式）")
+    ap.add_argument("--width", type=int, default=None, help="宽度 mm（单条模式）")
+    ap.add_argument("--length", type=int, default=None, help="长度 mm（单条模式）")
+    ap.add_argument(
+        "--items-file",
+        default="",
+        help="批量模式：CSV/JSON/NDJSON，列 name,thickness,width,length[,density]（也接受 厚度/宽度/长度/密度）",
+    )
+    ap.add_argument("--dry-run", action="store_true", help="批量模式：只输出换算系数差异，不写入")
+    ap.add_argument("--tolerance", type=float, default=1e-6, help="批量模式：系数差异阈值（默认 1e-6）")
+    ap.add_argument("--chunk-size", type=int, default=500, help="批量模式：每次服务器写入的物料数（默认 500）")
+    ap.add_argument("--no-numpy", action="store_true", help="批量模式：强制使用纯 Python 计算")
+    ap.add_argument("--show", type=int, default=20, help="批量模式：终端最多显示的差异行数（默认 20）")
+    ap.add_argument("--out", default="", help="批量模式：差异 NDJSON 保存路径（默认 work/<env>/operations/uoms/...ndjson）")
     ap.add_argument("--density", type=float, default=7.85, help="密度 g/cm3（默认 7.85）")
     ap.add_argument("--stock-uom", default="千克", help="stock_uom（默认 千克）")
     ap.add_argument("--purchase-uom", default="吨", help="purchase_uom（默认 吨）")
@@ -114,6 +304,11 @@ def main(argv: list[str]) -> int:
     if args.env == "prod" and not args.confirm_prod:
         raise ConfigError("禁止默认在 PROD 更新单据。若确需在 prod，请显式传入 --confirm-prod，并先通过 preflight 双确认。")
 
+    if args.items_file.strip():
+        return _bulk(args)
+    if not args.item.strip() or args.thickness is None or args.width is None or args.length is None:
+        raise ConfigError("单条模式需要 --item --thickness --width --length（或改用 --items-file 批量模式）。")
+
     cfg = load_env_config(args.env)
     secrets = load_secrets(required=True)
     auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
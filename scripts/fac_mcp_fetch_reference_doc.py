@@ -3,109 +3,17 @@ from __future__ import annotations
 import argparse
 import json
 import sys
-import urllib.error
-import urllib.request
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret, repo_root
+from _lib_config import ConfigError, repo_root
+from _lib_mcp import McpSession
+from _lib_output import write_json
 
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=25) as resp:
-            raw = resp.read(1024 * 512)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 512)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
-    return out
-
-
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
-        return None
-    try:
-        return json.loads(t)
-    except Exception:
-        return t
-
-
-def _extract_data_list(obj: Any) -> List[Any]:
-    """
-    Normalize list_documents output shapes (best effort).
-    Common FAC shape: {"success":true,"result":{"data":[...]}}
-    """
-    if isinstance(obj, list):
-        return obj
-    if not isinstance(obj, dict):
-        return []
-    # Sometimes the list is directly under result/data
-    r = obj.get("result")
-    if isinstance(r, dict):
-        data = r.get("data")
-        if isinstance(data, list):
-            return data
-    # Or directly under data
-    data = obj.get("data")
-    if isinstance(data, list):
-        return data
-    return []
-
-
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError(
-        "缺少 MCP 鉴权信息：\n"
-        "- 推荐：config/secrets.local.yaml -> mcp_token（OAuth 2.0 Bearer access_token）\n"
-        "- 兼容：填写 rest_api_key/rest_api_secret 后，本脚本会尝试用 Authorization: token 访问 MCP\n"
-    )
+# Names per `in` filter in the batched exact-match pass (keeps each request small).
+RESOLVE_CHUNK = 200
 
 
 def _safe_filename(s: str) -> str:
@@ -121,8 +29,12 @@ def _doctype_slug(doctype: str) -> str:
     return _safe_filename(doctype).lower()
 
 
+def _default_out_dir(env: str, doctype: str) -> Path:
+    return repo_root() / "work" / env / "reference" / _doctype_slug(doctype)
+
+
 def _default_out_path(env: str, doctype: str, docname: str) -> Path:
-    return repo_root() / "work" / env / "reference" / _doctype_slug(doctype) / f"{_safe_filename(docname)}.json"
+    return _default_out_dir(env, doctype) / f"{_safe_filename(docname)}.json"
 
 
 def _parse_json_obj(s: str) -> dict:
@@ -135,16 +47,188 @@ def _parse_json_obj(s: str) -> dict:
     return v
 
 
-def main(argv: list[str]) -> int:
+def _names_of(rows: List[Any]) -> List[str]:
+    out: List[str] = []
+    for c in rows:
+        if isinstance(c, dict) and isinstance(c.get("name"), str):
+            out.append(c["name"])
+        elif isinstance(c, str):
+            out.append(c)
+    return out
+
+
+def _read_list_file(path: str) -> List[str]:
+    p = Path(path)
+    if not p.exists():
+        raise ConfigError(f"列表文件不存在：{p}")
+    return [ln.strip() for ln in p.read_text(encoding="utf-8-sig").splitlines() if ln.strip() and not ln.lstrip().startswith("#")]
+
+
+def _dedupe(values: List[str]) -> List[str]:
+    return list(dict.fromkeys(v.strip() for v in values if v and v.strip()))
+
+
+def _match_key(v: Any) -> str:
+    # MariaDB's default collations compare case-insensitively and ignore trailing spaces, so an
+    # `in` filter returns `ITEM-001` for `item-001`; key exact hits the same way.
+    return str(v).rstrip(" ").casefold()
+
+
+def _list_checked(session: McpSession, doctype: str, filters: Any, limit: int) -> List[Any]:
+    """list_documents for candidate names; an error response raises instead of reading as "no match"."""
+    parsed, rows = session.list_documents(doctype, ["name"], filters=filters, limit=limit)
+    if isinstance(parsed, dict) and (parsed.get("success") is False or parsed.get("error")):
+        raise ConfigError(f"list_documents 失败（{doctype}）：\n{json.dumps(parsed, ensure_ascii=False, indent=2, default=str)[:2000]}")
+    found = _names_of(rows)
+    if rows and not found:
+        raise ConfigError(f"搜索结果无法解析 name 字段：\n{json.dumps(parsed, ensure_ascii=False, indent=2, default=str)[:2000]}")
+    return found
+
+
+def _resolve(
+    session: McpSession,
+    doctype: str,
+    names: List[str],
+    queries: List[str],
+    search_field: str,
+    limit: int,
+    pool: ThreadPoolExecutor,
+) -> Dict[str, List[str]]:
+    """
+    Candidates per target ("name:<x>" / "query:<x>"), in two passes instead of two
+    requests per target:
+
+    1. exact match for every target at once (`<field> in [...]`, one paged query per field)
+    2. `like %q%` only for queries without an exact hit, issued concurrently
+    """
+    by_field: Dict[str, List[str]] = {}
+    if names:
+        by_field.setdefault("name", []).extend(names)
+    if queries:
+        by_field.setdefault(search_field, []).extend(queries)
+
+    def exact(field: str, values: List[str]) -> Dict[str, List[str]]:
+        hits: Dict[str, List[str]] = {}
+        fields = ["name"] if field == "name" else ["name", field]
+        for i in range(0, len(values), RESOLVE_CHUNK):
+            chunk = _dedupe(values[i : i + RESOLVE_CHUNK])
+            for r in session.iter_documents(doctype, fields, filters={field: ["in", chunk]}):
+                if isinstance(r, dict) and isinstance(r.get("name"), str):
+                    hits.setdefault(_match_key(r.get(field)), []).append(r["name"])
+        return hits
+
+    exact_hits = dict(zip(by_field, pool.map(lambda f: exact(f, by_field[f]), list(by_field))))
+    out: Dict[str, List[str]] = {}
+    for n in names:
+        out[f"name:{n}"] = exact_hits.get("name", {}).get(_match_key(n), [])
+    fuzzy: List[str] = []
+    for q in queries:
+        hit = exact_hits.get(search_field, {}).get(_match_key(q), [])
+        out[f"query:{q}"] = hit[:limit]
+        if not hit:
+            fuzzy.append(q)
+
+    def like(q: str) -> List[str]:
+        return _list_checked(session, doctype, {search_field: ["like", f"%{q}%"]}, limit)
+
+    for q, hit in zip(fuzzy, pool.map(like, fuzzy)):
+        out[f"query:{q}"] = hit
+    return out
+
+
+def _get_document(session: McpSession, doctype: str, name: str, fields: List[str]) -> Any:
+    get_args: dict = {"doctype": doctype, "name": name}
+    if fields:
+        get_args["fields"] = fields
+    return session.call_tool("get_document", get_args)
+
+
+def _fetch_and_save(session: McpSession, doctype: str, name: str, fields: List[str], out_path: Path) -> Dict[str, Any]:
+    """One worker task: get_document + atomic write (so fetches and writes both overlap)."""
+    t0 = time.monotonic()
+    try:
+        doc = _get_document(session, doctype, name, fields)
+        if isinstance(doc, dict) and (doc.get("success") is False or doc.get("error")):
+            return {"name": name, "status": "failed", "error": str(doc.get("error") or doc), "seconds": time.monotonic() - t0}
+        write_json(out_path, doc)
+    except ConfigError as e:
+        return {"name": name, "status": "failed", "error": str(e).splitlines()[0], "seconds": time.monotonic() - t0}
+    return {"name": name, "status": "fetched", "path": out_path, "seconds": time.monotonic() - t0}
+
+
+def _run_multi(session: McpSession, args: argparse.Namespace, names: List[str], queries: List[str], fields: List[str]) -> int:
+    jobs = max(1, int(args.jobs))
+    out_dir = Path(args.out_dir) if args.out_dir.strip() else _default_out_dir(args.env, args.doctype)
+    sf = args.search_field.strip() or "name"
+    t0 = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        candidates = _resolve(session, args.doctype, names, queries, sf, args.limit, pool)
+        resolve_s = time.monotonic() - t0
+
+        # target -> chosen name (or a reason it was not fetched)
+        chosen: Dict[str, Dict[str, Any]] = {}
+        for target, cands in candidates.items():
+            if not cands:
+                chosen[target] = {"status": "missing"}
+            elif len(cands) > 1 and not args.allow_multi:
+                chosen[target] = {"status": "ambiguous", "candidates": cands}
+            elif max(1, int(args.pick)) > len(cands):
+                chosen[target] = {"status": "missing", "error": f"pick={args.pick} 超出候选数 {len(cands)}"}
+            else:
+                chosen[target] = {"status": "resolved", "name": cands[max(1, int(args.pick)) - 1]}
+
+        to_fetch = _dedupe([c["name"] for c in chosen.values() if c["status"] == "resolved"])
+        results = {
+            r["name"]: r
+            for r in pool.map(
+                lambda n: _fetch_and_save(session, args.doctype, n, fields, out_dir / f"{_safe_filename(n)}.json"),
+                to_fetch,
+            )
+        }
+    wall = time.monotonic() - t0
+
+    print("")
+    print("RESULTS:")
+    counts = {"fetched": 0, "missing": 0, "ambiguous": 0, "failed": 0}
+    for target, c in chosen.items():
+        status = c["status"]
+        detail = ""
+        if status == "resolved":
+            r = results[c["name"]]
+            status = r["status"]
+            detail = c["name"] if status == "fetched" else f"{c['name']}  {r['error']}"
+        elif status == "ambiguous":
+            detail = f"{len(c['candidates'])} 个候选：{', '.join(c['candidates'][:5])}{' ...' if len(c['candidates']) > 5 else ''}"
+        elif c.get("error"):
+            detail = c["error"]
+        counts[status] += 1
+        print(f"- [{status}] {target}{'  -> ' + detail if detail else ''}")
+
+    print("")
+    print(
+        f"TARGETS={len(chosen)}  FETCHED={counts['fetched']}  MISSING={counts['missing']}  "
+        f"AMBIGUOUS={counts['ambiguous']}  FAILED={counts['failed']}  DOCS={len(results)}"
+    )
+    print(f"JOBS={jobs}  RESOLVE_SECONDS={resolve_s:.2f}  TOTAL_SECONDS={wall:.2f}")
+    print(f"SAVED_DIR={out_dir}")
+    if counts["ambiguous"]:
+        print("提示：存在多个候选的目标未保存；请改用精确 name，或加 --allow-multi --pick N。")
+    return 0 if counts["fetched"] == len(chosen) else 2
+
+
+def main(argv: list[str], session: Optional[McpSession] = None) -> int:
     ap = argparse.ArgumentParser(
-        description="按需拉取并保存单个 reference 文档（MCP 只读）：先查找，再仅保存命中的那一条。",
+        description="按需拉取并保存 reference 文档（MCP 只读）：先查找，再仅保存命中的文档；多个目标时批量解析、并发拉取。",
     )
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
     ap.add_argument("--doctype", required=True, help='DocType（例如 "Item Parameter Template"）')
-    ap.add_argument("--name", default="", help="精确 name（提供后将直接 get_document，不再搜索）")
-    ap.add_argument("--query", default="", help="模糊查找关键词（例如 电机模板）")
+    ap.add_argument("--name", action="append", default=[], help="精确 name（单个时直接 get_document，不再搜索；可重复）")
+    ap.add_argument("--query", action="append", default=[], help="模糊查找关键词（例如 电机模板；可重复）")
+    ap.add_argument("--names-file", default="", help="多目标：每行一个精确 name 的文本文件（# 开头为注释）")
+    ap.add_argument("--queries-file", default="", help="多目标：每行一个查找关键词的文本文件")
     ap.add_argument("--search-field", default="name", help="用于搜索的字段名（默认 name）")
-    ap.add_argument("--limit", type=int, default=20, help="搜索返回条数上限（默认 20）")
+    ap.add_argument("--limit", type=int, default=20, help="每个关键词的搜索返回条数上限（默认 20）")
     ap.add_argument("--pick", type=int, default=1, help="当存在多个候选时，选择第 N 个（默认 1）")
     ap.add_argument("--allow-multi", action="store_true", help="当存在多个候选时允许自动 pick（默认会报错要求更精确）")
     ap.add_argument(
@@ -157,82 +241,46 @@ def main(argv: list[str]) -> int:
         default="",
         help='可选：高级过滤器（JSON 对象，原样传给 list_documents.filters），例如 {"name":["like","%%电机%%"]}',
     )
-    ap.add_argument("--out", default="", help="保存路径（默认 work/<env>/reference/<doctype>/<name>.json）")
+    ap.add_argument("--out", default="", help="保存路径（单目标；默认 work/<env>/reference/<doctype>/<name>.json）")
+    ap.add_argument("--out-dir", default="", help="保存目录（多目标；默认 work/<env>/reference/<doctype>/）")
+    ap.add_argument("--jobs", type=int, default=8, help="多目标时并发解析/拉取/写入的线程数（默认 8）")
     args = ap.parse_args(argv)
 
-    if not args.name.strip() and not args.query.strip() and not args.filters_json.strip():
-        raise ConfigError("必须提供 --name 或 --query 或 --filters-json 之一。")
+    names = _dedupe(args.name + (_read_list_file(args.names_file) if args.names_file.strip() else []))
+    queries = _dedupe(args.query + (_read_list_file(args.queries_file) if args.queries_file.strip() else []))
+    multi = len(names) + len(queries) > 1 or bool(args.names_file.strip() or args.queries_file.strip())
 
-    cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
-    mcp_url = cfg.mcp_base_url
+    if not names and not queries and not args.filters_json.strip():
+        raise ConfigError("必须提供 --name 或 --query 或 --filters-json 之一（多目标可用 --names-file/--queries-file）。")
+    if multi and args.filters_json.strip():
+        raise ConfigError("--filters-json 只能用于单目标；多目标请用 --name/--query（可重复）或列表文件。")
+    if multi and args.out.strip():
+        raise ConfigError("多目标时请用 --out-dir 指定保存目录（--out 只用于单目标）。")
 
-    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+    if session is None:
+        session = McpSession.from_env(args.env)
+        session.print_banner()
     print(f"DOCTYPE={args.doctype}")
+    session.initialize()
 
-    _ = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+    if multi:
+        return _run_multi(session, args, names, queries, fields)
 
     # 1) Determine target docname
-    target_name = args.name.strip()
+    target_name = names[0] if names else ""
     if not target_name:
-        filters: dict
         if args.filters_json.strip():
-            filters = _parse_json_obj(args.filters_json.strip())
+            found = _list_checked(session, args.doctype, _parse_json_obj(args.filters_json.strip()), args.limit)
         else:
-            q = args.query.strip()
-            sf = args.search_field.strip() or "name"
-            # Try exact match first; then best-effort "like"
-            filters_try = [{sf: q}, {sf: ["like", f"%{q}%"]}]
-            filters = {}
-
-        candidates: List[Any] = []
-        if args.filters_json.strip():
-            filters_list = [filters]
-        else:
-            q = args.query.strip()
-            sf = args.search_field.strip() or "name"
-            filters_list = [{sf: q}, {sf: ["like", f"%{q}%"]}]
-
-        last_parsed: Any = None
-        for f in filters_list:
-            resp = _mcp_call(
-                mcp_url,
-                auth_header_value,
-                {
-                    "jsonrpc": "2.0",
-                    "method": "tools/call",
-                    "params": {"name": "list_documents", "arguments": {"doctype": args.doctype, "filters": f, "fields": ["name"], "limit": args.limit}},
-                    "id": 2,
-                },
-            )
-            texts = _extract_text_content(resp)
-            last_parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
-            candidates = _extract_data_list(last_parsed)
-            if candidates:
-                break
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                found = _resolve(session, args.doctype, [], queries, args.search_field.strip() or "name", args.limit, pool)[f"query:{queries[0]}"]
 
-        if not candidates:
+        if not found:
             raise ConfigError(f"未找到匹配项（doctype={args.doctype}）。你可以改用 --filters-json 传入更精确过滤器。")
 
-        names: List[str] = []
-        for c in candidates:
-            if isinstance(c, dict) and isinstance(c.get("name"), str):
-                names.append(c["name"])
-            elif isinstance(c, str):
-                names.append(c)
-
-        if not names:
-            raise ConfigError(f"搜索结果无法解析 name 字段：\n{json.dumps(last_parsed, ensure_ascii=False, indent=2, default=str)}")
-
-        if len(names) > 1 and not args.allow_multi:
-            preview = "\n".join([f"{i+1}. {n}" for i, n in enumerate(names[:20])])
+        if len(found) > 1 and not args.allow_multi:
+            preview = "\n".join([f"{i+1}. {n}" for i, n in enumerate(found[:20])])
             raise ConfigError(
                 "匹配到多个候选项，为避免误存，已中止。\n"
                 "请：\n"
@@ -243,29 +291,17 @@ def main(argv: list[str]) -> int:
             )
 
         pick_idx = max(1, int(args.pick)) - 1
-        if pick_idx >= len(names):
-            raise ConfigError(f"--pick 超出范围：pick={args.pick} 但候选数={len(names)}")
-        target_name = names[pick_idx]
+        if pick_idx >= len(found):
+            raise ConfigError(f"--pick 超出范围：pick={args.pick} 但候选数={len(found)}")
+        target_name = found[pick_idx]
 
     print(f"TARGET_NAME={target_name}")
 
     # 2) Fetch the full (or partial) document
-    get_args: dict = {"doctype": args.doctype, "name": target_name}
-    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
-    if fields:
-        get_args["fields"] = fields
-
-    doc_resp = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "tools/call", "params": {"name": "get_document", "arguments": get_args}, "id": 3},
-    )
-    doc_texts = _extract_text_content(doc_resp)
-    doc_parsed = _best_effort_parse_json_text(doc_texts[0]) if doc_texts else doc_resp
+    doc_parsed = _get_document(session, args.doctype, target_name, fields)
 
     out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env, args.doctype, target_name)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(doc_parsed, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
+    write_json(out_path, doc_parsed)
 
     print("")
     print("SAVED_TO:")
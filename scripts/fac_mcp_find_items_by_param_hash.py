@@ -1,129 +1,163 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import json
+import re
 import sys
-import urllib.error
-import urllib.request
-from typing import Any, Dict, List, Optional, Tuple
-
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=25) as resp:
-            raw = resp.read(1024 * 512)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 512)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
+import time
+from pathlib import Path
+from typing import Dict, List, TextIO, Tuple
+
+from _lib_cache_manager import record_use
+from _lib_config import ConfigError
+from _lib_hash_index import HashIndex, default_index_path
+from _lib_mcp import McpSession
+from _lib_output import open_input, open_output
+
+
+_ITEM_FIELDS = ["name", "item_code", "item_name", "item_group", "custom_unique_item_name", "custom_param_hash"]
+_MD5_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _read_hashes(src: TextIO) -> Tuple[List[str], List[str]]:
+    """Return (unique valid hashes in input order, invalid lines). Blank lines and `#` comments are skipped."""
+    seen = set()
+    hashes: List[str] = []
+    invalid: List[str] = []
+    for line in src:
+        h = line.strip().lower()
+        if not h or h.startswith("#"):
+            continue
+        if not _MD5_RE.match(h):
+            invalid.append(line.strip())
+            continue
+        if h not in seen:
+            seen.add(h)
+            hashes.append(h)
+    return hashes, invalid
+
+
+def _lookup_chunk(session: McpSession, chunk: List[str], page_size: int) -> List[dict]:
+    """One IN-filter query, paged by keyset until exhausted (no truncation for hashes with many hits)."""
+    rows = session.iter_documents(
+        "Item", _ITEM_FIELDS, filters={"custom_param_hash": ["in", chunk]}, page_size=page_size, prefetch=False
     )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
-    return out
-
-
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
-        return None
+    return [r for r in rows if isinstance(r, dict)]
+
+
+def _batch(session: McpSession, hashes: List[str], chunk_size: int, per_hash: int, out: TextIO) -> Dict[str, int]:
+    stats = {"hashes": len(hashes), "found": 0, "missing": 0, "items": 0}
+    started = time.monotonic()
+    for ci in range(0, len(hashes), chunk_size):
+        chunk = hashes[ci : ci + chunk_size]
+        rows = _lookup_chunk(session, chunk, page_size=max(1, len(chunk) * per_hash))
+        by_hash: Dict[str, List[dict]] = {}
+        for r in rows:
+            by_hash.setdefault(str(r.get("custom_param_hash") or "").lower(), []).append(r)
+        for h in chunk:
+            items = by_hash.get(h) or []
+            stats["found" if items else "missing"] += 1
+            stats["items"] += len(items)
+            out.write(json.dumps({"hash": h, "found": bool(items), "items": items}, ensure_ascii=False, default=str) + "\n")
+        out.flush()
+        done = min(ci + chunk_size, len(hashes))
+        rate = done / max(1e-6, time.monotonic() - started)
+        print(f"PROGRESS hashes={done}/{len(hashes)}  rate={rate:.0f}/s", file=sys.stderr)
+    return stats
+
+
+def _main_local(args: argparse.Namespace) -> int:
+    path = default_index_path(args.env)
+    if not path.exists():
+        raise ConfigError(f"本地索引不存在：{path}\n请先运行：python scripts/param_hash_index.py --env {args.env}")
+    if args.hash.strip():
+        hashes = [args.hash.strip().lower()]
+    elif args.hashes_file.strip() == "-":
+        hashes, _ = _read_hashes(sys.stdin)
+    else:
+        with open_input(Path(args.hashes_file.strip())) as f:
+            hashes, _ = _read_hashes(f)
+
+    record_use(path.parent.parent, "hash_index")
+    idx = HashIndex(path)
     try:
-        return json.loads(t)
-    except Exception:
-        return t
+        synced = idx.get_meta("synced_at")
+        age = f"{int(time.time()) - int(synced)}s" if synced else "unknown"
+        print(f"LOCAL_INDEX={path}  ROWS={idx.count()}  AGE={age}", file=sys.stderr)
+        found = 0
+        t0 = time.perf_counter()
+        with (open_output(Path(args.out.strip())) if args.out.strip() else contextlib.nullcontext(sys.stdout)) as out:
+            for h in hashes:
+                names = idx.by_hash(h)
+                found += 1 if names else 0
+                out.write(json.dumps({"hash": h, "found": bool(names), "items": [{"name": n} for n in names]}, ensure_ascii=False) + "\n")
+        dt_us = (time.perf_counter() - t0) * 1e6 / max(1, len(hashes))
+        print(f"SUMMARY={json.dumps({'hashes': len(hashes), 'found': found, 'missing': len(hashes) - found}, ensure_ascii=False)}  US_PER_HASH={dt_us:.1f}", file=sys.stderr)
+    finally:
+        idx.close()
+    return 0
 
 
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+def _main_batch(args: argparse.Namespace, session: McpSession) -> int:
+    # Diagnostics go to stderr so stdout can be piped as pure NDJSON.
+    session.print_banner(file=sys.stderr)
+
+    src = args.hashes_file.strip()
+    if src == "-":
+        hashes, invalid = _read_hashes(sys.stdin)
+    else:
+        with open_input(Path(src)) as f:
+            hashes, invalid = _read_hashes(f)
+    print(f"HASHES={len(hashes)}  INVALID={len(invalid)}", file=sys.stderr)
+    for bad in invalid[:10]:
+        print(f"- invalid: {bad}", file=sys.stderr)
+    if not hashes:
+        raise ConfigError("没有可查询的 hash（需要 32 位 md5）。")
+
+    session.initialize()
+
+    chunk_size = max(1, int(args.chunk_size))
+    per_hash = max(1, int(args.limit))
+    if args.out.strip():
+        out_path = Path(args.out.strip())
+        with open_output(out_path) as f:
+            stats = _batch(session, hashes, chunk_size, per_hash, f)
+        print(f"SAVED_TO={out_path}", file=sys.stderr)
+    else:
+        stats = _batch(session, hashes, chunk_size, per_hash, sys.stdout)
+    print(f"SUMMARY={json.dumps(stats, ensure_ascii=False)}", file=sys.stderr)
+    return 0
 
 
 def main(argv: list[str]) -> int:
-    ap = argparse.ArgumentParser(description="按 custom_param_hash 查找 Item（用于快速判重）。")
+    ap = argparse.ArgumentParser(description="按 custom_param_hash 查找 Item（用于快速判重；支持批量）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
-    ap.add_argument("--hash", required=True, help="custom_param_hash（32 位 md5）")
-    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--hash", default="", help="custom_param_hash（32 位 md5）")
+    ap.add_argument("--hashes-file", default="", help="批量模式：每行一个 hash 的文件；传 - 表示从 stdin 读取")
+    ap.add_argument("--chunk-size", type=int, default=200, help="批量模式：每次 IN 查询的 hash 数（默认 200）")
+    ap.add_argument("--out", default="", help="批量模式：NDJSON 输出文件（默认输出到 stdout）")
+    ap.add_argument("--limit", type=int, default=20, help="单条模式返回上限；批量模式为每个 hash 预估的命中数（只影响分页大小，结果按 keyset 分页取全）")
+    ap.add_argument(
+        "--local",
+        action="store_true",
+        help="只查本地索引（cache/<env>/items/，先运行 param_hash_index.py 同步），不访问 MCP",
+    )
     args = ap.parse_args(argv)
 
-    cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth, auth_label, raw = _auth_from_secrets(secrets)
-    mcp_url = cfg.mcp_base_url
+    if bool(args.hash.strip()) == bool(args.hashes_file.strip()):
+        raise ConfigError("必须且只能提供 --hash 或 --hashes-file 之一。")
+    if args.local:
+        return _main_local(args)
 
-    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
-    print(f"HASH={args.hash}")
+    session = McpSession.from_env(args.env)
+    if args.hashes_file.strip():
+        return _main_batch(args, session)
 
-    _ = _mcp_call(
-        mcp_url,
-        auth,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
+    session.print_banner()
+    print(f"HASH={args.hash}")
 
-    resp = _mcp_call(
-        mcp_url,
-        auth,
-        {
-            "jsonrpc": "2.0",
-            "method": "tools/call",
-            "params": {
-                "name": "list_documents",
-                "arguments": {
-                    "doctype": "Item",
-                    "filters": {"custom_param_hash": args.hash},
-                    "fields": ["name", "item_code", "item_name", "item_group", "custom_unique_item_name", "custom_param_hash"],
-                    "limit": args.limit,
-                },
-            },
-            "id": 2,
-        },
-    )
-    texts = _extract_text_content(resp)
-    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
+    parsed, _ = session.list_documents("Item", _ITEM_FIELDS, filters={"custom_param_hash": args.hash}, limit=args.limit)
     print("")
     print(json.dumps(parsed, ensure_ascii=False, indent=2, default=str))
     return 0
@@ -3,82 +3,61 @@ from __future__ import annotations
 import argparse
 import json
 import sys
-import urllib.error
-import urllib.request
+import time
 from typing import Any, Dict, List, Optional, Tuple
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=25) as resp:
-            raw = resp.read(1024 * 1024)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 1024)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
-    return out
-
-
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
-        return None
-    try:
-        return json.loads(t)
-    except Exception:
-        return t
-
-
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+from _lib_config import ConfigError
+from _lib_mcp import McpSession
+
+# Scalar fields echoed into the summary when present (override with --fields).
+COMMON_FIELDS = (
+    "name",
+    "doctype",
+    "item_code",
+    "item_name",
+    "item_group",
+    "stock_uom",
+    "purchase_uom",
+    "custom_body_material",
+    "custom_source_type",
+    "custom_specification",
+    "custom_param_hash",
+    "custom_unique_item_name",
+    "is_stock_item",
+    "is_group",
+    "disabled",
+    "owner",
+    "creation",
+    "modified",
+)
+
+# Same summary as _summarize, built next to the data: only keys, the requested fields,
+# child-table lengths and the first rows travel back instead of the whole document.
+# NOTE: run_python_code forbids import statements; use frappe + json already available.
+_SERVER_SUMMARY_CODE = '''
+args = json.loads({args_json!r})
+doc = frappe.get_doc(args["doctype"], args["name"])
+doc.check_permission("read")
+d = doc.as_dict()
+out = {{"keys": sorted([k for k in d.keys() if isinstance(k, str)])}}
+for k in args["fields"]:
+    if k in d:
+        out[k] = d.get(k)
+lists = []
+for k, v in d.items():
+    if isinstance(k, str) and isinstance(v, list):
+        sample = [dict(r) if isinstance(r, dict) else r for r in v[: args["n"]]]
+        keys = set()
+        for r in sample:
+            if isinstance(r, dict):
+                for kk in r.keys():
+                    if isinstance(kk, str):
+                        keys.add(kk)
+        lists.append({{"field": k, "len": len(v), "sample_keys": sorted(keys), "sample": sample}})
+if lists:
+    out["list_fields"] = lists
+print("S|" + json.dumps(out, ensure_ascii=False, default=str))
+'''
 
 
 def _unwrap_doc(obj: Any) -> Any:
@@ -101,32 +80,13 @@ def _unwrap_doc(obj: Any) -> Any:
     return obj
 
 
-def _summarize(doc: Any, max_list_items: int) -> dict:
+def _summarize(doc: Any, max_list_items: int, fields: Tuple[str, ...] = COMMON_FIELDS) -> dict:
     if not isinstance(doc, dict):
         return {"type": type(doc).__name__, "value_preview": str(doc)[:200]}
 
     summary: dict = {"keys": sorted([k for k in doc.keys() if isinstance(k, str)])}
     # Include some common fields if present
-    for k in (
-        "name",
-        "doctype",
-        "item_code",
-        "item_name",
-        "item_group",
-        "stock_uom",
-        "purchase_uom",
-        "custom_body_material",
-        "custom_source_type",
-        "custom_specification",
-        "custom_param_hash",
-        "custom_unique_item_name",
-        "is_stock_item",
-        "is_group",
-        "disabled",
-        "owner",
-        "creation",
-        "modified",
-    ):
+    for k in fields:
         if k in doc:
             summary[k] = doc.get(k)
 
@@ -147,50 +107,82 @@ def _summarize(doc: Any, max_list_items: int) -> dict:
     return summary
 
 
+def _local_summary(session: McpSession, args: argparse.Namespace, fields: Tuple[str, ...]) -> Tuple[dict, int, float]:
+    """Full-fetch path: get_document, summarize here. Returns (summary, response bytes, seconds)."""
+    t0 = time.monotonic()
+    parsed = session.call_tool("get_document", {"doctype": args.doctype, "name": args.name})
+    size = session.last_response_bytes
+    return _summarize(_unwrap_doc(parsed), args.max_list_items, fields), size, time.monotonic() - t0
+
+
+def _server_summary(session: McpSession, args: argparse.Namespace, fields: Tuple[str, ...]) -> Tuple[dict, int, float]:
+    t0 = time.monotonic()
+    payload = json.dumps({"doctype": args.doctype, "name": args.name, "fields": list(fields), "n": max(0, args.max_list_items)}, ensure_ascii=False)
+    parsed, lines = session.run_code(_SERVER_SUMMARY_CODE.format(args_json=payload))
+    size = session.last_response_bytes
+    summary: Optional[dict] = next((p for tag, p in lines if tag == "S" and isinstance(p, dict)), None)
+    if summary is None:
+        raise ConfigError(
+            "服务端概要失败（run_python_code 无 S| 输出；可能无权限或单据不存在，可改用 --mode local）：\n"
+            f"{json.dumps(parsed, ensure_ascii=False, indent=2, default=str)[:2000]}"
+        )
+    return summary, size, time.monotonic() - t0
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
+
+
 def main(argv: list[str]) -> int:
     ap = argparse.ArgumentParser(description="使用 FAC MCP 拉取并概要分析单个单据（只读）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
     ap.add_argument("--doctype", required=True)
     ap.add_argument("--name", required=True)
     ap.add_argument("--max-list-items", type=int, default=5, help="子表/列表字段展示样本数量（默认 5）")
+    ap.add_argument(
+        "--mode",
+        choices=["local", "server", "compare"],
+        default="local",
+        help="local=get_document 全量拉取后本地概要（默认）；server=run_python_code 服务端概要，只回传键列表/子表行数/样本行；"
+        "compare=两种都跑并对比响应大小",
+    )
+    ap.add_argument("--fields", default="", help="概要中展示的字段（逗号分隔；默认常用 Item 字段）")
     args = ap.parse_args(argv)
 
-    cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
+    fields = tuple(f.strip() for f in args.fields.split(",") if f.strip()) or COMMON_FIELDS
 
-    mcp_url = cfg.mcp_base_url
-    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+    session = McpSession.from_env(args.env)
+    session.print_banner()
     print(f"DOCTYPE={args.doctype}")
     print(f"NAME={args.name}")
+    print(f"MODE={args.mode}")
+    session.initialize()
 
-    _ = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
-
-    resp = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {
-            "jsonrpc": "2.0",
-            "method": "tools/call",
-            "params": {"name": "get_document", "arguments": {"doctype": args.doctype, "name": args.name}},
-            "id": 2,
-        },
-    )
-    texts = _extract_text_content(resp)
-    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
-    doc = _unwrap_doc(parsed)
-    summary = _summarize(doc, args.max_list_items)
+    runs: Dict[str, Tuple[dict, int, float]] = {}
+    if args.mode in ("local", "compare"):
+        runs["full"] = _local_summary(session, args, fields)
+    if args.mode in ("server", "compare"):
+        runs["server"] = _server_summary(session, args, fields)
+    summary = runs["server" if "server" in runs else "full"][0]
 
     print("")
     print("SUMMARY:")
     # Windows console may not support some characters; keep output ASCII-safe.
     print(json.dumps(summary, ensure_ascii=True, indent=2, default=str))
+
+    if args.mode == "compare":
+        full_bytes = runs["full"][1]
+        print("")
+        print("SIZE_COMPARE:")
+        print(f"{'path':<8} {'response_bytes':>15} {'ratio':>7} {'seconds':>8}")
+        for label, (_, size, secs) in runs.items():
+            print(f"{label:<8} {size:>15} {size / max(1, full_bytes):>7.3f} {secs:>8.2f}")
+        same = _canonical(runs["full"][0]) == _canonical(runs["server"][0])
+        print(f"SAVED_BYTES={full_bytes - runs['server'][1]}  SUMMARY_MATCH={'true' if same else 'false'}")
+        if not same:
+            a, b = runs["full"][0], runs["server"][0]
+            diff = sorted(k for k in set(a) | set(b) if _canonical(a.get(k)) != _canonical(b.get(k)))
+            print(f"SUMMARY_DIFF_KEYS={','.join(diff)}")
     return 0
 
 
@@ -200,4 +192,3 @@ if __name__ == "__main__":
     except ConfigError as e:
         print(f"CONFIG_ERROR: {e}", file=sys.stderr)
         raise SystemExit(2)
-
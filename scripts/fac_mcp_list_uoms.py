@@ -1,134 +1,47 @@
 from __future__ import annotations
 
 import argparse
-import json
 import sys
-import urllib.error
-import urllib.request
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Optional
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret, repo_root
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=20) as resp:
-            raw = resp.read(1024 * 256)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 256)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
-    return out
-
-
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
-        return None
-    try:
-        return json.loads(t)
-    except Exception:
-        return t
-
-
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+from _lib_config import ConfigError, repo_root
+from _lib_delta_sync import add_delta_args, run_delta
+from _lib_mcp import McpSession
+from _lib_output import write_rows
 
 
 def _default_out_path(env: str) -> Path:
     return repo_root() / "work" / env / "reference" / "uoms.json"
 
 
-def main(argv: list[str]) -> int:
+def main(argv: list[str], session: Optional[McpSession] = None) -> int:
     ap = argparse.ArgumentParser(description="使用 FAC MCP 列出 UOM（用于选择 Item 的 stock_uom）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
-    ap.add_argument("--limit", type=int, default=200, help="返回条数（默认 200）")
-    ap.add_argument("--out", default="", help="保存结果到文件（默认 work/<env>/reference/uoms.json）")
+    ap.add_argument("--limit", type=int, default=0, help="最多返回条数（默认 0 = 全部，自动分页）")
+    ap.add_argument("--page-size", type=int, default=200, help="首页大小（默认 200；之后按响应耗时自适应）")
+    ap.add_argument("--out", default="", help="保存结果到文件（.json/.ndjson，可加 .gz/.zst；默认 work/<env>/reference/uoms.json）")
+    add_delta_args(ap)
     args = ap.parse_args(argv)
 
-    cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
-
-    mcp_url = cfg.mcp_base_url
-    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+    if session is None:
+        # Standalone run; init_reference_data.py passes its shared session instead.
+        session = McpSession.from_env(args.env)
+        session.print_banner()
+    session.initialize()
 
-    _ = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
+    out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env)
+    if args.delta:
+        return run_delta(session, args, "UOM", ["name"], out_path)
 
-    resp = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {
-            "jsonrpc": "2.0",
-            "method": "tools/call",
-            "params": {"name": "list_documents", "arguments": {"doctype": "UOM", "fields": ["name"], "limit": args.limit}},
-            "id": 2,
-        },
-    )
-    texts = _extract_text_content(resp)
-    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
+    stats: dict = {}
+    rows = session.iter_documents("UOM", ["name"], max_rows=args.limit, page_size=args.page_size, stats=stats)
 
     print("")
     print("UOM_LIST:")
-    print(json.dumps(parsed, ensure_ascii=False, indent=2, default=str))
-
-    out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env)
-    out_path.parent.mkdir(parents=True, exist_ok=True)
-    out_path.write_text(json.dumps(parsed, ensure_ascii=False, indent=2, default=str) + "\n", encoding="utf-8")
+    write_rows(out_path, rows, echo=sys.stdout)
     print("")
+    print(f"ROWS={stats['rows']}  PAGES={stats['pages']}  FETCH_SECONDS={stats['seconds']:.2f}")
     print(f"SAVED_TO={out_path}")
     return 0
 
@@ -139,4 +52,3 @@ if __name__ == "__main__":
     except ConfigError as e:
         print(f"CONFIG_ERROR: {e}", file=sys.stderr)
         raise SystemExit(2)
-
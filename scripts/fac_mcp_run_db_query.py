@@ -3,82 +3,88 @@ from __future__ import annotations
 import argparse
 import json
 import sys
-import urllib.error
-import urllib.request
-from typing import Any, Dict, List, Optional, Tuple
-
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            raw = resp.read(1024 * 1024)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 1024)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
-    return out
-
-
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from _lib_cache_manager import CacheManager, budget_bytes, cache_root_for
+from _lib_config import ConfigError, load_env_config, mask_secret
+from _lib_mcp import PAGE_SIZE_MAX, McpSession
+from _lib_output import row_sink, write_json, write_rows
+from _lib_query_cache import (
+    DEFAULT_TTL_SECONDS,
+    WATCH_TTL_SECONDS,
+    QueryCache,
+    is_cacheable,
+    is_read_only,
+    parse_watermarks,
+    query_key,
+    tables_in,
+    watermark_sql,
+)
+
+
+def _extract_rows(obj: Any) -> Optional[List[Any]]:
+    if isinstance(obj, list):
+        return obj
+    if isinstance(obj, dict):
+        for container in (obj.get("result"), obj):
+            if isinstance(container, dict):
+                for k in ("data", "rows", "results"):
+                    if isinstance(container.get(k), list):
+                        return container[k]
+    return None
+
+
+def _watermarks(session: McpSession, sql: str) -> Optional[Dict[str, str]]:
+    tables = tables_in(sql)
+    if not tables:
         return None
+    rows = _extract_rows(session.call_tool("run_database_query", {"query": watermark_sql(tables), "limit": 1}))
+    return parse_watermarks(tables, rows)
+
+
+class _Progress:
+    """Pass-through row iterator that prints throughput to stderr every few seconds."""
+
+    def __init__(self, rows, every_s: float = 5.0):
+        self.rows = rows
+        self.every_s = every_s
+        self.t0 = time.monotonic()
+        self.n = 0
+
+    def __iter__(self):
+        next_at = self.t0 + self.every_s
+        for r in self.rows:
+            self.n += 1
+            yield r
+            now = time.monotonic()
+            if now >= next_at:
+                print(f"PROGRESS rows={self.n}  rate={self.n / (now - self.t0):.0f}/s", file=sys.stderr)
+                next_at = now + self.every_s
+
+
+def _export(args: argparse.Namespace) -> int:
+    if not is_read_only(args.query):
+        raise ConfigError("--export 只支持只读查询（SELECT / WITH ...）")
+    out_path = Path(args.export.strip())
+    session = McpSession.from_env(args.env)
+    print(f"FAC_MCP_ENDPOINT={session.url}")
+    print(f"MCP_AUTH={session.auth_label}  VALUE={mask_secret(session.auth_raw)}")
+    print(f"EXPORT={out_path}  KEY={args.key}  PAGE_SIZE={min(args.page_size, PAGE_SIZE_MAX)}  MAX_ROWS={args.max_rows or 'all'}")
+    stats: Dict[str, Any] = {}
     try:
-        return json.loads(t)
-    except Exception:
-        return t
-
-
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+        rows = _Progress(session.iter_query(args.query, key=args.key, max_rows=args.max_rows, page_size=args.page_size, stats=stats))
+        with row_sink(out_path) as w:
+            for r in rows:
+                w.write(r)
+            w.finish()
+    finally:
+        session.close()
+    elapsed = max(1e-6, time.monotonic() - rows.t0)
+    print(f"ROWS={rows.n}  PAGES={stats.get('pages', 0)}  FETCH_SECONDS={stats.get('seconds', 0.0):.2f}  ELAPSED={elapsed:.2f}s  ROWS_PER_S={rows.n / elapsed:.0f}")
+    print(f"SAVED_TO={out_path}")
+    return 0
 
 
 def main(argv: list[str]) -> int:
@@ -86,36 +92,93 @@ def main(argv: list[str]) -> int:
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
     ap.add_argument("--query", required=True)
     ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument(
+        "--out",
+        default="",
+        help="可选：保存结果到文件而不打印全文（.json/.ndjson，可加 .gz/.zst；.ndjson 每行一条记录）",
+    )
+    ap.add_argument("--no-cache", action="store_true", help="不读也不写本地查询缓存（cache/<env>/queries/）")
+    ap.add_argument("--refresh", action="store_true", help="忽略已有缓存，重新查询并覆盖缓存")
+    ap.add_argument(
+        "--cache-ttl",
+        type=int,
+        default=0,
+        help=f"缓存有效期（秒；默认 {DEFAULT_TTL_SECONDS}，配合 --watch-modified 时默认 {WATCH_TTL_SECONDS}）",
+    )
+    ap.add_argument(
+        "--watch-modified",
+        action="store_true",
+        help="按 SQL 中 tab* 表的 MAX(modified) 水位判断缓存是否失效（多一次很轻的查询；删除行只能靠 TTL 发现）",
+    )
+    ap.add_argument(
+        "--export",
+        default="",
+        help="导出模式：按 --key 做 keyset 分页，边拉边写到文件（.ndjson/.jsonl/.csv 可加 .gz/.zst，.parquet 需 pyarrow，其它为 JSON）；忽略 --limit 与缓存",
+    )
+    ap.add_argument("--key", default="name", help="导出分页键列（必须在 SELECT 列表中且唯一，默认 name）")
+    ap.add_argument(
+        "--page-size", type=int, default=PAGE_SIZE_MAX, help=f"导出时的初始每页行数（按耗时自适应，上限 {PAGE_SIZE_MAX}，默认 {PAGE_SIZE_MAX}）"
+    )
+    ap.add_argument("--max-rows", type=int, default=0, help="导出最多行数（默认 0 = 全部）")
     args = ap.parse_args(argv)
 
     cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth, auth_label, raw = _auth_from_secrets(secrets)
-    mcp_url = cfg.mcp_base_url
-
     print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+    if args.export.strip():
+        return _export(args)
 
-    _ = _mcp_call(
-        mcp_url,
-        auth,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
+    use_cache = not args.no_cache and is_read_only(args.query)
+    key = query_key(args.query, args.limit)
 
-    resp = _mcp_call(
-        mcp_url,
-        auth,
-        {
-            "jsonrpc": "2.0",
-            "method": "tools/call",
-            "params": {"name": "run_database_query", "arguments": {"query": args.query, "limit": args.limit}},
-            "id": 2,
-        },
-    )
-    texts = _extract_text_content(resp)
-    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
-    print(json.dumps(parsed, ensure_ascii=False, indent=2, default=str))
+    session: Optional[McpSession] = None
+
+    def _session() -> McpSession:
+        nonlocal session
+        if session is None:
+            session = McpSession.from_env(args.env)
+            print(f"FAC_MCP_ENDPOINT={session.url}")
+            print(f"MCP_AUTH={session.auth_label}  VALUE={mask_secret(session.auth_raw)}")
+        return session
+
+    try:
+        watermarks = _watermarks(_session(), args.query) if use_cache and args.watch_modified else None
+        if use_cache and args.watch_modified and watermarks is None:
+            print(f"CACHE_WATCH=off  (无法可靠识别 SQL 中的 tab* 表或水位查询失败，按默认 TTL {DEFAULT_TTL_SECONDS}s 判断)")
+        # The long watch TTL is only safe when the watermarks actually guard the entry.
+        ttl = args.cache_ttl if args.cache_ttl > 0 else (WATCH_TTL_SECONDS if watermarks is not None else DEFAULT_TTL_SECONDS)
+        cache = QueryCache(cache_root_for(args.env), ttl) if use_cache else None
+        hit = cache.get(key, watermarks) if cache is not None and not args.refresh else None
+        if hit is not None:
+            parsed = hit["response"]
+            print(f"CACHE=HIT  AGE={hit['age_seconds']}s  TTL={ttl}s  KEY={key[:12]}")
+        else:
+            parsed = _session().call_tool("run_database_query", {"query": args.query, "limit": args.limit})
+            if cache is None:
+                print("CACHE=OFF" if args.no_cache else "CACHE=OFF  (非只读语句不缓存)")
+            elif is_cacheable(parsed):
+                cache.put(key, args.query, args.limit, parsed, watermarks)
+                print(f"CACHE={'REFRESH' if args.refresh else 'MISS'}  STORED  KEY={key[:12]}")
+                budget = budget_bytes(args.env)
+                if budget is not None:
+                    CacheManager(args.env, cache_root=cache.cache_root).evict(budget)
+            else:
+                print("CACHE=MISS  (错误结果不缓存)")
+    finally:
+        if session is not None:
+            session.close()
+
+    if not args.out.strip():
+        print(json.dumps(parsed, ensure_ascii=False, indent=2, default=str))
+        return 0
+
+    out_path = Path(args.out.strip())
+    rows = _extract_rows(parsed)
+    if rows is None:
+        write_json(out_path, parsed)
+        print("ROWS=?  (无法识别行数组，已原样保存)")
+    else:
+        print(f"ROWS={write_rows(out_path, rows)}")
+    print(f"SAVED_TO={out_path}")
     return 0
 
 
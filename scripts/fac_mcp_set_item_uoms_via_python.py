@@ -8,6 +8,7 @@ import urllib.request
 from typing import Dict, Optional, Tuple
 
 from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
+from _lib_item_uoms import apply_uoms_code
 
 
 def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
@@ -95,17 +96,9 @@ def main(argv: list[str]) -> int:
     # Keep the python code minimal and deterministic.
     code = f'''
 item_name = {args.item!r}
-uoms = {uoms!r}
+pairs = list({uoms!r}.items())
 doc = frappe.get_doc("Item", item_name)
-existing = {{row.uom: row for row in doc.uoms}}
-for uom, cf in uoms.items():
-    cf = float(cf)
-    if uom in existing:
-        existing[uom].conversion_factor = cf
-    else:
-        doc.append("uoms", {{"uom": uom, "conversion_factor": cf}})
-doc.save()
-out = [(row.uom, float(row.conversion_factor)) for row in doc.uoms]
+{apply_uoms_code()}out = [(row.uom, float(row.conversion_factor)) for row in doc.uoms]
 print(out)
 '''
 
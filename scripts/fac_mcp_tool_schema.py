@@ -3,89 +3,54 @@ from __future__ import annotations
 import argparse
 import json
 import sys
-import urllib.error
-import urllib.request
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Optional
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
-
-
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
-    try:
-        with urllib.request.urlopen(req, timeout=25) as resp:
-            raw = resp.read(1024 * 1024)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 1024)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+from _lib_config import ConfigError, load_env_config
+from _lib_mcp import McpSession
+from _lib_mcp_cache import cache_state, lookup_tools, record
+from _lib_tool_index import cache_root_for, save_tools_list, tool_index_path
 
 
 def main(argv: list[str]) -> int:
-    ap = argparse.ArgumentParser(description="打印指定 MCP tool 的 schema/定义（只读）。")
+    ap = argparse.ArgumentParser(description="打印指定 MCP tool 的 schema/定义（只读；优先读本地缓存索引）。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
     ap.add_argument("--name", required=True, help="tool name（例如 update_document）")
+    ap.add_argument("--refresh", action="store_true", help="忽略本地缓存，实时 tools/list 并更新 cache/<env>/mcp/")
     args = ap.parse_args(argv)
 
     cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
-    mcp_url = cfg.mcp_base_url
-
+    cache_root = cache_root_for(args.env)
     print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
 
-    _ = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
-    tools = _mcp_call(mcp_url, auth_header_value, {"jsonrpc": "2.0", "method": "tools/list", "params": {}, "id": 2})
-    tlist = ((tools.get("result") or {}).get("tools") if isinstance(tools, dict) else None) or []
     found: Optional[Any] = None
-    for t in tlist:
-        if isinstance(t, dict) and t.get("name") == args.name:
-            found = t
-            break
+    if args.refresh:
+        record(cache_root, "miss")
+    else:
+        # Stale-while-revalidate: a stale cache is still served; a background refresh updates it.
+        # lookup_tools records the hit/miss outcome itself.
+        idx = lookup_tools(cache_root, args.env, need=(args.name,))
+        if idx is not None:
+            found = idx.get(args.name)
+            state = cache_state(cache_root)
+            print(
+                f"TOOL_INDEX={tool_index_path(cache_root)}  TOOLS={len(idx.names())}  HIT"
+                f"  AGE={state.get('age_seconds')}s{'  STALE (revalidating)' if state.get('stale') else ''}"
+            )
+        else:
+            print(f"TOOL_INDEX={tool_index_path(cache_root)}  MISS")
+
     if found is None:
-        raise ConfigError(f"未找到 tool={args.name}。")
+        # Cache miss (or --refresh): one live tools/list, which also refreshes the cache.
+        session = McpSession.from_env(args.env)
+        session.print_banner()
+        session.initialize()
+        tools = session.call("tools/list", {})
+        idx = save_tools_list(cache_root, tools, session.cfg.env, session.url)
+        if idx is None:
+            raise ConfigError(f"tools/list 失败（本地缓存未改动）：\n{json.dumps(tools, ensure_ascii=False, indent=2, default=str)[:2000]}")
+        found = idx.get(args.name)
+        if found is None:
+            raise ConfigError(f"未找到 tool={args.name}。")
     print("")
     print("TOOL_SCHEMA:")
     # ASCII-safe for Windows console
@@ -99,4 +64,3 @@ if __name__ == "__main__":
     except ConfigError as e:
         print(f"CONFIG_ERROR: {e}", file=sys.stderr)
         raise SystemExit(2)
-
@@ -1,102 +1,293 @@
 from __future__ import annotations
 
 import argparse
+import csv
 import json
+import subprocess
 import sys
-import urllib.error
-import urllib.request
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Tuple
 
-from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
+from _lib_config import ConfigError, repo_root
+from _lib_mcp import McpSession
+from _lib_output import iter_rows, open_input, write_json
 
+# Input columns that address the document; every other column is a field to set.
+_KEY_COLUMNS = ("doctype", "name")
 
-def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
-    data = None
-    if body is not None:
-        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
-        headers = {**headers, "Content-Type": "application/json"}
-    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+# One chunk = one run_python_code call. Per row it prints
+#   R|[idx, status, name, before, detail]
+# where status is updated / unchanged / would_update / error and `before` holds the
+# previous values of exactly the fields being set (the rollback journal).
+# NOTE: run_python_code forbids import statements; use frappe + json already available.
+_SERVER_UPDATE_CODE = '''
+spec = json.loads({spec_json!r})
+dt = spec["doctype"]
+meta = frappe.get_meta(dt)
+for idx, name, fields in spec["rows"]:
     try:
-        with urllib.request.urlopen(req, timeout=25) as resp:
-            raw = resp.read(1024 * 1024)
-            text = raw.decode("utf-8", errors="replace")
-            try:
-                return resp.status, json.loads(text)
-            except Exception:
-                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
-    except urllib.error.HTTPError as e:
-        raw = e.read(1024 * 1024)
-        text = raw.decode("utf-8", errors="replace")
-        try:
-            return int(e.code), json.loads(text)
-        except Exception:
-            raise ConfigError(f"HTTP {e.code}\n{text}")
-
-
-def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
-    status, obj = _http_json(
-        "POST",
-        mcp_url,
-        headers={"Authorization": auth_header_value, "Accept": "application/json"},
-        body=req_body,
-    )
-    if not (200 <= status < 300):
-        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
-    return obj
-
-
-def _extract_text_content(mcp_result: dict) -> List[str]:
-    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
-    if not isinstance(result, dict):
-        return []
-    content = result.get("content")
-    if not isinstance(content, list):
-        return []
-    out: List[str] = []
-    for item in content:
-        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
-            out.append(item["text"])
+        unknown = [k for k in fields if not meta.has_field(k)]
+        if unknown:
+            print("R|" + json.dumps([idx, "error", name, None, "unknown fields: " + ", ".join(unknown)], ensure_ascii=False))
+            continue
+        # Child tables have no scalar "before" value for the rollback journal.
+        tables = [k for k in fields if meta.get_field(k).fieldtype in ("Table", "Table MultiSelect")]
+        if tables:
+            print("R|" + json.dumps([idx, "error", name, None, "table fields not supported: " + ", ".join(tables)], ensure_ascii=False))
+            continue
+        doc = frappe.get_doc(dt, name)
+        before = {{}}
+        changed = {{}}
+        for k, v in fields.items():
+            old = doc.get(k)
+            before[k] = old
+            if old != v and not (old is not None and v is not None and str(old) == str(v)):
+                changed[k] = v
+        if not changed:
+            print("R|" + json.dumps([idx, "unchanged", name, before, None], ensure_ascii=False, default=str))
+            continue
+        if spec["dry_run"]:
+            print("R|" + json.dumps([idx, "would_update", name, before, changed], ensure_ascii=False, default=str))
+            continue
+        doc.update(changed)
+        doc.save()
+        print("R|" + json.dumps([idx, "updated", name, before, changed], ensure_ascii=False, default=str))
+    except Exception as e:
+        print("R|" + json.dumps([idx, "error", name, None, str(e)], ensure_ascii=False))
+'''
+
+
+def _timestamp_slug() -> str:
+    return time.strftime("%Y%m%d_%H%M%S")
+
+
+def _default_out_path(env: str) -> Path:
+    return repo_root() / "work" / env / "operations" / "updates" / f"{_timestamp_slug()}_update_document_fields.json"
+
+
+def _results_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.stem + ".results.ndjson")
+
+
+def _journal_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.stem + ".journal.ndjson")
+
+
+def _run_preflight(env: str, confirm_prod: bool) -> None:
+    py = sys.executable
+    cmd = [py, str(repo_root() / "scripts" / "preflight.py"), "--env", env, "--operation", "write"]
+    if env == "prod" and confirm_prod:
+        cmd.append("--confirm-prod")
+    subprocess.run(cmd, check=True)
+
+
+def load_update_rows(path: Path, default_doctype: str) -> List[Dict[str, Any]]:
+    """
+    Read `(doctype?, name, field=value...)` rows from CSV (header row), JSON array or
+    NDJSON (optionally .gz/.zst) into [{"idx", "doctype", "name", "fields"}].
+
+    Empty CSV cells are left untouched (CSV cannot express null; use NDJSON for that).
+    """
+    if not path.exists():
+        raise ConfigError(f"输入文件不存在：{path}")
+    rows: Iterable[Any]
+    if ".csv" in [s.lower() for s in path.suffixes]:
+        with open_input(path, newline="") as f:
+            rows = [{k: v for k, v in r.items() if k and v not in (None, "")} for r in csv.DictReader(f)]
+    else:
+        rows = iter_rows(path)
+
+    out: List[Dict[str, Any]] = []
+    seen: Dict[Tuple[str, str], int] = {}
+    for i, r in enumerate(rows, start=1):
+        if not isinstance(r, dict):
+            raise ConfigError(f"第 {i} 行不是对象：{r!r}")
+        name = str(r.get("name") or "").strip()
+        doctype = str(r.get("doctype") or default_doctype or "").strip()
+        if not name:
+            raise ConfigError(f"第 {i} 行缺少 name：{r!r}")
+        if not doctype:
+            raise ConfigError(f"第 {i} 行缺少 doctype（可在文件中提供 doctype 列，或传入 --doctype）：{r!r}")
+        fields = {k.strip(): v for k, v in r.items() if isinstance(k, str) and k.strip() not in _KEY_COLUMNS}
+        if not fields:
+            raise ConfigError(f"第 {i} 行没有要更新的字段：{r!r}")
+        key = (doctype, name)
+        if key in seen:
+            raise ConfigError(f"第 {i} 行与第 {seen[key]} 行重复（{doctype} {name}）；请合并为一行。")
+        seen[key] = i
+        out.append({"idx": i, "doctype": doctype, "name": name, "fields": fields})
     return out
 
 
-def _best_effort_parse_json_text(text: str) -> Any:
-    t = text.strip()
-    if not t:
-        return None
+def _chunks(rows: List[Dict[str, Any]], chunk_size: int) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    """Group rows by doctype (first-seen order), then cut each group into chunks."""
+    by_doctype: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_doctype.setdefault(r["doctype"], []).append(r)
+    out: List[Tuple[str, List[Dict[str, Any]]]] = []
+    for dt, group in by_doctype.items():
+        for i in range(0, len(group), chunk_size):
+            out.append((dt, group[i : i + chunk_size]))
+    return out
+
+
+def _run_chunk(session: McpSession, doctype: str, rows: List[Dict[str, Any]], dry_run: bool) -> Dict[str, Any]:
+    spec = {"doctype": doctype, "dry_run": dry_run, "rows": [[r["idx"], r["name"], r["fields"]] for r in rows]}
+    t0 = time.monotonic()
+    # Sent exactly once: McpSession never re-sends run_python_code, because a replayed chunk
+    # would report `unchanged` with the new values as `before` and lose them from the journal.
+    # Any failure leaves the chunk's rows `unknown` (the summary is still written).
     try:
-        return json.loads(t)
-    except Exception:
-        return t
+        parsed, lines = session.run_code(_SERVER_UPDATE_CODE.format(spec_json=json.dumps(spec, ensure_ascii=False, default=str)))
+    except Exception as e:
+        parsed, lines = f"{type(e).__name__}: {e}", []
+    return {"doctype": doctype, "rows": rows, "parsed": parsed, "lines": lines, "elapsed_s": round(time.monotonic() - t0, 3)}
+
 
+def _bulk(args: argparse.Namespace) -> int:
+    rows = load_update_rows(Path(args.rows_file), args.doctype.strip())
+    if not rows:
+        raise ConfigError("输入文件没有任何行。")
+    chunk_size = max(1, int(args.chunk_size))
+    jobs = max(1, int(args.jobs))
+    chunks = _chunks(rows, chunk_size)
+    doctypes = list(dict.fromkeys(r["doctype"] for r in rows))
 
-def _auth_from_secrets(secrets) -> tuple[str, str, str]:
-    raw = secrets.mcp_token.strip()
-    if raw:
-        if ":" in raw and " " not in raw:
-            return f"token {raw}", "token", raw
-        return f"Bearer {raw}", "Bearer", raw
-    if secrets.rest_api_key and secrets.rest_api_secret:
-        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
-        return f"token {raw}", "token", raw
-    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+    session = McpSession.from_env(args.env)
+    session.print_banner()
+    print(f"ROWS={len(rows)}  DOCTYPES={','.join(doctypes)}  CHUNKS={len(chunks)}  CHUNK_SIZE={chunk_size}  JOBS={jobs}  DRY_RUN={args.dry_run}")
+
+    if not args.dry_run and not args.skip_preflight:
+        _run_preflight(args.env, confirm_prod=args.confirm_prod)
+    session.initialize()
+
+    out_path = Path(args.out) if args.out.strip() else _default_out_path(args.env)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    results_path = _results_path(out_path)
+    journal_path = _journal_path(out_path)
+    print(f"RESULTS_NDJSON={results_path}")
+    if not args.dry_run:
+        print(f"JOURNAL_NDJSON={journal_path}")
+
+    totals: Dict[str, int] = {}
+    chunk_log: List[dict] = []
+    errors: List[dict] = []
+    done = 0
+    started = time.monotonic()
+    # Both logs are appended and flushed per chunk (not written atomically at the end):
+    # if the run dies halfway, the journal still covers every chunk already applied.
+    # A dry run applies nothing, so it has no journal.
+    with results_path.open("w", encoding="utf-8") as rf, (
+        journal_path.open("w", encoding="utf-8") if not args.dry_run else nullcontext()
+    ) as jf:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futs = [pool.submit(_run_chunk, session, dt, chunk, bool(args.dry_run)) for dt, chunk in chunks]
+            for ci, fut in enumerate(as_completed(futs), start=1):
+                res = fut.result()
+                dt = res["doctype"]
+                by_idx = {r["idx"]: r for r in res["rows"]}
+                reported = set()
+                for tag, payload in res["lines"]:
+                    if tag != "R" or not isinstance(payload, list) or len(payload) != 5 or payload[0] not in by_idx:
+                        continue
+                    idx, status, name, before, detail = payload
+                    reported.add(idx)
+                    rec: Dict[str, Any] = {"idx": idx, "doctype": dt, "name": name, "status": status, "set": by_idx[idx]["fields"]}
+                    if before is not None:
+                        rec["before"] = before
+                    if status == "error":
+                        rec["error"] = detail
+                        errors.append(rec)
+                    rf.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                    totals[status] = totals.get(status, 0) + 1
+                    if status == "updated" and jf is not None:
+                        # Same shape as the input, so the journal can be fed back via --rows-file.
+                        jf.write(json.dumps({"doctype": dt, "name": name, **{k: before.get(k) for k in detail}}, ensure_ascii=False, default=str) + "\n")
+                # Rows the server never answered for (chunk failed as a whole): outcome unknown.
+                for idx in sorted(set(by_idx) - reported):
+                    r = by_idx[idx]
+                    rec = {"idx": idx, "doctype": dt, "name": r["name"], "status": "unknown", "set": r["fields"]}
+                    rf.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                    totals["unknown"] = totals.get("unknown", 0) + 1
+                rf.flush()
+                if jf is not None:
+                    jf.flush()
+
+                chunk_ok = len(reported) == len(by_idx)
+                entry: dict = {"doctype": dt, "first_idx": res["rows"][0]["idx"], "rows": len(by_idx), "reported": len(reported), "ok": chunk_ok, "elapsed_s": res["elapsed_s"]}
+                if not chunk_ok:
+                    # Keep the raw response only when something went wrong (it may be large).
+                    entry["response"] = res["parsed"]
+                chunk_log.append(entry)
+
+                done += len(by_idx)
+                elapsed = max(1e-6, time.monotonic() - started)
+                rate = done / elapsed
+                eta = (len(rows) - done) / rate if rate > 0 else 0.0
+                print(f"PROGRESS chunk={ci}/{len(chunks)}  rows={done}/{len(rows)}  rate={rate:.1f}/s  eta={eta:.0f}s  ok={chunk_ok}")
+
+    chunk_log.sort(key=lambda e: e["first_idx"])
+    write_json(
+        out_path,
+        {
+            "request": {"rows_file": str(args.rows_file), "rows": len(rows), "doctypes": doctypes, "dry_run": bool(args.dry_run), "chunk_size": chunk_size, "jobs": jobs},
+            "results_ndjson": str(results_path),
+            "journal_ndjson": None if args.dry_run else str(journal_path),
+            "totals": totals,
+            "elapsed_s": round(time.monotonic() - started, 3),
+            "chunks": chunk_log,
+        },
+    )
+
+    print("")
+    print("DONE.")
+    print(f"TOTALS={json.dumps(totals, ensure_ascii=False)}")
+    for e in sorted(errors, key=lambda e: e["idx"])[: args.show]:
+        print(f"- error: row {e['idx']} {e['doctype']} {e['name']}: {e['error']}")
+    print(f"RESULT_SAVED_TO={out_path}")
+    if not args.dry_run and totals.get("updated"):
+        print(f"ROLLBACK: python scripts/fac_mcp_update_document_fields.py --env {args.env} --rows-file {journal_path}")
+    ok = not errors and not totals.get("unknown")
+    return 0 if ok else 2
 
 
 def main(argv: list[str]) -> int:
-    ap = argparse.ArgumentParser(description="通过 FAC MCP 更新单据字段（受控写入）。")
+    ap = argparse.ArgumentParser(description="通过 FAC MCP 更新单据字段（受控写入）；--rows-file 批量模式服务端分块执行。")
     ap.add_argument("--env", choices=["dev", "prod"], required=True)
-    ap.add_argument("--doctype", required=True)
-    ap.add_argument("--name", required=True)
+    ap.add_argument("--doctype", default="", help="DocType（单条模式必填；批量模式作为缺少 doctype 列时的默认值）")
+    ap.add_argument("--name", default="", help="单条模式：单据 name")
     ap.add_argument(
         "--set-json",
-        required=True,
-        help='要更新的字段 JSON 对象，例如 {"custom_unique_item_name":"PLATE-Q235B-T5-1500x6000"}',
+        default="",
+        help='单条模式：要更新的字段 JSON 对象，例如 {"custom_unique_item_name":"PLATE-Q235B-T5-1500x6000"}',
     )
+    ap.add_argument(
+        "--rows-file",
+        default="",
+        help="批量模式：CSV/JSON/NDJSON（可加 .gz/.zst），每行 name[,doctype] + 要设置的字段列；CSV 空单元格表示不修改",
+    )
+    ap.add_argument("--chunk-size", type=int, default=200, help="批量模式：每次 run_python_code 处理的行数（默认 200）")
+    ap.add_argument("--jobs", type=int, default=4, help="批量模式：同时进行的服务端分块数（默认 4）")
+    ap.add_argument("--dry-run", action="store_true", help="批量模式：只读取现值并输出将要修改的内容，不写入")
+    ap.add_argument("--show", type=int, default=20, help="批量模式：终端最多显示的错误行数（默认 20）")
+    ap.add_argument("--out", default="", help="批量模式：执行汇总 JSON 路径（默认 work/<env>/operations/updates/...json；结果与回滚日志在同目录）")
+    ap.add_argument("--skip-preflight", action="store_true", help="批量模式：跳过 preflight（不推荐）")
     ap.add_argument("--confirm-prod", action="store_true", help="env=prod 时必须显式确认（仍建议先跑 preflight 双确认）")
     args = ap.parse_args(argv)
 
     if args.env == "prod" and not args.confirm_prod:
         raise ConfigError("禁止默认在 PROD 更新单据。若确需在 prod，请显式传入 --confirm-prod，并先通过 preflight 双确认。")
 
+    if args.rows_file.strip():
+        if args.name.strip() or args.set_json.strip():
+            raise ConfigError("--rows-file 不能与 --name/--set-json 同时使用。")
+        return _bulk(args)
+    if not args.doctype.strip() or not args.name.strip() or not args.set_json.strip():
+        raise ConfigError("单条模式需要 --doctype --name --set-json（或改用 --rows-file 批量模式）。")
+
     try:
         fields = json.loads(args.set_json)
     except Exception as e:
@@ -104,37 +295,15 @@ def main(argv: list[str]) -> int:
     if not isinstance(fields, dict) or not fields:
         raise ConfigError("--set-json 必须是非空 JSON 对象。")
 
-    cfg = load_env_config(args.env)
-    secrets = load_secrets(required=True)
-    auth_header_value, auth_label, raw = _auth_from_secrets(secrets)
-
-    mcp_url = cfg.mcp_base_url
-    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
-    print(f"FAC_MCP_ENDPOINT={mcp_url}")
-    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+    session = McpSession.from_env(args.env)
+    session.print_banner()
     print(f"DOCTYPE={args.doctype}")
     print(f"NAME={args.name}")
     print(f"SET={json.dumps(fields, ensure_ascii=False)}")
-
-    _ = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
-    )
+    session.initialize()
 
     # FAC typically exposes update tool as "update_document"
-    resp = _mcp_call(
-        mcp_url,
-        auth_header_value,
-        {
-            "jsonrpc": "2.0",
-            "method": "tools/call",
-            "params": {"name": "update_document", "arguments": {"doctype": args.doctype, "name": args.name, "data": fields}},
-            "id": 2,
-        },
-    )
-    texts = _extract_text_content(resp)
-    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
+    parsed = session.call_tool("update_document", {"doctype": args.doctype, "name": args.name, "data": fields})
 
     print("")
     print("UPDATED:")
@@ -145,7 +314,9 @@ def main(argv: list[str]) -> int:
 if __name__ == "__main__":
     try:
         raise SystemExit(main(sys.argv[1:]))
+    except subprocess.CalledProcessError as e:
+        print(f"SUBPROCESS_ERROR: exit={e.returncode}", file=sys.stderr)
+        raise SystemExit(int(e.returncode) if e.returncode else 2)
     except ConfigError as e:
         print(f"CONFIG_ERROR: {e}", file=sys.stderr)
         raise SystemExit(2)
-
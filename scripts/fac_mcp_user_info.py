@@ -9,6 +9,8 @@ import urllib.request
 from typing import Any, Dict, List, Optional, Tuple
 
 from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
+from _lib_mcp_cache import lookup_tools, record
+from _lib_tool_index import cache_root_for, save_tools_list, tools_from_response
 
 
 def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
@@ -140,6 +142,7 @@ def main(argv: list[str]) -> int:
         default="",
         help="可选：指定 User.name 或 email；不填则尝试用 OIDC userinfo 从 Bearer token 推断",
     )
+    ap.add_argument("--refresh", action="store_true", help="忽略本地 tools 缓存，实时 tools/list 并更新 cache/<env>/mcp/")
     args = ap.parse_args(argv)
 
     cfg = load_env_config(args.env)
@@ -184,10 +187,20 @@ def main(argv: list[str]) -> int:
     if isinstance(srv, dict):
         print(f"SERVER={srv.get('name','')}  VERSION={srv.get('version','')}")
 
-    tools = _mcp_tools_list(mcp_url, auth_header_value)
-    tool_list = ((tools.get("result") or {}).get("tools") if isinstance(tools, dict) else None) or []
-    tool_names = {t.get("name") for t in tool_list if isinstance(t, dict)}
-    print(f"TOOLS={len(tool_names)}")
+    # Tool names come from the local index; go live only on --refresh or when the cache lacks what we need.
+    cache_root = cache_root_for(args.env)
+    # lookup_tools records the hit/miss outcome itself; only a forced --refresh is recorded here.
+    if args.refresh:
+        record(cache_root, "miss")
+    idx = None if args.refresh else lookup_tools(cache_root, args.env, need=("list_documents", "get_document"))
+    if idx is not None:
+        tool_names = set(idx.names())
+        print(f"TOOLS={len(tool_names)}  (cache)")
+    else:
+        tools = _mcp_tools_list(mcp_url, auth_header_value)
+        save_tools_list(cache_root, tools, args.env, mcp_url)
+        tool_names = {t.get("name") for t in tools_from_response(tools)}
+        print(f"TOOLS={len(tool_names)}")
 
     # 2) Figure out who the bearer token is for (best effort)
     user_candidates: List[str] = []
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
 import argparse
+import importlib.util
+import inspect
+import io
 import json
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from _lib_config import ConfigError, repo_root
+from _lib_mcp import McpSession
+from _lib_snapshot_store import SnapshotStore, store_root_for
 
 
 def _run(cmd: list[str]) -> None:
@@ -16,6 +24,77 @@ def _run(cmd: list[str]) -> None:
     subprocess.run(cmd, check=True)
 
 
+class _ThreadOutput(io.TextIOBase):
+    """sys.stdout/stderr proxy: output of a worker thread goes to that thread's buffer."""
+
+    def __init__(self, real):
+        self.real = real
+        self.local = threading.local()
+
+    def write(self, s: str) -> int:
+        buf = getattr(self.local, "buf", None)
+        (buf if buf is not None else self.real).write(s)
+        return len(s)
+
+    def flush(self) -> None:
+        self.real.flush()
+
+
+_MODULE_LOCK = threading.Lock()
+_MODULES: Dict[str, Any] = {}
+
+
+def _in_process_main(script_path: Path) -> Optional[Callable[..., int]]:
+    """Import a profile script once; return its main() if it accepts a shared `session`."""
+    key = str(script_path.resolve())
+    with _MODULE_LOCK:
+        if key not in _MODULES:
+            spec = importlib.util.spec_from_file_location(f"_ref_{script_path.stem}", script_path)
+            if spec is None or spec.loader is None:
+                _MODULES[key] = None
+            else:
+                mod = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(mod)
+                _MODULES[key] = mod
+        mod = _MODULES[key]
+    main = getattr(mod, "main", None)
+    if callable(main) and "session" in inspect.signature(main).parameters:
+        return main
+    return None
+
+
+def _run_item(task: dict, session: Optional[McpSession], py: str, outputs: Tuple[_ThreadOutput, _ThreadOutput]) -> dict:
+    buf = io.StringIO()
+    for o in outputs:
+        o.local.buf = buf
+    t0 = time.monotonic()
+    mode = "subprocess"
+    rc = 0
+    try:
+        main = _in_process_main(task["script_path"]) if session is not None else None
+        if main is not None:
+            mode = "in-process"
+            rc = int(main(task["argv"], session=session) or 0)
+        else:
+            cmd = [py, str(task["script_path"]), *task["argv"]]
+            buf.write("+ " + " ".join(cmd) + "\n")
+            cp = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="replace")
+            buf.write(cp.stdout + cp.stderr)
+            rc = cp.returncode
+    except ConfigError as e:
+        buf.write(f"CONFIG_ERROR: {e}\n")
+        rc = 2
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) else 2
+    except Exception as e:
+        buf.write(f"ERROR: {e!r}\n")
+        rc = 2
+    finally:
+        for o in outputs:
+            o.local.buf = None
+    return {**task, "mode": mode, "rc": rc, "seconds": time.monotonic() - t0, "output": buf.getvalue()}
+
+
 def _default_ref_dir(env: str) -> Path:
     return repo_root() / "work" / env / "reference"
 
@@ -89,6 +168,22 @@ def main(argv: list[str]) -> int:
         default="",
         help="可选：自定义 reference 输出目录（默认 work/<env>/reference）",
     )
+    ap.add_argument(
+        "--delta",
+        action="store_true",
+        help="增量同步：各 list 脚本只拉取 modified 水位之后变化的行（水位见 <ref-dir>/_sync_state.json）",
+    )
+    ap.add_argument("--jobs", type=int, default=4, help="并发执行的 profile items 数（默认 4；1 = 顺序执行）")
+    ap.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="每个 item 使用独立子进程执行（旧行为；默认在进程内共享一个 MCP 会话）",
+    )
+    ap.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="全部成功后不写入快照库（默认写入 work/<env>/snapshots/reference，内容未变化时不新建）",
+    )
     ap.add_argument(
         "--skip-preflight",
         action="store_true",
@@ -124,7 +219,7 @@ def main(argv: list[str]) -> int:
     if not args.skip_preflight:
         _run([py, str(repo_root() / "scripts" / "preflight.py"), "--env", env, "--operation", "read"])
 
-    saved: List[Path] = []
+    tasks: List[dict] = []
     for idx, item in enumerate(items):
         if not isinstance(item, dict):
             raise ConfigError(f"profile items[{idx}] 不是对象：{item!r}")
@@ -144,13 +239,68 @@ def main(argv: list[str]) -> int:
         out_path.parent.mkdir(parents=True, exist_ok=True)
 
         cli_args = _kv_to_cli_args({k: v for k, v in args_obj.items()})
-        _run([py, str(script_path), "--env", env, *cli_args, "--out", str(out_path)])
-        saved.append(out_path)
+        if args.delta and "--delta" not in cli_args:
+            cli_args.append("--delta")
+        item_id = str(item.get("id") or script_path.stem)
+        tasks.append({"id": item_id, "script_path": script_path, "argv": ["--env", env, *cli_args, "--out", str(out_path)], "out": out_path})
+
+    session: Optional[McpSession] = None
+    if not args.subprocess:
+        session = McpSession.from_env(env)
+        print("")
+        session.print_banner()
+        session.initialize()
+
+    jobs = max(1, int(args.jobs))
+    print(f"ITEMS={len(tasks)}  JOBS={jobs}  MODE={'subprocess' if session is None else 'in-process'}")
+    outputs = (_ThreadOutput(sys.stdout), _ThreadOutput(sys.stderr))
+    real_out, real_err = sys.stdout, sys.stderr
+    results: List[dict] = []
+    t0 = time.monotonic()
+    sys.stdout, sys.stderr = outputs
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            futs = [pool.submit(_run_item, t, session, py, outputs) for t in tasks]
+            for fut in as_completed(futs):
+                r = fut.result()
+                results.append(r)
+                real_out.write(f"\n== [{r['id']}] rc={r['rc']}  {r['seconds']:.2f}s  ({r['mode']})\n")
+                real_out.write(r["output"])
+                real_out.flush()
+    finally:
+        sys.stdout, sys.stderr = real_out, real_err
+        if session is not None:
+            session.close()
+    wall = time.monotonic() - t0
 
+    order = {t["id"]: i for i, t in enumerate(tasks)}
+    results.sort(key=lambda r: order.get(r["id"], 0))
+    print("")
+    print("TIMING:")
+    print(f"{'id':<20} {'mode':<11} {'seconds':>8}  status")
+    for r in results:
+        print(f"{r['id']:<20} {r['mode']:<11} {r['seconds']:>8.2f}  {'ok' if r['rc'] == 0 else 'FAIL rc=' + str(r['rc'])}")
+    print(f"{'(wall)':<20} {'':<11} {wall:>8.2f}")
+
+    failed = [r for r in results if r["rc"] != 0]
     print("")
     print("DONE. Saved reference files:")
-    for p in saved:
-        print(f"- {p}")
+    for r in results:
+        if r["rc"] == 0:
+            print(f"- {r['out']}")
+    if failed:
+        print(f"FAILED={','.join(r['id'] for r in failed)}")
+        return 2
+
+    if not args.no_snapshot:
+        store = SnapshotStore(store_root_for(ref_dir))
+        res = store.save(ref_dir, label=f"init_reference_data profile={args.profile}")
+        m = res["manifest"]
+        print("")
+        print(
+            f"SNAPSHOT={m['id']}  {'UNCHANGED' if res['unchanged'] else 'SAVED'}  "
+            f"NEW_BLOBS={res['new_blobs']}  NEW_BYTES={res['new_bytes']}  STORE={store.root}"
+        )
     return 0
 
 
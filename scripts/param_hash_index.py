@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from _lib_cache_manager import cache_root_for
+from _lib_config import ConfigError, load_env_config, load_secrets, mask_secret
+from _lib_hash_index import HashIndex, default_index_path
+from _lib_lock import FileLock
+from _lib_output import iter_rows
+
+
+def _http_json(method: str, url: str, headers: Dict[str, str], body: Optional[dict]) -> Tuple[int, dict]:
+    data = None
+    if body is not None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        headers = {**headers, "Content-Type": "application/json"}
+    req = urllib.request.Request(url, data=data, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            raw = resp.read(1024 * 1024 * 16)
+            text = raw.decode("utf-8", errors="replace")
+            try:
+                return resp.status, json.loads(text)
+            except Exception:
+                raise ConfigError(f"非 JSON 响应：HTTP {resp.status}\n{text}")
+    except urllib.error.HTTPError as e:
+        raw = e.read(1024 * 1024)
+        text = raw.decode("utf-8", errors="replace")
+        try:
+            return int(e.code), json.loads(text)
+        except Exception:
+            raise ConfigError(f"HTTP {e.code}\n{text}")
+
+
+def _mcp_call(mcp_url: str, auth_header_value: str, req_body: dict) -> dict:
+    status, obj = _http_json(
+        "POST",
+        mcp_url,
+        headers={"Authorization": auth_header_value, "Accept": "application/json"},
+        body=req_body,
+    )
+    if not (200 <= status < 300):
+        raise ConfigError(f"MCP HTTP 状态异常：{status}\n{json.dumps(obj, ensure_ascii=False, indent=2)}")
+    return obj
+
+
+def _extract_text_content(mcp_result: dict) -> List[str]:
+    result = mcp_result.get("result") if isinstance(mcp_result, dict) else None
+    if not isinstance(result, dict):
+        return []
+    content = result.get("content")
+    if not isinstance(content, list):
+        return []
+    out: List[str] = []
+    for item in content:
+        if isinstance(item, dict) and item.get("type") == "text" and isinstance(item.get("text"), str):
+            out.append(item["text"])
+    return out
+
+
+def _best_effort_parse_json_text(text: str) -> Any:
+    t = text.strip()
+    if not t:
+        return None
+    try:
+        return json.loads(t)
+    except Exception:
+        return t
+
+
+def _auth_from_secrets(secrets) -> tuple[str, str, str]:
+    raw = secrets.mcp_token.strip()
+    if raw:
+        if ":" in raw and " " not in raw:
+            return f"token {raw}", "token", raw
+        return f"Bearer {raw}", "Bearer", raw
+    if secrets.rest_api_key and secrets.rest_api_secret:
+        raw = f"{secrets.rest_api_key}:{secrets.rest_api_secret}"
+        return f"token {raw}", "token", raw
+    raise ConfigError("缺少 MCP 鉴权信息（需要 mcp_token 或 rest_api_key/rest_api_secret）。")
+
+
+def _extract_rows(obj: Any) -> List[dict]:
+    """
+    Normalize run_database_query output shapes (best effort).
+    Common FAC shape: {"success":true,"result":{"data":[...]}} (some versions use rows/results).
+    """
+    if isinstance(obj, list):
+        return [r for r in obj if isinstance(r, dict)]
+    if not isinstance(obj, dict):
+        return []
+    for container in (obj.get("result"), obj):
+        if isinstance(container, dict):
+            for k in ("data", "rows", "results"):
+                v = container.get(k)
+                if isinstance(v, list):
+                    return [r for r in v if isinstance(r, dict)]
+    return []
+
+
+def _sql_lit(s: str) -> str:
+    return "'" + str(s).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _query(mcp_url: str, auth: str, sql: str, limit: int, rpc_id: int) -> List[dict]:
+    resp = _mcp_call(
+        mcp_url,
+        auth,
+        {
+            "jsonrpc": "2.0",
+            "method": "tools/call",
+            "params": {"name": "run_database_query", "arguments": {"query": sql, "limit": limit}},
+            "id": rpc_id,
+        },
+    )
+    texts = _extract_text_content(resp)
+    parsed = _best_effort_parse_json_text(texts[0]) if texts else resp
+    # Any error shape must abort: an empty row list here would read as "no more rows".
+    if not isinstance(parsed, (dict, list)) or (isinstance(parsed, dict) and (parsed.get("success") is False or parsed.get("error"))):
+        raise ConfigError(f"run_database_query 失败：\n{json.dumps(parsed, ensure_ascii=False, indent=2, default=str)[:2000]}\nSQL: {sql}")
+    return _extract_rows(parsed)
+
+
+def _sync(idx: HashIndex, mcp_url: str, auth: str, page: int) -> int:
+    """
+    Keyset-paginate tabItem by (modified, name) from the stored watermark; returns rows applied.
+
+    A short page is not the end (the server may cap rows per call): only an empty page,
+    or a keyset that stops advancing, ends the walk.
+    """
+    applied = 0
+    rpc_id = 10
+    wm_mod, wm_name = idx.watermark()
+    while True:
+        sql = "select name, custom_param_hash, custom_unique_item_name, modified from `tabItem`"
+        if wm_mod:
+            sql += f" where (modified > {_sql_lit(wm_mod)} or (modified = {_sql_lit(wm_mod)} and name > {_sql_lit(wm_name)}))"
+        sql += f" order by modified asc, name asc limit {page}"
+        rows = _query(mcp_url, auth, sql, page, rpc_id)
+        rpc_id += 1
+        if not rows:
+            break
+        idx.upsert(rows)
+        prev = (wm_mod, wm_name)
+        wm_mod, wm_name = str(rows[-1].get("modified") or ""), str(rows[-1].get("name") or "")
+        # Compare by equality only: the SQL orders names by MariaDB's case-insensitive
+        # collation, which Python's code-point `<` does not reproduce.
+        if (wm_mod, wm_name) == prev:
+            raise ConfigError(f"增量同步的 keyset 未前进（modified={wm_mod} name={wm_name}），已中止；可用 --full 重建。")
+        idx.set_meta("watermark_modified", wm_mod)
+        idx.set_meta("watermark_name", wm_name)
+        idx.commit()
+        applied += len(rows)
+        print(f"SYNC rows={applied}  watermark={wm_mod}")
+    return applied
+
+
+def _live_names(mcp_url: str, auth: str, page: int) -> Tuple[List[str], bool]:
+    """All Item names by keyset on name; returns (names, complete). Only an empty page proves completeness."""
+    names: List[str] = []
+    last = ""
+    rpc_id = 100
+    while True:
+        sql = "select name from `tabItem`"
+        if last:
+            sql += f" where name > {_sql_lit(last)}"
+        sql += f" order by name asc limit {page}"
+        rows = _query(mcp_url, auth, sql, page, rpc_id)
+        rpc_id += 1
+        if not rows:
+            return names, True
+        page_names = [str(r.get("name")) for r in rows if r.get("name")]
+        # Stalled keyset (same bound again, collation-agnostic check): not provably complete.
+        if not page_names or page_names[-1] == last:
+            return names, False
+        names.extend(page_names)
+        last = page_names[-1]
+
+
+def _load_file(idx: HashIndex, path: Path, batch: int, complete: bool) -> int:
+    """
+    Stream Item rows from an export file (NDJSON/JSON, optionally .gz/.zst) into the index.
+
+    The watermark only moves when the caller vouches that the file is a complete export:
+    a capped or filtered file may skip rows older than its max `modified`, which the next
+    incremental sync would then never fetch.
+    """
+    applied = 0
+    buf: List[dict] = []
+    wm = idx.watermark()
+    for r in iter_rows(path):
+        if not isinstance(r, dict) or not r.get("name"):
+            continue
+        buf.append(r)
+        # Only `modified` is compared here; names sort by the server's collation, so a newer
+        # timestamp resets the name bound and the next sync re-reads that second (upsert-safe).
+        mod = str(r.get("modified") or "")
+        if mod > wm[0]:
+            wm = (mod, "")
+        if len(buf) >= batch:
+            idx.upsert(buf)
+            applied += len(buf)
+            buf = []
+    if buf:
+        idx.upsert(buf)
+        applied += len(buf)
+    if complete:
+        idx.set_meta("watermark_modified", wm[0])
+        idx.set_meta("watermark_name", wm[1])
+    idx.commit()
+    return applied
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        description="同步本地 Item 参数 hash 索引（cache/<env>/items/，按 modified 增量；只读）。",
+    )
+    ap.add_argument("--env", choices=["dev", "prod"], required=True)
+    ap.add_argument("--full", action="store_true", help="清空后全量重建")
+    ap.add_argument("--reconcile", action="store_true", help="额外拉取全部 Item.name，删除本地已不存在的条目")
+    ap.add_argument("--page-size", type=int, default=2000, help="每页行数（默认 2000）")
+    ap.add_argument("--index", default="", help="索引文件路径（默认 cache/<env>/items/param_hash_index.sqlite）")
+    ap.add_argument(
+        "--from-file",
+        default="",
+        help="从导出文件离线导入（.ndjson/.json，可加 .gz/.zst；需含 name,custom_param_hash,custom_unique_item_name,modified），不访问 MCP",
+    )
+    ap.add_argument(
+        "--complete",
+        action="store_true",
+        help="配合 --from-file：声明文件是未截断、未过滤的全量导出（如 fac_mcp_run_db_query.py --export），导入后才推进 modified 水位",
+    )
+    args = ap.parse_args(argv)
+
+    # Writers hold the hash_index lock so cache eviction never deletes the file mid-sync.
+    with FileLock.for_key(cache_root_for(args.env), "hash_index", timeout=600):
+        return _run(args)
+
+
+def _run(args: argparse.Namespace) -> int:
+    if args.from_file.strip():
+        idx = HashIndex(Path(args.index) if args.index.strip() else default_index_path(args.env))
+        try:
+            if args.full:
+                idx.clear()
+            t0 = time.monotonic()
+            applied = _load_file(idx, Path(args.from_file.strip()), max(1, int(args.page_size)), args.complete)
+            idx.set_meta("synced_at", str(int(time.time())))
+            idx.commit()
+            print(f"INDEX={idx.path}  FROM_FILE={args.from_file.strip()}")
+            wm_mod, _ = idx.watermark()
+            print(f"WATERMARK={wm_mod or '-'}" + ("" if args.complete else "  (未传 --complete，水位保持不变，下次 MCP 同步会补齐)"))
+            print(f"DONE. applied={applied}  rows={idx.count()}  elapsed={time.monotonic() - t0:.1f}s")
+        finally:
+            idx.close()
+        return 0
+
+    cfg = load_env_config(args.env)
+    secrets = load_secrets(required=True)
+    auth, auth_label, raw = _auth_from_secrets(secrets)
+    mcp_url = cfg.mcp_base_url
+    page = max(1, int(args.page_size))
+
+    print(f"ENV={cfg.env}  SITE={cfg.site_url}")
+    print(f"FAC_MCP_ENDPOINT={mcp_url}")
+    print(f"MCP_AUTH={auth_label}  VALUE={mask_secret(raw)}")
+
+    idx = HashIndex(Path(args.index) if args.index.strip() else default_index_path(args.env))
+    try:
+        if args.full:
+            idx.clear()
+            idx.commit()
+        wm_mod, _ = idx.watermark()
+        print(f"INDEX={idx.path}  ROWS={idx.count()}  WATERMARK={wm_mod or '-'}")
+
+        _ = _mcp_call(
+            mcp_url,
+            auth,
+            {"jsonrpc": "2.0", "method": "initialize", "params": {"protocolVersion": "2025-03-26", "capabilities": {}}, "id": 1},
+        )
+
+        t0 = time.monotonic()
+        applied = _sync(idx, mcp_url, auth, page)
+        deleted = 0
+        if args.reconcile:
+            live, complete = _live_names(mcp_url, auth, page)
+            if complete:
+                deleted = idx.delete_missing(live)
+                idx.commit()
+            else:
+                print(f"WARN: Item.name 列表未能确认完整（已取 {len(live)} 条），跳过 reconcile 删除。", file=sys.stderr)
+        idx.set_meta("synced_at", str(int(time.time())))
+        idx.commit()
+
+        print("")
+        print(f"DONE. applied={applied}  deleted={deleted}  rows={idx.count()}  elapsed={time.monotonic() - t0:.1f}s")
+    finally:
+        idx.close()
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
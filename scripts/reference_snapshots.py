@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from _lib_config import ConfigError, repo_root
+from _lib_snapshot_store import SnapshotStore, store_root_for
+
+
+def _default_ref_dir(env: str) -> Path:
+    return repo_root() / "work" / env / "reference"
+
+
+def _fmt_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return str(n)
+
+
+def main(argv: list[str]) -> int:
+    ap = argparse.ArgumentParser(
+        description="reference 快照库（内容寻址去重）：保存 / 列表 / 对比 / 恢复 work/<env>/reference。",
+    )
+    ap.add_argument("--env", choices=["dev", "prod"], required=True)
+    ap.add_argument("--ref-dir", default="", help="reference 目录（默认 work/<env>/reference）")
+    ap.add_argument("--store", default="", help="快照库目录（默认与 reference 目录同级：work/<env>/snapshots/reference）")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_save = sub.add_parser("save", help="把当前 reference 目录存为一个快照（内容未变化时不新建）")
+    p_save.add_argument("--label", default="", help="快照备注")
+    p_save.add_argument("--always", action="store_true", help="即使与上一个快照相同也新建")
+
+    sub.add_parser("list", help="列出快照")
+
+    p_diff = sub.add_parser("diff", help="对比两个快照（默认 latest~1 与 latest）；只比较 manifest 中的 hash")
+    p_diff.add_argument("a", nargs="?", default="latest~1")
+    p_diff.add_argument("b", nargs="?", default="latest")
+
+    p_restore = sub.add_parser("restore", help="把某个快照恢复到目录（默认 reference 目录）")
+    p_restore.add_argument("id", help="快照 id / 唯一前缀 / latest / latest~N")
+    p_restore.add_argument("--dest", default="", help="恢复到该目录（默认 --ref-dir）")
+    p_restore.add_argument("--link", action="store_true", help="硬链接 blob（零拷贝，文件只读）；默认复制")
+
+    p_prune = sub.add_parser("prune", help="只保留最近 N 个快照，并删除无引用的 blob")
+    p_prune.add_argument("--keep", type=int, default=20)
+
+    args = ap.parse_args(argv)
+
+    ref_dir = Path(args.ref_dir) if args.ref_dir.strip() else _default_ref_dir(args.env)
+    store = SnapshotStore(Path(args.store) if args.store.strip() else store_root_for(ref_dir))
+    print(f"ENV={args.env}  STORE={store.root}")
+
+    if args.cmd == "save":
+        res = store.save(ref_dir, label=args.label, skip_unchanged=not args.always)
+        m = res["manifest"]
+        state = "UNCHANGED" if res["unchanged"] else "SAVED"
+        print(f"{state}={m['id']}  FILES={len(m['files'])}  NEW_BLOBS={res['new_blobs']}  NEW_BYTES={_fmt_bytes(res['new_bytes'])}")
+    elif args.cmd == "list":
+        items = store.list()
+        for m in items:
+            files = m.get("files") or {}
+            size = sum(int(f.get("bytes") or 0) for f in files.values())
+            print(f"{m['id']}  files={len(files)}  bytes={_fmt_bytes(size)}  {m.get('label') or ''}".rstrip())
+        st = store.stats()
+        print(f"TOTAL snapshots={st['snapshots']}  blobs={st['blobs']}  stored={_fmt_bytes(st['stored_bytes'])}  logical={_fmt_bytes(st['logical_bytes'])}")
+    elif args.cmd == "diff":
+        a, b = store.load(args.a), store.load(args.b)
+        d = store.diff(a, b)
+        print(f"DIFF {a['id']} -> {b['id']}")
+        for kind in ("added", "removed", "changed"):
+            for rel in d[kind]:
+                print(f"{kind.upper():<8} {rel}")
+        print(f"SUMMARY={json.dumps({k: len(v) for k, v in d.items()}, ensure_ascii=False)}")
+    elif args.cmd == "restore":
+        m = store.load(args.id)
+        dest = Path(args.dest) if args.dest.strip() else ref_dir
+        n = store.restore(m, dest, link=args.link)
+        print(f"RESTORED={m['id']}  FILES={n}  DEST={dest}  MODE={'link' if args.link else 'copy'}")
+    elif args.cmd == "prune":
+        print(f"PRUNE={json.dumps(store.prune(args.keep), ensure_ascii=False)}")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        raise SystemExit(main(sys.argv[1:]))
+    except ConfigError as e:
+        print(f"CONFIG_ERROR: {e}", file=sys.stderr)
+        raise SystemExit(2)
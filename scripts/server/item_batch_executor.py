@@ -0,0 +1,274 @@
+# Server-side batch executor for scripts/create_items_from_template.py.
+#
+# This file is NOT run locally. It is shipped verbatim to the server, either
+# inlined into run_python_code or executed by a whitelisted cos method that
+# holds the same source (matched by sha256, see scripts/_lib_executor.py).
+#
+# Host-provided globals: frappe, json, spec (decoded dict).
+# run_python_code forbids import statements: keep this file import-free.
+# Any edit changes the content hash, so servers holding an older copy
+# automatically fall back to the inline path until they are updated.
+
+profile = spec.get("profile")
+mode = spec.get("mode", "upsert")
+dry_run = bool(spec.get("dry_run"))
+template_doctype = spec.get("template_doctype") or "Item Parameter Template"
+template_name = spec.get("template_name")
+target_doctype = spec.get("target_doctype") or "Item"
+id_field = spec.get("id_field") or "custom_unique_item_name"
+hash_field = spec.get("hash_field") or ""
+id_format = spec.get("id_format") or ""
+uom_rules = spec.get("uom_rules") or []
+items = spec.get("items")
+if items is None and isinstance(spec.get("items_columnar"), dict):
+    # REST path (ServerExecutor) sends the compact form from _lib_spec_codec.spec_body;
+    # the inline path already decoded it via _decode_spec.
+    col = spec.get("items_columnar")
+    columns = col.get("columns") or []
+    items = []
+    for row in col.get("rows") or []:
+        params = {}
+        for k, v in zip(columns, row):
+            if v is not None:
+                params[k] = v
+        items.append({"params": params})
+items = items or []
+idx_offset = int(spec.get("idx_offset") or 0)
+
+def md5_hex(s: str) -> str:
+    # Avoid python imports (restricted by run_python_code security).
+    # Use database MD5() for deterministic hash.
+    s = "" if s is None else str(s)
+    return frappe.db.sql("select md5(%s)", (s,), pluck=True)[0]
+
+def render(s, ctx):
+    if s is None:
+        return ""
+    s = str(s)
+    if not s:
+        return ""
+    return frappe.render_template(s, ctx)
+
+def to_float(v):
+    if v in (None, ""):
+        return None
+    try:
+        return float(v)
+    except Exception:
+        return None
+
+def to_int(v):
+    if v in (None, ""):
+        return None
+    try:
+        return int(float(v))
+    except Exception:
+        return None
+
+def canonical_float(v):
+    v = to_float(v)
+    if v is None:
+        return ""
+    if float(v).is_integer():
+        return str(int(v))
+    s = ("%.6f" % float(v)).rstrip("0").rstrip(".")
+    return s
+
+tpl = frappe.get_doc(template_doctype, template_name)
+param_defs = list(tpl.get("parameters") or [])
+
+def build_context(user_params):
+    ctx = {}
+    # 1) seed with user input
+    for k, v in (user_params or {}).items():
+        ctx[str(k)] = v
+    # 2) fill / compute in idx order
+    for row in sorted(param_defs, key=lambda r: r.get("idx") or 0):
+        pname = row.get("parameter_name")
+        if not pname:
+            continue
+        pname = str(pname)
+        ctype = row.get("constraint_type") or ""
+        default_raw = row.get("parameter_default_value")
+        if pname not in ctx or ctx.get(pname) in (None, ""):
+            # default may be format using other params
+            if default_raw not in (None, ""):
+                ctx[pname] = render(default_raw, ctx)
+        # coerce types
+        if ctype == "Float":
+            # Store as canonical string to avoid "5.0" vs "5" drift in IDs / names.
+            ctx[pname] = canonical_float(ctx.get(pname))
+        elif ctype == "Integer":
+            i = to_int(ctx.get(pname))
+            ctx[pname] = i if i is not None else ctx.get(pname)
+        elif ctype == "Format":
+            # For format fields, render template using current ctx
+            ctx[pname] = render(default_raw, ctx)
+        elif ctype == "Doctype":
+            # keep as string
+            if ctx.get(pname) is not None:
+                ctx[pname] = str(ctx.get(pname))
+    return ctx
+
+def validate_ctx(ctx):
+    errs = []
+    for row in param_defs:
+        pname = row.get("parameter_name")
+        if not pname:
+            continue
+        pname = str(pname)
+        optional = int(row.get("optional") or 0)
+        if optional == 0:
+            if ctx.get(pname) in (None, ""):
+                errs.append("missing required param: " + pname)
+        ctype = row.get("constraint_type") or ""
+        if ctype == "Doctype":
+            dt = row.get("doctype_selector")
+            v = ctx.get(pname)
+            if dt and v not in (None, ""):
+                if not frappe.db.exists(str(dt), str(v)):
+                    errs.append("invalid doctype value: " + pname + "=" + str(v) + " (doctype=" + str(dt) + ")")
+    return errs
+
+def compute_id(ctx):
+    if id_format:
+        return render(id_format, ctx)
+    # fallback: join_to_hash params
+    parts = []
+    for row in param_defs:
+        if int(row.get("join_to_hash") or 0) == 1:
+            pname = row.get("parameter_name")
+            if pname:
+                parts.append(str(pname) + "=" + str(ctx.get(str(pname))))
+    return "ITEM-" + frappe.generate_hash(length=12) if not parts else "ITEM-" + md5_hex("|".join(parts))
+
+def compute_hash(ctx):
+    parts = []
+    for row in sorted(param_defs, key=lambda r: r.get("idx") or 0):
+        if int(row.get("join_to_hash") or 0) == 1:
+            pname = row.get("parameter_name")
+            if pname:
+                parts.append(str(pname) + "=" + str(ctx.get(str(pname))))
+    return md5_hex("|".join(parts)) if parts else ""
+
+def build_item_data(ctx, unique_id):
+    data = {}
+    data["item_group"] = tpl.get("item_group") or ""
+    # bind fields to Item
+    for row in param_defs:
+        if int(row.get("binding_field") or 0) != 1:
+            continue
+        target = row.get("target_field")
+        pname = row.get("parameter_name")
+        if target and pname:
+            data[str(target)] = ctx.get(str(pname))
+    # stable id (naming may override item_code)
+    data[id_field] = unique_id
+    if hash_field:
+        data[hash_field] = compute_hash(ctx)
+    return data
+
+def build_uoms(ctx):
+    out = []
+    # Apply uom_rules (allows dynamic conversion factors)
+    for r in uom_rules:
+        if not isinstance(r, dict):
+            continue
+        u = r.get("uom")
+        if not u:
+            continue
+        if "conversion_factor_expr" in r and r.get("conversion_factor_expr"):
+            cf = render(r.get("conversion_factor_expr"), ctx)
+            try:
+                cf = float(cf)
+            except Exception:
+                cf = 0.0
+        else:
+            cf = r.get("conversion_factor", 0)
+            try:
+                cf = float(cf)
+            except Exception:
+                cf = 0.0
+        out.append({"uom": str(u), "conversion_factor": cf})
+    return out
+
+counts = {}
+
+def emit(idx, status, unique_id, param_hash, name="", detail=None):
+    # One compact line per item: R|[idx, status, id, hash, name, detail]
+    counts[status] = counts.get(status, 0) + 1
+    print("R|" + json.dumps([idx, status, unique_id, param_hash, name, detail], ensure_ascii=False, default=str))
+
+for idx, it in enumerate(items, start=idx_offset + 1):
+    user_params = it.get("params") if isinstance(it, dict) else None
+    ctx = build_context(user_params)
+    errs = validate_ctx(ctx)
+    unique_id = compute_id(ctx)
+    param_hash = compute_hash(ctx) if hash_field else ""
+    if errs:
+        emit(idx, "error", unique_id, param_hash, detail=errs)
+        continue
+
+    existing_name = None
+    if hash_field and param_hash:
+        existing_name = frappe.db.get_value(target_doctype, {hash_field: param_hash}, "name")
+    if not existing_name and unique_id:
+        existing_name = frappe.db.get_value(target_doctype, {id_field: unique_id}, "name")
+    if existing_name and mode in ("create_only", "skip_existing"):
+        emit(idx, "exists", unique_id, param_hash, name=existing_name)
+        continue
+
+    data = build_item_data(ctx, unique_id)
+    uoms = build_uoms(ctx)
+    if uoms:
+        data["uoms"] = uoms
+
+    if dry_run:
+        # keep only small preview
+        emit(idx, "dry_run", unique_id, param_hash, detail=sorted(list(data.keys())))
+        continue
+
+    if existing_name and mode == "upsert":
+        doc = frappe.get_doc(target_doctype, existing_name)
+        for k, v in data.items():
+            if k == "uoms":
+                continue
+            doc.set(k, v)
+        doc.save()
+        # child table: use direct document API (stable)
+        if uoms:
+            by_uom = {row.uom: row for row in doc.uoms}
+            for r in uoms:
+                uom = r.get("uom")
+                cf = float(r.get("conversion_factor") or 0)
+                if uom in by_uom:
+                    by_uom[uom].conversion_factor = cf
+                else:
+                    doc.append("uoms", {"uom": uom, "conversion_factor": cf})
+            doc.save()
+        emit(idx, "updated", unique_id, param_hash, name=doc.name)
+        continue
+
+    doc = frappe.new_doc(target_doctype)
+    for k, v in data.items():
+        if k == "uoms":
+            continue
+        doc.set(k, v)
+    # insert first so we have parent, then append children
+    doc.insert()
+    if uoms:
+        for r in uoms:
+            doc.append("uoms", {"uom": r.get("uom"), "conversion_factor": float(r.get("conversion_factor") or 0)})
+        doc.save()
+    emit(idx, "created", unique_id, param_hash, name=doc.name)
+
+summary = {
+  "profile": profile,
+  "mode": mode,
+  "dry_run": dry_run,
+  "count": sum(counts.values()),
+  "ok": sum([counts.get(k, 0) for k in ("created","updated","exists","dry_run")]),
+  "errors": counts.get("error", 0),
+  "by_status": counts,
+}
+print("S|" + json.dumps(summary, ensure_ascii=False, default=str))